@@ -0,0 +1,76 @@
+"""
+Benchmark of the JSON decoders on an export's files.
+
+Parses every .json file of an export (or of a synthetic one) with each
+installed decoder, both from bytes already in memory and from the files
+themselves, which memory maps large files for decoders that support it.
+
+    python -m benchmarks.bench_json [--archive export.zip] [--repeat 3]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.generate import SCALES, Scale, generate_export
+from slackviewer import json_decoder
+from slackviewer.archive import open_archive
+
+
+def json_files(archive):
+    """Top level and conversation .json files of an extracted export"""
+    files = archive.list_json("")
+    for entry in sorted(os.listdir(archive.path)):
+        if os.path.isdir(os.path.join(archive.path, entry)):
+            files.extend(archive.list_json(entry))
+    return files
+
+
+def bench(name, action, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = action()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--archive", help="export zip or directory (default: a synthetic export)")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="medium", help="size of the synthetic export")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.archive:
+            archive = open_archive(args.archive)
+        else:
+            archive = open_archive(generate_export(os.path.join(tmp, "export"), Scale.named(args.scale)))
+
+        files = json_files(archive)
+        contents = []
+        for path in files:
+            with archive.open(path) as f:
+                contents.append(f.read())
+        size = sum(len(c) for c in contents)
+        print("{} files, {:.1f} MB".format(len(files), size / 2 ** 20))
+        print("{:>8} {:>14} {:>14} {:>14}".format("decoder", "bytes MB/s", "files MB/s", "messages/s"))
+
+        for name in sorted(json_decoder.DECODERS):
+            from_bytes, count = bench(name, lambda: sum(len(json_decoder.loads(c, name)) for c in contents), args.repeat)
+
+            def from_files():
+                for path in files:
+                    with archive.open(path) as f:
+                        json_decoder.load(f, name)
+
+            from_disk, _ = bench(name, from_files, args.repeat)
+            print("{:>8} {:>14.1f} {:>14.1f} {:>14.0f}".format(
+                name, size / 2 ** 20 / from_bytes, size / 2 ** 20 / from_disk, count / from_bytes
+            ))
+
+
+if __name__ == "__main__":
+    main()
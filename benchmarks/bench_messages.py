@@ -0,0 +1,170 @@
+"""
+Benchmark of Message memory use and property throughput.
+
+Builds a synthetic channel of messages shaped like a current Slack export
+(blocks, client_msg_id, team ids, user profiles, ...), measures the memory
+held by the Message objects and the time the viewer template spends on
+their properties. DictMessage, the Message as it was before it became a
+compact record, is measured alongside as the baseline.
+
+    python -m benchmarks.bench_messages [--messages 200000]
+"""
+import argparse
+import datetime
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+from slackviewer.directory import WorkspaceDirectory
+from slackviewer.formatter import SlackFormatter
+from slackviewer.message import Message
+
+
+class DictMessage(object):
+    """
+    Baseline: the Message of earlier versions, which kept the whole raw
+    message in an instance __dict__ and derived the time, user and permalink
+    on every access. Only the properties touched below are reproduced.
+    """
+
+    def __init__(self, formatter, message, channel_id, slack_name):
+        self._formatter = formatter
+        self._message = message
+        self.is_thread_msg = False
+        self.is_recent_msg = True
+        self.channel_id = channel_id
+        self.slack_name = slack_name
+        self._msg = None
+
+    user_id = Message.user_id
+    username = Message.username
+    img = Message.img
+    id = Message.id
+    subtype = Message.subtype
+
+    @property
+    def user(self):
+        return self._formatter.find_user(self._message)
+
+    @property
+    def time(self):
+        if "ts" in self._message:
+            tsepoch = float(self._message["ts"].split(".")[0])
+            return str(datetime.datetime.fromtimestamp(tsepoch)).split('.')[0]
+        else:
+            return None
+
+    @property
+    def permalink(self):
+        permalink = f"https://{self.slack_name}.slack.com/archives/{self.channel_id}/p{self._message['ts'].replace('.','')}"
+        if "thread_ts" in self._message:
+            permalink += f"?thread_ts={self._message['thread_ts']}&cid={self.channel_id}"
+        return permalink
+
+
+def synthetic_users(count=200):
+    return [
+        {
+            "id": "U{:04d}".format(i),
+            "name": "user{}".format(i),
+            "profile": {"real_name": "User {}".format(i), "image_72": "https://example.com/{}.png".format(i)},
+        }
+        for i in range(count)
+    ]
+
+
+def synthetic_day_file(messages, seed=0):
+    """Returns the JSON of a channel's messages, as read from its day files"""
+    rnd = random.Random(seed)
+    raw = []
+    for i in range(messages):
+        user = "U{:04d}".format(rnd.randrange(200))
+        ts = "{}.{:06d}".format(1500000000 + i * 7, i % 1000000)
+        text = "message {} with a <https://example.com|link>".format(i)
+        raw.append({
+            "client_msg_id": "{:08x}-0000-0000-0000-{:012x}".format(i, i),
+            "type": "message",
+            "text": text,
+            "user": user,
+            "ts": ts,
+            "team": "T0000",
+            "user_team": "T0000",
+            "source_team": "T0000",
+            "user_profile": {"avatar_hash": "abc", "image_72": "https://example.com/a.png",
+                             "first_name": "User", "real_name": "User", "display_name": "",
+                             "team": "T0000", "name": "user", "is_restricted": False},
+            "blocks": [{"type": "rich_text", "block_id": "b{}".format(i), "elements": [
+                {"type": "rich_text_section", "elements": [{"type": "text", "text": text}]}
+            ]}],
+        })
+    return json.dumps(raw)
+
+
+def build(day_file, formatter, message_class=Message):
+    return [message_class(formatter, m, "C0", "workspace") for m in json.loads(day_file)]
+
+
+def touch(messages):
+    """Accesses the message properties the way viewer.html does"""
+    for m in messages:
+        m.subtype, m.subtype
+        m.id, m.id, m.time
+        m.img, m.img
+        m.username
+        m.user, m.user
+        m.permalink
+        m.is_thread_msg, m.is_recent_msg
+
+
+def measure(day_file, formatter, message_class):
+    """
+    Builds the messages of a day file with a message class and times two
+    passes over their properties
+
+    :return: message count, held and peak memory in bytes, build and
+             property pass times in seconds
+    """
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    messages = build(day_file, formatter, message_class)
+    build_seconds = time.perf_counter() - started
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    touch(messages)
+    first_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    touch(messages)
+    repeat_seconds = time.perf_counter() - started
+    return len(messages), held, peak, build_seconds, first_seconds, repeat_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200000)
+    args = parser.parse_args()
+
+    formatter = SlackFormatter(WorkspaceDirectory(synthetic_users()))
+    day_file = synthetic_day_file(args.messages)
+
+    results = [(cls.__name__, measure(day_file, formatter, cls)) for cls in (DictMessage, Message)]
+
+    def per_message(seconds, count):
+        return "{:.3f} s ({:.2f} us/message)".format(seconds, seconds / count * 1e6)
+
+    print("messages:           {}".format(args.messages))
+    for name, (count, held, peak, build_seconds, first_seconds, repeat_seconds) in results:
+        print("{}:".format(name))
+        print("  memory held:        {:.1f} MB ({:.0f} bytes/message)".format(held / 2 ** 20, held / count))
+        print("  memory peak:        {:.1f} MB ({:.0f} bytes/message)".format(peak / 2 ** 20, peak / count))
+        print("  build:              {}".format(per_message(build_seconds, count)))
+        print("  properties (first): {}".format(per_message(first_seconds, count)))
+        print("  properties (again): {}".format(per_message(repeat_seconds, count)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark of thread assembly (Reader._build_threads).
+
+Builds a synthetic channel with a thread for every tenth message, 1M
+messages and 100k threads at full size, and times threading it at
+increasing sizes. Linear scaling shows as a constant time per message.
+
+    python -m benchmarks.bench_threads [--messages 1000000] [--legacy]
+"""
+import argparse
+import random
+import time
+
+from slackviewer.config import Config
+from slackviewer.message import Message
+from slackviewer.reader import Reader
+
+
+def synthetic_channel(messages, threads, legacy=False, seed=0):
+    """
+    Returns the raw messages of a channel in time order. Thread parents are
+    spread evenly; every other message is a reply to one of the 100 most
+    recent threads.
+
+    :param bool legacy: mark replies through the parent's "replies" array
+    instead of thread_ts
+    """
+    rnd = random.Random(seed)
+    thread_every = max(messages // max(threads, 1), 1)
+    open_threads = []
+    channel = []
+    for i in range(messages):
+        ts = "{}.{:06d}".format(1500000000 + i, i % 1000000)
+        message = {"type": "message", "user": "U{:04d}".format(rnd.randrange(200)), "ts": ts, "text": "message {}".format(i)}
+        if i % thread_every == 0:
+            message["reply_count"] = 0
+            if legacy:
+                message["replies"] = []
+            else:
+                message["thread_ts"] = ts
+            open_threads.append(message)
+            open_threads = open_threads[-100:]
+        elif open_threads and i % 2:
+            parent = rnd.choice(open_threads)
+            parent["reply_count"] += 1
+            if legacy:
+                parent["replies"].append({"user": message["user"], "ts": ts})
+            else:
+                message["thread_ts"] = parent["ts"]
+        channel.append(message)
+    return channel
+
+
+def bench(channel, repeat=3):
+    reader = Reader.__new__(Reader)
+    reader._config = Config({"thread_note": False, "skip_channel_member_change": False})
+    reader._since = None
+    reader._until = None
+
+    best = None
+    for _ in range(repeat):
+        messages = [Message(None, dict(m), "C0", "workspace") for m in channel]
+        started = time.perf_counter()
+        threaded = reader._build_threads({"general": messages})["general"]
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    assert len(threaded) == len(channel)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--legacy", action="store_true", help="thread through legacy replies arrays")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print("{:>10} {:>9} {:>10} {:>12}".format("messages", "threads", "seconds", "us/message"))
+    for fraction in (8, 4, 2, 1):
+        size = args.messages // fraction
+        channel = synthetic_channel(size, size // 10, legacy=args.legacy)
+        seconds = bench(channel, args.repeat)
+        print("{:>10} {:>9} {:>10.3f} {:>12.3f}".format(size, size // 10, seconds, seconds / size * 1e6))
+
+
+if __name__ == "__main__":
+    main()
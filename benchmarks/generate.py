@@ -0,0 +1,221 @@
+"""
+Generator of synthetic Slack exports for benchmarks.
+
+Writes an export shaped like the official one (users.json, channels.json
+and one YYYY-MM-DD.json file per conversation and day) at a configurable
+scale, either as a directory or as a zip file.
+
+    python -m benchmarks.generate OUTPUT [--channels 20] [--days 30] [--zip] ...
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import shutil
+import tempfile
+
+
+# Export sizes used by the benchmark suite, see Scale
+SCALES = {
+    "tiny": dict(users=20, channels=3, days=5, messages_per_day=20),
+    "small": dict(users=100, channels=10, days=20, messages_per_day=100),
+    "medium": dict(users=500, channels=30, days=60, messages_per_day=300),
+    "large": dict(users=2000, channels=100, days=365, messages_per_day=500),
+}
+
+_WORDS = (
+    "deploy review merge build release fix bug test cache query index page "
+    "thread channel latency memory profile benchmark export archive message"
+).split()
+
+_EMOJI = ["+1", "tada", "eyes", "heart", "joy", "rocket", "white_check_mark"]
+
+
+class Scale(object):
+    """
+    Size and content mix of a synthetic export
+
+    :param int users: number of users in users.json
+
+    :param int channels: number of public channels
+
+    :param int days: number of day files per channel
+
+    :param int messages_per_day: messages per day file, replies included
+
+    :param float thread_ratio: fraction of messages that start a thread
+
+    :param float blocks_ratio: fraction of messages with rich text blocks
+
+    :param float attachments_ratio: fraction of messages with a link attachment
+
+    :param float reactions_ratio: fraction of messages with reactions
+    """
+
+    def __init__(self, users=100, channels=10, days=20, messages_per_day=100, thread_ratio=0.1,
+                 blocks_ratio=0.5, attachments_ratio=0.1, reactions_ratio=0.2):
+        self.users = users
+        self.channels = channels
+        self.days = days
+        self.messages_per_day = messages_per_day
+        self.thread_ratio = thread_ratio
+        self.blocks_ratio = blocks_ratio
+        self.attachments_ratio = attachments_ratio
+        self.reactions_ratio = reactions_ratio
+
+    @classmethod
+    def named(cls, name, **overrides):
+        """Returns one of the predefined SCALES, with some values overridden"""
+        values = dict(SCALES[name])
+        values.update({k: v for k, v in overrides.items() if v is not None})
+        return cls(**values)
+
+    @property
+    def messages(self):
+        return self.channels * self.days * self.messages_per_day
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def _text(rnd, users):
+    words = rnd.choices(_WORDS, k=rnd.randrange(3, 25))
+    if rnd.random() < 0.2:
+        words.insert(rnd.randrange(len(words)), "<@{}>".format(rnd.choice(users)))
+    if rnd.random() < 0.1:
+        words.append("<https://example.com/{}|example>".format(rnd.randrange(1000)))
+    if rnd.random() < 0.1:
+        words.insert(0, "*{}*".format(rnd.choice(_WORDS)))
+    if rnd.random() < 0.05:
+        words.append(":{}:".format(rnd.choice(_EMOJI)))
+    return " ".join(words)
+
+
+def _message(rnd, scale, users, ts):
+    user = rnd.choice(users)
+    text = _text(rnd, users)
+    message = {
+        "client_msg_id": "{:032x}".format(rnd.getrandbits(128)),
+        "type": "message",
+        "text": text,
+        "user": user,
+        "ts": ts,
+        "team": "T0000000",
+    }
+    if rnd.random() < scale.blocks_ratio:
+        message["blocks"] = [{
+            "type": "rich_text",
+            "block_id": "{:05x}".format(rnd.getrandbits(20)),
+            "elements": [{"type": "rich_text_section", "elements": [{"type": "text", "text": text}]}],
+        }]
+    if rnd.random() < scale.attachments_ratio:
+        message["attachments"] = [{
+            "fallback": "Example page",
+            "title": "Example page {}".format(rnd.randrange(1000)),
+            "title_link": "https://example.com/",
+            "text": _text(rnd, users),
+            "service_name": "example.com",
+        }]
+    if rnd.random() < scale.reactions_ratio:
+        message["reactions"] = [
+            {"name": name, "users": rnd.sample(users, min(3, len(users))), "count": 3}
+            for name in rnd.sample(_EMOJI, rnd.randrange(1, 3))
+        ]
+    return message
+
+
+def _day_messages(rnd, scale, users, day):
+    """Messages of one day file; threads start and end within the day"""
+    start = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc) + datetime.timedelta(days=day)
+    step = 86400.0 / (scale.messages_per_day + 1)
+    messages = []
+    open_threads = []
+    for i in range(scale.messages_per_day):
+        ts = "{:.6f}".format(start.timestamp() + (i + 1) * step)
+        message = _message(rnd, scale, users, ts)
+        if open_threads and rnd.random() < scale.thread_ratio * 2:
+            parent = rnd.choice(open_threads)
+            message["thread_ts"] = parent["ts"]
+            message["parent_user_id"] = parent["user"]
+            parent["reply_count"] += 1
+            parent["replies"].append({"user": message["user"], "ts": ts})
+        elif rnd.random() < scale.thread_ratio:
+            message.update(thread_ts=ts, reply_count=0, replies=[])
+            open_threads.append(message)
+            open_threads = open_threads[-20:]
+        messages.append(message)
+    return messages
+
+
+def generate_export(output, scale, as_zip=False, seed=0):
+    """
+    Writes a synthetic export
+
+    :param str output: directory to create, or zip file path with as_zip
+
+    :param Scale scale: size and content of the export
+
+    :param bool as_zip: write a zip file instead of a directory
+
+    :param int seed: seed of the random content; the same seed and scale
+    always produce the same export
+
+    :return: path of the export
+    """
+    rnd = random.Random(seed)
+    directory = tempfile.mkdtemp() if as_zip else output
+    os.makedirs(directory, exist_ok=True)
+
+    users = ["U{:07d}".format(i) for i in range(scale.users)]
+    with open(os.path.join(directory, "users.json"), "w") as f:
+        json.dump([
+            {"id": u, "name": "user{}".format(i),
+             "profile": {"real_name": "User {}".format(i), "image_72": "https://example.com/{}.png".format(i)}}
+            for i, u in enumerate(users)
+        ], f)
+
+    channels = [{"id": "C{:07d}".format(i), "name": "channel-{}".format(i), "members": users}
+                for i in range(scale.channels)]
+    with open(os.path.join(directory, "channels.json"), "w") as f:
+        json.dump(channels, f)
+
+    for channel in channels:
+        os.makedirs(os.path.join(directory, channel["name"]))
+        for day in range(scale.days):
+            name = "{}.json".format((datetime.date(2020, 1, 1) + datetime.timedelta(days=day)).isoformat())
+            with open(os.path.join(directory, channel["name"], name), "w") as f:
+                json.dump(_day_messages(rnd, scale, users, day), f)
+
+    if not as_zip:
+        return output
+    try:
+        return shutil.make_archive(os.path.splitext(output)[0], "zip", directory)
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("output", help="directory (or .zip file with --zip) to write")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small", help="predefined size")
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--channels", type=int)
+    parser.add_argument("--days", type=int)
+    parser.add_argument("--messages-per-day", type=int)
+    parser.add_argument("--thread-ratio", type=float)
+    parser.add_argument("--blocks-ratio", type=float)
+    parser.add_argument("--attachments-ratio", type=float)
+    parser.add_argument("--reactions-ratio", type=float)
+    parser.add_argument("--zip", action="store_true", help="write a zip file")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    overrides = {k: v for k, v in vars(args).items() if k not in ("output", "scale", "zip", "seed")}
+    scale = Scale.named(args.scale, **overrides)
+    path = generate_export(args.output, scale, as_zip=args.zip, seed=args.seed)
+    print("Wrote {} messages to {}".format(scale.messages, path))
+
+
+if __name__ == "__main__":
+    main()
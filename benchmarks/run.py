@@ -0,0 +1,244 @@
+"""
+Benchmark suite of slack-export-viewer.
+
+Generates a synthetic export (see benchmarks.generate), times the main
+stages of loading and rendering it and writes the results as JSON, so runs
+of different versions can be compared.
+
+    python -m benchmarks.run [--scale small] [--repeat 3] [--output results.json] [--only NAME ...]
+"""
+import argparse
+import contextlib
+import copy
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.generate import SCALES, Scale, generate_export
+
+
+class Suite(object):
+    """
+    Benchmarks of one synthetic export. Each benchmark is a method named
+    bench_<name> returning a function to time and the number of items it
+    processes; its setup is not timed.
+    """
+
+    def __init__(self, archive, workdir):
+        """
+        :param str archive: path of the export's zip file
+
+        :param str workdir: scratch directory of the run
+        """
+        self.archive = archive
+        self.workdir = workdir
+
+    @classmethod
+    def names(cls):
+        return [name[len("bench_"):] for name in sorted(dir(cls)) if name.startswith("bench_")]
+
+    def run(self, name, repeat):
+        """
+        Times a benchmark
+
+        :return: timings in seconds of every repetition and the item count
+        """
+        timings = []
+        items = None
+        for _ in range(repeat):
+            action, items = getattr(self, "bench_" + name)()
+            with _quiet():
+                started = time.perf_counter()
+                action()
+                timings.append(time.perf_counter() - started)
+        return timings, items
+
+    ##############
+    # Benchmarks #
+    ##############
+
+    def bench_extract_archive(self):
+        from slackviewer.archive import archive_sha, extract_archive
+        from slackviewer.constants import SLACKVIEWER_TEMP_PATH
+
+        shutil.rmtree(os.path.join(SLACKVIEWER_TEMP_PATH, archive_sha(self.archive)), ignore_errors=True)
+        return lambda: extract_archive(self.archive), 1
+
+    def bench_compile_channels(self):
+        reader = self._reader()
+        return reader.compile_channels, self._message_count()
+
+    def bench_build_threads(self):
+        from slackviewer.message import Message
+
+        reader = self._reader(thread_note=False)
+        with _quiet():
+            channels = reader.compile_channels()
+        # Back to the order of the day files, as _build_threads gets them
+        chats = {
+            name: sorted(
+                (Message(m._formatter, copy.deepcopy(m._message), m.channel_id, m.slack_name) for m in messages),
+                key=lambda m: m.ts
+            )
+            for name, messages in channels.items()
+        }
+        return lambda: reader._build_threads(chats), sum(len(m) for m in chats.values())
+
+    def bench_render_text(self):
+        messages = self._compiled()
+        texts = [m._message.get("text", "") for m in messages]
+        # The uncached renderer; message_msg covers the cached path
+        formatter = messages[0]._formatter
+        return lambda: [formatter._render_text(t) for t in texts], len(texts)
+
+    def bench_message_msg(self):
+        from slackviewer.message import Message
+
+        messages = [
+            Message(m._formatter, copy.deepcopy(m._message), m.channel_id, m.slack_name)
+            for m in self._compiled()
+        ]
+        # Measures rendering, not the render_text cache
+        messages[0]._formatter._cached_render_text.cache_clear()
+        return lambda: [m.msg for m in messages], len(messages)
+
+    def bench_page_render(self):
+        from slackviewer.app import app
+        from slackviewer.config import Config
+        from slackviewer.main import configure_app
+
+        with _quiet():
+            configure_app(app, Config({"archive": self.archive, "parse_cache": False, "search": False,
+                                       "page_size": 0, "thread_note": True}))
+        client = app.test_client()
+        urls = ["/channel/{}/".format(name) for name in app.channels]
+
+        def render():
+            for url in urls:
+                assert client.get(url).status_code == 200
+
+        return render, len(urls)
+
+    def bench_cli_export(self):
+        from click.testing import CliRunner
+        from slackviewer.cli import cli
+
+        output = os.path.join(self.workdir, "export")
+        os.makedirs(output, exist_ok=True)
+
+        def export():
+            cwd = os.getcwd()
+            os.chdir(output)
+            try:
+                result = CliRunner().invoke(cli, ["export", "--no-parse-cache", self.archive])
+                assert result.exit_code == 0, result.output
+            finally:
+                os.chdir(cwd)
+
+        return export, self._message_count()
+
+    ###########
+    # Helpers #
+    ###########
+
+    def _reader(self, thread_note=True):
+        from slackviewer.config import Config
+        from slackviewer.reader import Reader
+
+        with _quiet():
+            return Reader(Config({"archive": self.archive, "parse_cache": False, "thread_note": thread_note}))
+
+    def _compiled(self):
+        if not hasattr(self, "_compiled_messages"):
+            with _quiet():
+                channels = self._reader().compile_channels()
+            self._compiled_messages = [m for messages in channels.values() for m in messages]
+        return self._compiled_messages
+
+    def _message_count(self):
+        return len(self._compiled())
+
+
+@contextlib.contextmanager
+def _quiet():
+    """Hides the progress output of slackviewer"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small", help="size of the synthetic export")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON results file (default: stdout)")
+    parser.add_argument("--only", nargs="+", choices=Suite.names(), help="benchmarks to run")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="slackviewer-bench-")
+    # Extracted archives and caches of the run stay out of the real temp
+    # directory; slackviewer reads it on import
+    tempfile.tempdir = workdir
+    try:
+        import slackviewer
+        logging.disable(logging.CRITICAL)
+
+        scale = Scale.named(args.scale)
+        archive = generate_export(os.path.join(workdir, "synthetic.zip"), scale, as_zip=True, seed=args.seed)
+        suite = Suite(archive, workdir)
+
+        results = {}
+        for name in args.only or Suite.names():
+            timings, items = suite.run(name, args.repeat)
+            best = min(timings)
+            results[name] = {
+                "seconds": best,
+                "median_seconds": statistics.median(timings),
+                "runs": timings,
+                "items": items,
+                "us_per_item": best / items * 1e6 if items else None,
+            }
+            print("{:<16} {:>9.3f} s {:>12.2f} us/item".format(name, best, results[name]["us_per_item"] or 0),
+                  file=sys.stderr)
+
+        report = {
+            "slackviewer_version": slackviewer.__version__,
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "scale": dict(scale.as_dict(), name=args.scale, messages=scale.messages),
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "results": results,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,139 +1,452 @@
+import math
 import os
+import time
+import urllib.parse
 
 import flask
 
+from slackviewer.conversations import page_bounds
+from slackviewer.http_cache import cached_page
+from slackviewer.metrics import METRICS
+from slackviewer.sidebar import Sidebar
+
+
+# Routes of the viewer, registered on every app by create_app
+_ROUTES = []
+
+# Conversation kind to the endpoint rendering it and its URL argument
+CONVERSATION_ENDPOINTS = {
+    "channel": ("channel_name", "name"),
+    "group": ("group_name", "name"),
+    "dm": ("dm_id", "id"),
+    "mpim": ("mpim_name", "name"),
+}
+
+SEARCH_PAGE_SIZE = 50
+
+# Default and maximum number of messages returned by the message API
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 500
+
+# Seconds browsers may cache thumbnails for
+THUMBNAIL_MAX_AGE = 365 * 24 * 3600
+
+
+def route(rule, **options):
+    """Like Flask.route, for the apps made by create_app"""
+    def decorator(f):
+        _ROUTES.append((rule, f, options))
+        return f
+    return decorator
+
+
+def inject_search_enabled():
+    return {"search_enabled": getattr(flask.current_app, "search_index", None) is not None}
+
+
+def start_request_timer():
+    flask.g.request_started = time.perf_counter()
+
+
+def record_request_metrics(response):
+    endpoint = flask.request.endpoint or "unknown"
+    started = flask.g.pop("request_started", None)
+    if started is not None:
+        METRICS.observe("request_seconds", time.perf_counter() - started, endpoint=endpoint)
+    METRICS.inc("requests_total", endpoint=endpoint, status=response.status_code)
+    return response
 
-app = flask.Flask(
-    __name__,
-    template_folder="templates",
-    static_folder="static"
-)
 
 def read_css_file(file_path):
     with open(file_path, 'r') as file:
         return file.read()
 
-@app.route("/channel/<name>/")
-def channel_name(name):
-    messages = app.channels[name]
-    channels = list(app.channels.keys())
-    groups = list(app.groups.keys()) if app.groups else {}
-    dm_users = list(app.dm_users)
-    mpim_users = list(app.mpim_users)
 
-    viewer_css_contents = read_css_file(os.path.join(app.static_folder, 'viewer.css')) if app.no_external_references else None
+def send_attachment(name, attachment):
+    """Sends an attachment of a conversation from the archive backend"""
+    app = flask.current_app
+    relpath = "/".join([name, "attachments", attachment])
+    local_path = app.archive.local_path(relpath)
+    if local_path is not None:
+        return flask.send_file(local_path)
+    if not app.archive.exists(relpath):
+        flask.abort(404)
+    # Streams the member out of the zip file
+    return flask.send_file(app.archive.open(relpath), download_name=attachment)
 
-    return flask.render_template("viewer.html", messages=messages,
-                                 name=name.format(name=name),
-                                 channels=sorted(channels),
-                                 groups=sorted(groups) if groups else {},
-                                 dm_users=dm_users,
-                                 mpim_users=mpim_users,
-                                 no_sidebar=app.no_sidebar,
-                                 no_external_references=app.no_external_references,
-                                 viewer_css_contents=viewer_css_contents)
 
+@route("/thumbnails/<name>/<attachment>")
+def thumbnail(name, attachment):
+    """
+    Sends a downscaled copy of an image attachment. Thumbnail URLs carry the
+    attachment's version, so they may be cached indefinitely; requests for
+    an outdated version get a response that is revalidated instead.
+    """
+    app = flask.current_app
+    if app.thumbnails is None:
+        flask.abort(404)
+    relpath = app.thumbnails.relpath(name, attachment)
+    path = app.thumbnails.get(relpath)
+    if path is None:
+        flask.abort(404)
+    if flask.request.args.get("v") != app.thumbnails.version(relpath):
+        return flask.send_file(path)
+    response = flask.send_file(path, max_age=THUMBNAIL_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
 
-@app.route("/channel/<name>/attachments/<attachment>")
-def channel_name_attachment(name, attachment):
-    return flask.send_file(os.path.join(app.slack_path, name, "attachments", attachment))
 
+def paginate(endpoint, messages, page, **url_args):
+    """
+    Returns the messages of the requested page of a conversation and the
+    pagination info for the template. Requests with a ``message`` query
+    argument are redirected to the page holding that message id.
+    """
+    app = flask.current_app
+    bounds = page_bounds(messages, app.page_size)
 
-@app.route("/group/<name>/")
-def group_name(name):
-    messages = app.groups[name]
-    channels = list(app.channels.keys())
-    groups = list(app.groups.keys())
-    dm_users = list(app.dm_users)
-    mpim_users = list(app.mpim_users)
+    def page_url(p):
+        if p == 1:
+            return flask.url_for(endpoint, **url_args)
+        return flask.url_for(endpoint, page=p, **url_args)
 
-    viewer_css_contents = read_css_file(os.path.join(app.static_folder, 'viewer.css')) if app.no_external_references else None
+    message_id = flask.request.args.get("message")
+    if message_id:
+        for p, (start, end) in enumerate(bounds, 1):
+            if any(m.id == message_id for m in messages[start:end]):
+                flask.abort(flask.redirect("{}#{}".format(page_url(p), urllib.parse.quote(message_id))))
+        flask.abort(404)
 
-    return flask.render_template("viewer.html", messages=messages,
-                                 name=name.format(name=name),
-                                 channels=sorted(channels),
-                                 groups=sorted(groups),
-                                 dm_users=dm_users,
-                                 mpim_users=mpim_users,
-                                 no_sidebar=app.no_sidebar,
-                                 no_external_references=app.no_external_references,
-                                 viewer_css_contents=viewer_css_contents)
+    if not 1 <= page <= len(bounds):
+        flask.abort(404)
 
+    start, end = bounds[page - 1]
+    # Links are built by the template so url_for can be made relative for
+    # static HTML output
+    pagination = {
+        "page": page,
+        "pages": len(bounds),
+        "endpoint": endpoint,
+        "args": url_args,
+    }
+    return messages[start:end], pagination
 
-@app.route("/group/<name>/attachments/<attachment>")
-def group_name_attachment(name, attachment):
-    return flask.send_file(os.path.join(app.slack_path, name, "attachments", attachment))
 
+def viewer_css_contents():
+    """Contents of viewer.css for inlining, read once per loaded archive"""
+    app = flask.current_app
+    if not app.no_external_references:
+        return None
+    if app.viewer_css is None:
+        app.viewer_css = read_css_file(os.path.join(app.static_folder, 'viewer.css'))
+    return app.viewer_css
 
-@app.route("/dm/<id>/")
-def dm_id(id):
-    messages = app.dms[id]
-    channels = list(app.channels.keys())
-    groups = list(app.groups.keys())
-    dm_users = list(app.dm_users)
-    mpim_users = list(app.mpim_users)
 
-    viewer_css_contents = read_css_file(os.path.join(app.static_folder, 'viewer.css')) if app.no_external_references else None
+def render_sidebar(kind, name):
+    """
+    Returns the sidebar HTML with the given conversation marked active.
+
+    The sidebar only changes with the loaded archive, so it is rendered once
+    per URL prefix and reused for every page. The relative URLs of static
+    HTML differ from page to page, so those sidebars aren't reused.
+    """
+    app = flask.current_app
+    # Templates' url_for, which the static site builder makes relative
+    url_prefix = app.jinja_env.globals["url_for"]("index")
+    sidebar = app.sidebars.get(url_prefix)
+    if sidebar is None:
+        sidebar = Sidebar(flask.render_template("sidebar.html",
+                                                marker=Sidebar.marker,
+                                                channels=sorted(app.channels.keys()),
+                                                groups=sorted(app.groups.keys()),
+                                                dm_users=app.dm_users,
+                                                mpim_users=app.mpim_users))
+        if url_prefix.startswith("/"):
+            app.sidebars[url_prefix] = sidebar
+    return sidebar.render(kind, name)
+
+
+def render_conversation(kind, name, messages, pagination, virtual=None):
+    app = flask.current_app
+    sidebar = None if app.no_sidebar else render_sidebar(kind, name)
+    name_args = {"id": name} if kind == "dm" else {"name": name}
 
     return flask.render_template("viewer.html", messages=messages,
-                                 id=id.format(id=id),
-                                 channels=sorted(channels),
-                                 groups=sorted(groups),
-                                 dm_users=dm_users,
-                                 mpim_users=mpim_users,
+                                 pagination=pagination,
+                                 virtual=virtual,
+                                 sidebar=sidebar,
                                  no_sidebar=app.no_sidebar,
                                  no_external_references=app.no_external_references,
-                                 viewer_css_contents=viewer_css_contents)
+                                 viewer_css_contents=viewer_css_contents(),
+                                 **name_args)
 
 
-@app.route("/dm/<name>/attachments/<attachment>")
-def dm_name_attachment(name, attachment):
-    return flask.send_file(os.path.join(app.slack_path, name, "attachments", attachment))
+def render_virtual_conversation(kind, name, messages, page):
+    """
+    Renders a conversation page without its messages, which the page loads
+    from the message API as the user scrolls. Requests with a ``message``
+    query argument start at that message.
+    """
+    if page != 1:
+        flask.abort(404)
+    start = 0
+    message_id = flask.request.args.get("message")
+    if message_id:
+        start = next((i for i, m in enumerate(messages) if m.id == message_id), None)
+        if start is None:
+            flask.abort(404)
+    virtual = {
+        "api": flask.url_for("api_messages", kind=kind, name=name),
+        "start": start,
+        "message": message_id,
+    }
+    return render_conversation(kind, name, [], None, virtual)
 
 
-@app.route("/mpim/<name>/")
-def mpim_name(name):
-    messages = app.mpims.get(name, list())
-    channels = list(app.channels.keys())
-    groups = list(app.groups.keys())
-    dm_users = list(app.dm_users)
-    mpim_users = list(app.mpim_users)
+def conversation(conversations, name):
+    """Messages of a conversation, aborting with 404 for unknown (or hidden) ones"""
+    try:
+        return conversations[name]
+    except KeyError:
+        flask.abort(404)
 
-    viewer_css_contents = read_css_file(os.path.join(app.static_folder, 'viewer.css')) if app.no_external_references else None
 
-    return flask.render_template("viewer.html", messages=messages,
-                                 name=name.format(name=name),
-                                 channels=sorted(channels),
-                                 groups=sorted(groups),
-                                 dm_users=dm_users,
-                                 mpim_users=mpim_users,
-                                 no_sidebar=app.no_sidebar,
-                                 no_external_references=app.no_external_references,
-                                 viewer_css_contents=viewer_css_contents)
+def conversations_of(kind):
+    """Loaded conversations of a kind, None for unknown kinds"""
+    app = flask.current_app
+    return {"channel": app.channels, "group": app.groups, "dm": app.dms, "mpim": app.mpims}.get(kind)
+
+
+@route("/channel/<name>/")
+@route("/channel/<name>/page/<int:page>/")
+@cached_page
+def channel_name(name, page=1):
+    app = flask.current_app
+    messages = conversation(app.channels, name)
+    if app.virtual_scroll:
+        return render_virtual_conversation("channel", name, messages, page)
+    messages, pagination = paginate("channel_name", messages, page, name=name)
+    return render_conversation("channel", name, messages, pagination)
+
+
+@route("/channel/<name>/attachments/<attachment>")
+def channel_name_attachment(name, attachment):
+    return send_attachment(name, attachment)
 
 
-@app.route("/mpim/<name>/attachments/<attachment>")
+@route("/group/<name>/")
+@route("/group/<name>/page/<int:page>/")
+@cached_page
+def group_name(name, page=1):
+    app = flask.current_app
+    messages = conversation(app.groups, name)
+    if app.virtual_scroll:
+        return render_virtual_conversation("group", name, messages, page)
+    messages, pagination = paginate("group_name", messages, page, name=name)
+    return render_conversation("group", name, messages, pagination)
+
+
+@route("/group/<name>/attachments/<attachment>")
+def group_name_attachment(name, attachment):
+    return send_attachment(name, attachment)
+
+
+@route("/dm/<id>/")
+@route("/dm/<id>/page/<int:page>/")
+@cached_page
+def dm_id(id, page=1):
+    app = flask.current_app
+    messages = conversation(app.dms, id)
+    if app.virtual_scroll:
+        return render_virtual_conversation("dm", id, messages, page)
+    messages, pagination = paginate("dm_id", messages, page, id=id)
+    return render_conversation("dm", id, messages, pagination)
+
+
+@route("/dm/<name>/attachments/<attachment>")
+def dm_name_attachment(name, attachment):
+    return send_attachment(name, attachment)
+
+
+@route("/mpim/<name>/")
+@route("/mpim/<name>/page/<int:page>/")
+@cached_page
+def mpim_name(name, page=1):
+    app = flask.current_app
+    if app.virtual_scroll:
+        return render_virtual_conversation("mpim", name, app.mpims.get(name, list()), page)
+    messages, pagination = paginate("mpim_name", app.mpims.get(name, list()), page, name=name)
+    return render_conversation("mpim", name, messages, pagination)
+
+
+@route("/mpim/<name>/attachments/<attachment>")
 def mpim_name_attachment(name, attachment):
-    return flask.send_file(os.path.join(app.slack_path, name, "attachments", attachment))
+    return send_attachment(name, attachment)
+
+
+@route("/api/<kind>/<name>/messages")
+@cached_page
+def api_messages(kind, name):
+    """
+    Returns a window of a conversation's messages as rendered HTML fragments,
+    for the viewer to load as the user scrolls. Messages are addressed by
+    their position in the conversation: ``after`` and ``before`` return the
+    ``limit`` messages following or preceding a position; without either,
+    the first ones are returned.
+    """
+    app = flask.current_app
+    conversations = conversations_of(kind)
+    if conversations is None:
+        flask.abort(404)
+    messages = conversation(conversations, name)
+
+    limit = flask.request.args.get("limit", API_PAGE_SIZE, type=int)
+    limit = min(max(limit, 1), API_MAX_PAGE_SIZE)
+    after = flask.request.args.get("after", type=int)
+    before = flask.request.args.get("before", type=int)
+    if after is not None:
+        start = max(after + 1, 0)
+        end = min(start + limit, len(messages))
+    elif before is not None:
+        end = min(max(before, 0), len(messages))
+        start = max(end - limit, 0)
+    else:
+        start, end = 0, min(limit, len(messages))
+
+    render_message = app.jinja_env.get_template("util.html").module.render_message
+    fragments = [
+        {"index": i, "id": m.id, "html": str(render_message(m, None, app.no_external_references))}
+        for i, m in enumerate(messages[start:end], start)
+        if m.msg or m.files
+    ]
+    return flask.jsonify({
+        "messages": fragments,
+        # Positions of the window, which may hold messages without fragments
+        "first": start if start < end else None,
+        "last": end - 1 if start < end else None,
+        "total": len(messages),
+    })
 
 
-@app.route("/")
+def conversation_label(kind, name):
+    """Human readable name of a conversation for search results"""
+    app = flask.current_app
+    if kind == "channel":
+        return "#" + name
+    if kind == "dm":
+        for dm in app.dm_users:
+            if dm["id"] == name:
+                return ", ".join(u.display_name for u in dm["users"] if u)
+    if kind == "mpim":
+        for mpim in app.mpim_users:
+            if mpim["name"] == name:
+                return ", ".join(u.display_name for u in mpim["users"])
+    return name
+
+
+@route("/search")
+def search():
+    app = flask.current_app
+    if getattr(app, "search_index", None) is None:
+        flask.abort(404)
+
+    query = flask.request.args.get("q", "").strip()
+    page = max(flask.request.args.get("page", 1, type=int), 1)
+    hits, total = app.search_index.search(query, page=page, per_page=SEARCH_PAGE_SIZE)
+    for hit in hits:
+        endpoint, arg = CONVERSATION_ENDPOINTS[hit["kind"]]
+        # Deep link, redirected to the page holding the message
+        hit["url"] = flask.url_for(endpoint, message=hit["message_id"], **{arg: hit["conversation"]})
+        hit["label"] = conversation_label(hit["kind"], hit["conversation"])
+
+    return flask.render_template("search.html",
+                                 query=query,
+                                 hits=hits,
+                                 total=total,
+                                 page=page,
+                                 pages=math.ceil(total / SEARCH_PAGE_SIZE),
+                                 pending=app.search_index.pending,
+                                 unloaded=app.search_index.unloaded,
+                                 no_external_references=app.no_external_references,
+                                 viewer_css_contents=viewer_css_contents())
+
+
+@route("/")
 def index():
-    channels = list(app.channels.keys())
-    groups = list(app.groups.keys())
+    app = flask.current_app
+    # Lazily loaded conversations may turn out empty, and are then left out
+    while app.channels:
+        name = "general" if "general" in app.channels else next(iter(app.channels))
+        if app.channels.get(name) is not None:
+            return channel_name(name)
+    while app.groups:
+        name = next(iter(app.groups))
+        if app.groups.get(name) is not None:
+            return group_name(name)
     dms = list(app.dms.keys())
     mpims = list(app.mpims.keys())
-    if channels:
-        if "general" in channels:
-            return channel_name("general")
-        else:
-            return channel_name(channels[0])
-    elif groups:
-        return group_name(groups[0])
-    elif dms:
+    if dms:
         return dm_id(dms[0])
     elif mpims:
         return mpim_name(mpims[0])
     else:
         return "No content was found in your export that we could render."
 
+
+@route("/metrics")
+def metrics():
+    """Stage timings and counters in the Prometheus text format"""
+    return flask.Response(METRICS.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+def create_app():
+    """
+    Returns a new viewer app. Its archive is loaded by
+    slackviewer.main.configure_app; several apps can serve different archives
+    in one process (see slackviewer.mounts).
+
+    :rtype: flask.Flask
+    """
+    app = flask.Flask(
+        __name__,
+        template_folder="templates",
+        static_folder="static"
+    )
+    app.context_processor(inject_search_enabled)
+    app.before_request(start_request_timer)
+    app.after_request(record_request_metrics)
+    for rule, view, options in _ROUTES:
+        app.add_url_rule(rule, view_func=view, **options)
+    return app
+
+
+def reopen_app(app):
+    """
+    Replaces the archive handle and search index connection a viewer app
+    inherited from its parent, for use in a forked worker process
+    """
+    reader = getattr(app, "reader", None)
+    if reader is not None:
+        # Reads through the parent's zip file handle would race on its
+        # file offset
+        app.archive = reader.reopen_archive()
+    search_index = getattr(app, "search_index", None)
+    if search_index is not None:
+        search_index.reopen()
+
+
+def close_app(app):
+    """
+    Releases what slackviewer.main.configure_app opened for a viewer app:
+    the search indexing thread and database, the day file worker processes
+    and the archive's file handle
+    """
+    search_index = getattr(app, "search_index", None)
+    if search_index is not None:
+        search_index.close()
+    reader = getattr(app, "reader", None)
+    if reader is not None:
+        reader.close()
+
+
+app = create_app()
@@ -1,6 +1,7 @@
 import hashlib
 import json
 import os
+import posixpath
 import zipfile
 import io
 
@@ -8,6 +9,8 @@ from os.path import basename, splitext
 
 import slackviewer
 from slackviewer.constants import SLACKVIEWER_TEMP_PATH
+from slackviewer.fingerprint import archive_fingerprint, file_sha1
+from slackviewer.metrics import METRICS
 from slackviewer.utils.six import to_unicode, to_bytes
 
 
@@ -23,20 +26,38 @@ def SHA1_file(filepath, extra=b''):
 
     :rtype: str
     """
-    h = hashlib.sha1()
-    with io.open(filepath, 'rb') as f:
-        for chunk in iter(lambda: f.read(h.block_size), b''):
-            h.update(chunk)
-    h.update(extra)
-    return h.hexdigest()
+    return file_sha1(filepath, extra)
 
 
-def extract_archive(filepath):
+def archive_sha(filepath, fingerprint="full"):
+    """
+    Returns the SHA identifying a zip archive and the slackviewer version reading it
+
+    :param str filepath: Path to the zip file
+
+    :param str fingerprint: how to fingerprint the archive, see
+    slackviewer.fingerprint.MODES
+
+    :rtype: str
+    """
+    with METRICS.timed("sha1"):
+        return archive_fingerprint(
+            filepath,
+            mode=fingerprint,
+            # Add version of slackviewer to hash as well so we can invalidate the cached copy
+            #  if there are new features added
+            extra=to_bytes(slackviewer.__version__)
+        )
+
+
+def extract_archive(filepath, fingerprint="full"):
     """
     Returns the path of the archive
 
     :param str filepath: Path to file to extract or read
 
+    :param str fingerprint: how to fingerprint zip files, see archive_sha
+
     :return: path of the archive
 
     :rtype: str
@@ -54,38 +75,259 @@ def extract_archive(filepath):
         # Misuse of TypeError? :P
         raise TypeError("{} is not a zipfile".format(filepath))
 
-    archive_sha = SHA1_file(
-        filepath=filepath,
-        # Add version of slackviewer to hash as well so we can invalidate the cached copy
-        #  if there are new features added
-        extra=to_bytes(slackviewer.__version__)
-    )
+    sha = archive_sha(filepath, fingerprint)
     # use the zip file name as full path. This allows then slack name to be
     # extracted from the path later in reader.py when creating direct slack URLs
     slack_name = splitext(basename(filepath))[0]
 
-    extracted_path = os.path.join(SLACKVIEWER_TEMP_PATH, archive_sha, slack_name)
+    extracted_path = os.path.join(SLACKVIEWER_TEMP_PATH, sha, slack_name)
 
     if os.path.exists(extracted_path):
         print("{} already exists".format(extracted_path))
     else:
         # Extract zip
-        with zipfile.ZipFile(filepath) as zip:
+        with zipfile.ZipFile(filepath) as zip, METRICS.timed("extract"):
             print("{} extracting to {}...".format(filepath, extracted_path))
             zip.extractall(path=extracted_path)
+            members = {
+                info.filename: [info.file_size, info.CRC]
+                for info in zip.infolist() if not info.is_dir()
+            }
 
         print("{} extracted to {}".format(filepath, extracted_path))
 
         # Add additional file with archive info
-        create_archive_info(filepath, extracted_path, archive_sha)
+        create_archive_info(filepath, extracted_path, sha, members)
 
     return extracted_path
 
 
+def open_archive(filepath, extract=True, fingerprint="full"):
+    """
+    Returns the backend used to read the archive's files
+
+    :param str filepath: Path to the zip file or directory of the archive
+
+    :param bool extract: Extract zip files to the temp directory instead of
+    reading their members directly
+
+    :param str fingerprint: how to fingerprint zip files, see archive_sha
+
+    :rtype: DirectoryArchive or ZipArchive
+    """
+    if os.path.isdir(filepath) or extract:
+        path = extract_archive(filepath, fingerprint)
+        archive_info = read_archive_info(path) or {}
+        return DirectoryArchive(path, archive_info.get("sha1"), archive_info.get("members"))
+
+    elif not zipfile.is_zipfile(filepath):
+        raise TypeError("{} is not a zipfile".format(filepath))
+
+    print("Reading {} without extracting it...".format(filepath))
+    return ZipArchive(filepath, archive_sha(filepath, fingerprint))
+
+
+class DirectoryArchive(object):
+    """
+    Archive backend reading from an extracted archive directory.
+
+    All paths given to the backend are relative to the archive root and use
+    forward slashes, as within a zip file.
+    """
+
+    def __init__(self, path, sha=None, members=None):
+        """
+        :param str path: Path to the archive directory
+
+        :param str sha: SHA of the zip the directory was extracted from, if any
+
+        :param dict members: relative path to [size, CRC] of the files
+        extracted from the zip, as recorded by extract_archive
+        """
+        self.path = path
+        self.sha = sha
+        self._members = members or {}
+
+    def reopen(self):
+        """Returns a backend for use in another process"""
+        return self
+
+    def close(self):
+        """Files are opened per read, there is nothing to close"""
+
+    def exists(self, relpath):
+        return os.path.isfile(self.local_path(relpath))
+
+    def size(self, relpath):
+        """Size of a file of the archive in bytes"""
+        return os.path.getsize(self.local_path(relpath))
+
+    def open(self, relpath):
+        """Opens a file of the archive in binary mode"""
+        return io.open(self.local_path(relpath), 'rb')
+
+    def list_json(self, dirname):
+        """Returns the sorted paths of all .json files directly inside dirname"""
+        try:
+            entries = os.listdir(os.path.join(self.path, dirname))
+        except (IOError, OSError):
+            return []
+        return sorted(
+            posixpath.join(dirname, e) for e in entries
+            if e.endswith(".json") and not e.startswith(".")
+        )
+
+    def json_size(self):
+        """Total size in bytes of the archive's .json files"""
+        total = 0
+        for root, _, files in os.walk(self.path):
+            for f in files:
+                if f.endswith(".json") and not f.startswith("."):
+                    total += os.path.getsize(os.path.join(root, f))
+        return total
+
+    def local_path(self, relpath):
+        """Returns the filesystem path of a file of the archive"""
+        return os.path.join(self.path, *relpath.split("/"))
+
+    def fingerprint(self, relpaths):
+        """
+        Returns a digest of the names, sizes and modification times of files,
+        which changes whenever any of the files does.
+
+        Files extracted from a zip are identified by the size and CRC recorded
+        at extraction instead, as ZipArchive.fingerprint does: every
+        extraction writes new modification times, even for unchanged files.
+        """
+        h = hashlib.sha1()
+        for relpath in relpaths:
+            if relpath in self._members:
+                size, crc = self._members[relpath]
+                h.update(to_bytes("{}\0{}\0{:08x}\n".format(relpath, size, crc)))
+                continue
+            st = os.stat(self.local_path(relpath))
+            h.update(to_bytes("{}\0{}\0{}\n".format(relpath, st.st_size, st.st_mtime_ns)))
+        return h.hexdigest()
+
+
+class ZipArchive(object):
+    """
+    Archive backend reading members straight from a zip file, without
+    extracting it first.
+    """
+
+    def __init__(self, path, sha=None):
+        """
+        :param str path: Path to the zip file
+
+        :param str sha: SHA of the zip file as returned by archive_sha
+        """
+        self.path = path
+        self.sha = sha
+        self._zip = zipfile.ZipFile(path)
+
+        # Index members by directory so day file listings don't need to scan
+        # the whole central directory
+        self._members = set()
+        self._json_by_dir = {}
+        for name in self._zip.namelist():
+            if name.endswith("/"):
+                continue
+            self._members.add(name)
+            dirname, filename = posixpath.split(name)
+            if filename.endswith(".json") and not filename.startswith("."):
+                self._json_by_dir.setdefault(dirname, []).append(name)
+        for names in self._json_by_dir.values():
+            names.sort()
+
+    def __getstate__(self):
+        # ZipFile handles can't be pickled; worker processes reopen the file
+        state = self.__dict__.copy()
+        del state["_zip"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._zip = zipfile.ZipFile(self.path)
+
+    def reopen(self):
+        """
+        Returns a backend with its own zip file handle. Forked processes share
+        the parent's file offset, so they must not read through its handle.
+        """
+        other = object.__new__(ZipArchive)
+        other.__setstate__(self.__getstate__())
+        return other
+
+    def close(self):
+        """Closes the zip file handle"""
+        self._zip.close()
+
+    def exists(self, relpath):
+        return relpath in self._members
+
+    def size(self, relpath):
+        """Uncompressed size of a member of the zip file in bytes"""
+        return self._zip.getinfo(relpath).file_size
+
+    def open(self, relpath):
+        """Opens a member of the zip file in binary mode"""
+        try:
+            return self._zip.open(relpath)
+        except KeyError:
+            raise FileNotFoundError(relpath)
+
+    def list_json(self, dirname):
+        """Returns the sorted paths of all .json files directly inside dirname"""
+        return list(self._json_by_dir.get(dirname, []))
+
+    def json_size(self):
+        """Total uncompressed size in bytes of the archive's .json files"""
+        return sum(
+            self._zip.getinfo(name).file_size
+            for names in self._json_by_dir.values() for name in names
+        )
+
+    def local_path(self, relpath):
+        """Zip members have no filesystem path"""
+        return None
+
+    def fingerprint(self, relpaths):
+        """
+        Returns a digest of the names, sizes and CRCs of members, taken from
+        the zip's central directory without reading the members themselves
+        """
+        h = hashlib.sha1()
+        for relpath in relpaths:
+            info = self._zip.getinfo(relpath)
+            h.update(to_bytes("{}\0{}\0{:08x}\n".format(relpath, info.file_size, info.CRC)))
+        return h.hexdigest()
+
+
+def read_archive_info(extracted_path):
+    """
+    Returns the archive info saved by create_archive_info
+
+    :param str extracted_path: Path to directory of archive
+
+    :return: archive info or None if the archive was not extracted by slackviewer
+
+    :rtype: dict
+    """
+    try:
+        with io.open(
+            os.path.join(extracted_path, ".slackviewer_archive_info.json"),
+            encoding="utf-8"
+        ) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
 # Saves archive info
 # When loading empty dms and there is no info file then this is called to
 # create a new archive file
-def create_archive_info(filepath, extracted_path, archive_sha=None):
+def create_archive_info(filepath, extracted_path, archive_sha=None, members=None):
     """
     Saves archive info to a json file
 
@@ -94,12 +336,16 @@ def create_archive_info(filepath, extracted_path, archive_sha=None):
     :param str extracted_path: Path to directory of archive
 
     :param str archive_sha: SHA string created when archive was extracted from zip
+
+    :param dict members: path to [size, CRC] of each file extracted from the zip
     """
 
     archive_info = {
         "sha1": archive_sha,
         "filename": os.path.split(filepath)[1],
     }
+    if members is not None:
+        archive_info["members"] = members
 
     with io.open(
         os.path.join(
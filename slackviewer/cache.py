@@ -0,0 +1,121 @@
+import hashlib
+import io
+import json
+import logging
+import os
+
+import slackviewer
+from slackviewer import json_decoder
+from slackviewer.constants import SLACKVIEWER_TEMP_PATH
+from slackviewer.utils.six import to_bytes
+
+
+def options_key(config, users_fingerprint=None):
+    """
+    Returns a digest of the slackviewer version and the config options that
+    change which messages are compiled and how, for keying cached data
+
+    :param Config config: Config to take the options from
+
+    :param str users_fingerprint: fingerprint of the archive's users file,
+        which --filter-user matches messages against
+
+    :rtype: str
+    """
+    options = {
+        "format": ParsedArchiveCache.FORMAT,
+        "version": slackviewer.__version__,
+        "since": config.since.isoformat() if config.since else None,
+        "until": config.until.isoformat() if config.until else None,
+        "skip_channel_member_change": bool(config.skip_channel_member_change),
+        "thread_note": bool(config.thread_note),
+        "filter_user": config.filter_user,
+        "users": users_fingerprint if config.filter_user else None,
+        "hide_channels": sorted(config.hide_channels),
+    }
+    return hashlib.sha1(to_bytes(json.dumps(options, sort_keys=True))).hexdigest()
+
+
+class ParsedArchiveCache(object):
+    """
+    On-disk cache of compiled conversations.
+
+    Each conversation is stored as the list of its threaded and filtered raw
+    message dicts (plus the per-message flags set while threading), so a warm
+    start can rebuild its Message objects without touching the day files.
+
+    Entries are keyed by conversation rather than by archive and hold the
+    fingerprint of the day files they were compiled from. A newer export of
+    the same workspace therefore reuses every conversation whose day files are
+    unchanged and only recompiles the ones that changed or were added.
+
+    Entries are stored as JSON rather than pickled: the cache lives in the
+    shared temp directory, where another user could plant files.
+    """
+
+    # Bump when the stored records or the way they are compiled change
+    FORMAT = 4
+
+    def __init__(self, cache_dir):
+        self._cache_dir = cache_dir
+
+    @classmethod
+    def for_config(cls, config, users_fingerprint=None):
+        """
+        Returns the cache for a set of output affecting options
+
+        :param Config config: Config whose output affecting options key the cache
+
+        :param str users_fingerprint: fingerprint of the archive's users file
+        """
+        return cls(os.path.join(SLACKVIEWER_TEMP_PATH, "parsed", options_key(config, users_fingerprint)))
+
+    def load(self, key, fingerprint):
+        """
+        Returns the cached records of a conversation or None if it is not cached
+        or was compiled from different day files
+
+        :param str key: key of the conversation, see Reader._cache_key
+
+        :param str fingerprint: fingerprint of the conversation's day files
+
+        :rtype: [(dict, bool, bool)]
+        """
+        try:
+            with io.open(self._path(key), 'rb') as f:
+                entry = json_decoder.load(f)
+            stored_fingerprint, records = entry["fingerprint"], entry["records"]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            logging.warning("Ignoring unreadable cache entry for %s: %s", key, e)
+            return None
+        if stored_fingerprint != fingerprint:
+            return None
+        return records
+
+    def store(self, key, fingerprint, records):
+        """
+        Stores the records of a conversation, replacing any entry compiled from
+        other day files. Written to a temporary file first so a concurrent
+        reader never sees a partial entry.
+
+        :param str key: key of the conversation, see Reader._cache_key
+
+        :param str fingerprint: fingerprint of the conversation's day files
+
+        :param [(dict, bool, bool)] records: message dict, is_thread_msg, is_recent_msg
+        """
+        path = self._path(key)
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            os.makedirs(self._cache_dir, exist_ok=True)
+            with io.open(tmp_path, 'wb') as f:
+                f.write(json_decoder.dumps({"fingerprint": fingerprint, "records": records}))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning("Could not cache conversation %s: %s", key, e)
+
+    def _path(self, key):
+        # Keys are hashed so any conversation name maps to a safe file name
+        return os.path.join(self._cache_dir, hashlib.sha1(to_bytes(key)).hexdigest() + ".json")
@@ -8,6 +8,8 @@ from datetime import datetime
 from jinja2 import Environment, PackageLoader
 from slackviewer.config import Config
 from slackviewer.constants import SLACKVIEWER_TEMP_PATH
+from slackviewer.conversations import ConversationStream
+from slackviewer.metrics import METRICS
 from slackviewer.reader import Reader
 
 
@@ -49,6 +51,10 @@ def clean(wet):
     Only show messages since the given date
     Environment var: SEV_SINCE (default: None)
     """)
+@click.option("--until", default=None, type=click.DateTime(formats=["%Y-%m-%d"]), envvar='SEV_UNTIL', help="""\b
+    Only show messages up to and including the given date
+    Environment var: SEV_UNTIL (default: None)
+    """)
 @click.option('--skip-channel-member-change', is_flag=True, default=False, envvar='SEV_SKIP_CHANNEL_MEMBER_CHANGE', help="""\b
     Hide channel join/leave messages
     Environment var: SEV_SKIP_CHANNEL_MEMBER_CHANGE (default: false)
@@ -67,6 +73,26 @@ def clean(wet):
     Available attributes: id, name, real_name, email, display_name
     Environment var: SEV_FILTER_USER (default: None)
     """)
+@click.option('--extract/--no-extract', default=True, envvar='SEV_EXTRACT', help="""\b
+    Extract zip archives to the temp directory. With --no-extract, files are read straight from the zip.
+    Environment var: SEV_EXTRACT (default: true)
+    """)
+@click.option('--fingerprint', default="full", type=click.Choice(["full", "fast"]), envvar='SEV_FINGERPRINT', help="""\b
+    How zip archives are identified. full hashes the whole file, fast only its file list, size and modification time.
+    Environment var: SEV_FINGERPRINT (default: full)
+    """)
+@click.option("--workers", default=1, type=click.IntRange(min=1), envvar='SEV_WORKERS', help="""\b
+    Number of processes used to parse the archive's day files.
+    Environment var: SEV_WORKERS (default: 1)
+    """)
+@click.option('--parse-cache/--no-parse-cache', default=True, envvar='SEV_PARSE_CACHE', help="""\b
+    Cache parsed conversations, reusing them while their day files are unchanged.
+    Environment var: SEV_PARSE_CACHE (default: true)
+    """)
+@click.option("--json-decoder", default="auto", type=click.Choice(["auto", "orjson", "json"]), envvar='SEV_JSON_DECODER', help="""\b
+    JSON decoder for the archive's files. auto uses orjson if it is installed and the standard library otherwise.
+    Environment var: SEV_JSON_DECODER (default: auto)
+    """)
 @click.argument('archive')
 def export(**kwargs):
     config = Config(kwargs)
@@ -76,10 +102,16 @@ def export(**kwargs):
     tmpl = Environment(loader=PackageLoader('slackviewer')).get_template("export_single.html")
     if config.template:
         tmpl = Environment(loader=PackageLoader('slackviewer')).from_string(config.template.read())
+    # Conversations are compiled one at a time while the template streams to
+    # the output file, so only one conversation's messages are in memory
+    config.max_loaded = 1
     r = Reader(config)
-    channel_list = sorted(
-        [{"channel_name": k, "messages": v} for (k, v) in r.compile_channels().items()],
-        key=lambda d: d["channel_name"]
+    channels = r.compile_channels(lazy=True)
+    channel_list = ConversationStream(
+        channels,
+        lambda k, v: {"channel_name": k, "messages": v},
+        names=sorted(channels),
+        skip_empty=bool(config.since or config.until),
     )
 
     dm_list = []
@@ -87,18 +119,20 @@ def export(**kwargs):
     if config.show_dms:
         #
         # Direct DMs
-        dm_list = r.compile_dm_messages()
+        dms = r.compile_dm_messages(lazy=True)
         dm_users = r.compile_dm_users()
 
         # make list better lookupable. Also hide own user in 1:1 DMs
         dm_users = {dm['id']: dm['users'][0].display_name for dm in dm_users}
 
         # replace id with slack username
-        dm_list = [{'name': dm_users[k], 'messages': v} for k, v in dm_list.items()]
+        dm_list = ConversationStream(
+            dms, lambda k, v: {'name': dm_users[k], 'messages': v}, skip_empty=bool(config.since or config.until)
+        )
 
         #
         # Group DMs
-        mpims = r.compile_mpim_messages()
+        mpim_messages = r.compile_mpim_messages(lazy=True)
         mpim_users = r.compile_mpim_users()
 
         # make list better lookupable
@@ -109,11 +143,13 @@ def export(**kwargs):
         mpim_users = {k: ', '.join(v) for k, v in mpim_users.items()}
 
         # replace id with group member list
-        mpims = [{'name': mpim_users[k], 'messages': v} for k, v in mpims.items()]
+        mpims = ConversationStream(
+            mpim_messages, lambda k, v: {'name': mpim_users[k], 'messages': v}, skip_empty=bool(config.since or config.until)
+        )
 
     r.warn_not_found_to_hide_channels()
 
-    html = tmpl.render(
+    html = tmpl.generate(
         css=css,
         generated_on=datetime.now(),
         workspace_name=r.slack_name(),
@@ -123,7 +159,12 @@ def export(**kwargs):
         mpims=mpims,
     )
     filename = f"{r.slack_name()}.html"
-    with open(filename, 'wb') as outfile:
-        outfile.write(html.encode('utf-8'))
+    # Conversations are compiled while the template renders
+    with METRICS.timed("render"), open(filename, 'wb') as outfile:
+        for chunk in html:
+            outfile.write(chunk.encode('utf-8'))
+    r.close()
 
     print(f"Exported to {filename}")
+    if config.debug:
+        print(METRICS.summary())
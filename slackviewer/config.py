@@ -17,6 +17,8 @@ class Config(object):
         # Args used by both webserver and cli
         self.archive = config.get("archive")
         self.debug = config.get("debug")
+        self.extract = config.get("extract")
+        self.fingerprint = config.get("fingerprint")
 
         self.hide_channels = []
         if 'hide_channels' in config and config.get("hide_channels"):
@@ -24,9 +26,13 @@ class Config(object):
 
         self.show_dms = config.get("show_dms")
         self.since = config.get("since")
+        self.until = config.get("until")
         self.skip_channel_member_change = config.get("skip_channel_member_change")
         self.thread_note = config.get("thread_note")
         self.filter_user = config.get("filter_user")
+        self.parse_cache = config.get("parse_cache")
+        self.json_decoder = config.get("json_decoder")
+        self.workers = config.get("workers")
 
         # CLI only
         self.template = config.get("template")
@@ -37,12 +43,23 @@ class Config(object):
         self.debug = config.get("debug")
         self.html_only = config.get("html_only")
         self.ip = config.get("ip")
+        self.lazy = config.get("lazy")
+        self.max_loaded = config.get("max_loaded")
+        self.memory_budget = config.get("memory_budget")
+        self.mount = config.get("mount")
         self.no_browser = config.get("no_browser")
         self.no_external_references = config.get("no_external_references")
         self.no_sidebar = config.get("no_sidebar")
         self.output_dir = config.get("output_dir")
+        self.page_size = config.get("page_size")
         self.port = config.get("port")
+        self.processes = config.get("processes")
+        self.search = config.get("search")
+        self.serve = config.get("serve")
         self.test = config.get("test")
+        self.threads = config.get("threads")
+        self.thumbnails = config.get("thumbnails")
+        self.virtual_scroll = config.get("virtual_scroll")
 
         self.sanity_check()
 
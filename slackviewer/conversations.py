@@ -0,0 +1,170 @@
+import threading
+
+from collections import OrderedDict, defaultdict
+from collections.abc import Mapping
+
+
+class ConversationMap(Mapping):
+    """
+    Read-only mapping of conversation name to its list of messages.
+
+    Only the conversation names are known up front. A conversation's messages
+    are compiled by ``loader`` the first time they are requested, and only the
+    ``max_loaded`` most recently used conversations are kept in memory.
+    """
+
+    def __init__(self, names, loader, max_loaded=None):
+        """
+        :param [str] names: names (or ids) of all conversations, in display order
+
+        :param loader: callable taking a name and returning its list of messages
+
+        :param int max_loaded: maximum number of compiled conversations to keep
+        resident. ``None`` or ``0`` keeps every conversation once loaded.
+        """
+        self._names = list(names)
+        self._name_set = set(self._names)
+        self._loader = loader
+        self._max_loaded = max_loaded
+        self._loaded = OrderedDict()
+        # Guards the mapping's state; never held while a conversation loads
+        self._lock = threading.Lock()
+        # Name to the lock held while the conversation loads, so concurrent
+        # requests for it load it once without blocking other conversations
+        self._loading = defaultdict(threading.Lock)
+        # Conversations found empty on their first load, see hide_empty
+        self._hidden = set()
+        self._hide_empty = False
+        self._on_hidden = None
+        self._on_load = None
+
+    def __getitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+
+        with self._lock:
+            if name in self._loaded:
+                self._loaded.move_to_end(name)
+                return self._loaded[name]
+            loading = self._loading[name]
+
+        with loading:
+            with self._lock:
+                if name in self._loaded:
+                    self._loaded.move_to_end(name)
+                    return self._loaded[name]
+                if name in self._hidden:
+                    raise KeyError(name)
+
+            messages = self._loader(name)
+            if self._on_load is not None:
+                self._on_load(name, messages)
+            if not messages and self._hide_empty:
+                with self._lock:
+                    self._hidden.add(name)
+                if self._on_hidden is not None:
+                    self._on_hidden(name)
+                raise KeyError(name)
+            with self._lock:
+                self._loaded[name] = messages
+                if self._max_loaded:
+                    while len(self._loaded) > self._max_loaded:
+                        self._loaded.popitem(last=False)
+            return messages
+
+    def __contains__(self, name):
+        # Overridden so membership tests don't compile the conversation
+        return name in self._name_set and name not in self._hidden
+
+    def __iter__(self):
+        return iter([name for name in self._names if name not in self._hidden])
+
+    def __len__(self):
+        return len(self._names) - len(self._hidden)
+
+    def __repr__(self):
+        return f"<ConversationMap({len(self._names)} conversations, {len(self._loaded)} loaded)>"
+
+    def is_loaded(self, name):
+        """Returns True if the conversation's messages are currently in memory"""
+        return name in self._loaded
+
+    def hide_empty(self, on_hidden=None):
+        """
+        Leaves out conversations whose first load comes back without
+        messages, such as those emptied by --filter-user or --since/--until,
+        which can't be told apart without compiling them. From then on they
+        are missing from the mapping.
+
+        :param on_hidden: callable taking the name of each conversation hidden
+        """
+        self._hide_empty = True
+        self._on_hidden = on_hidden
+
+    def on_load(self, callback):
+        """
+        Calls ``callback`` with the name and messages of each conversation
+        compiled, e.g. to index conversations as they are loaded
+
+        :param callback: callable taking a name and its list of messages
+        """
+        self._on_load = callback
+
+
+class ConversationStream(object):
+    """
+    Iterable of template entries for conversations, compiling each conversation
+    only when iteration reaches it. Combined with a ConversationMap holding a
+    single conversation, only one conversation's messages are in memory while
+    a template renders.
+    """
+
+    def __init__(self, conversations, make_entry, names=None, skip_empty=False):
+        """
+        :param Mapping conversations: mapping of conversation name to its messages
+
+        :param make_entry: callable taking a name and its messages and returning
+        the template entry for the conversation
+
+        :param [str] names: names to iterate, in order. Defaults to all conversations.
+
+        :param bool skip_empty: leave out conversations without messages
+        """
+        self._conversations = conversations
+        self._make_entry = make_entry
+        self._names = names
+        self._skip_empty = skip_empty
+
+    def __iter__(self):
+        names = self._names if self._names is not None else self._conversations
+        for name in names:
+            # Conversations hidden once found empty are missing
+            messages = self._conversations.get(name) or []
+            if messages or not self._skip_empty:
+                yield self._make_entry(name, messages)
+
+
+def page_bounds(messages, page_size):
+    """
+    Splits a conversation into pages of about ``page_size`` messages. Pages only
+    start at top level messages so threads are never split across pages.
+
+    :param [Message] messages: threaded messages of the conversation
+
+    :param int page_size: number of messages per page, ``None`` or ``0`` for a single page
+
+    :return: (start, end) slice bounds of each page
+
+    :rtype: [(int, int)]
+    """
+    if not page_size or len(messages) <= page_size:
+        return [(0, len(messages))]
+
+    bounds = []
+    start = 0
+    for i, message in enumerate(messages):
+        if i - start >= page_size and not message.is_thread_msg:
+            bounds.append((start, i))
+            start = i
+    bounds.append((start, len(messages)))
+    return bounds
@@ -0,0 +1,108 @@
+import logging
+
+from slackviewer.user import User, deleted_user
+
+
+class WorkspaceDirectory(object):
+    """
+    Users and conversations of a workspace, indexed once when the archive is
+    loaded and shared by every formatter and message of the archive.
+
+    Users (with their display names, e-mails and avatars computed up front)
+    and the conversation id to name map do not change after loading. Bots
+    without an entry in users.json are identified by the first message of
+    theirs that is loaded, see add_bot; rendering never changes the
+    directory.
+    """
+
+    def __init__(self, users, conversations=(), members=()):
+        """
+        :param [dict] users: entries of users.json
+
+        :param [dict] conversations: entries of channels.json, groups.json,
+        dms.json and mpims.json
+
+        :param [str] members: ids of conversation members, who get a
+        placeholder user if they are not in users
+        """
+        self._users = {u["id"]: User(u) for u in users}
+        for user_id in members:
+            if user_id not in self._users:
+                self._users[user_id] = deleted_user(user_id)
+        # Direct messages have no name and are shown by their id
+        self._conversation_names = {c["id"]: c.get("name", c["id"]) for c in conversations}
+        self._bots = {}
+
+    ##################
+    # Public Methods #
+    ##################
+
+    def user(self, user_id):
+        """User or bot by id, None if unknown"""
+        user = self._users.get(user_id)
+        if user is None:
+            user = self._bots.get(user_id)
+        return user
+
+    def find_user(self, message):
+        """
+        User or bot who posted a message, None if unknown
+
+        :param dict message: raw message
+        """
+        user_id = message.get("user") or message.get("bot_id")
+        user = self.user(user_id)
+        if user is None and self._is_unknown_bot(message):
+            # Messages built outside of a reader, e.g. in tests, may not
+            # have been passed to add_bot
+            user = self._bot_user(message)
+            if user_id != message["bot_id"]:
+                user = None
+        if user is None:
+            logging.error("unable to find user in %s", message)
+        return user
+
+    def add_bot(self, message):
+        """
+        Records the identity of the bot that posted a message, if it is not a
+        known user. The first loaded message of a bot names it.
+
+        :param dict message: raw message
+        """
+        if self._is_unknown_bot(message) and message["bot_id"] not in self._bots:
+            logging.debug("bot addition for %s", message["bot_id"])
+            self._bots.setdefault(message["bot_id"], self._bot_user(message))
+
+    def conversation_name(self, conversation_id):
+        """Name of a channel, group or mpim (or the id of a dm), None if unknown"""
+        return self._conversation_names.get(conversation_id)
+
+    ###################
+    # Private Methods #
+    ###################
+
+    def _is_unknown_bot(self, message):
+        return (
+            message.get("subtype", "").startswith("bot_")
+            and "bot_id" in message
+            and message["bot_id"] not in self._users
+        )
+
+    @staticmethod
+    def _bot_user(message):
+        if "bot_link" in message:
+            (bot_url, bot_name) = message["bot_link"].strip("<>").split("|", 1)
+        elif "username" in message:
+            bot_name = message["username"]
+            bot_url = None
+        else:
+            bot_name = None
+            bot_url = None
+
+        return User({
+            "user": message["bot_id"],
+            "real_name": bot_name,
+            "bot_url": bot_url,
+            "is_bot": True,
+            "is_app_user": True
+        })
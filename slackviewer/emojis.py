@@ -0,0 +1,96 @@
+import functools
+import html
+import re
+
+import emoji
+
+
+# Slack names of emoji that the emoji package knows under another name
+# https://github.com/Ranks/emojione/issues/114
+SLACK_ALIASES = {"simple_smile": "slightly_smiling_face"}
+
+
+@functools.lru_cache(maxsize=None)
+def standard_emoji():
+    """
+    Shortcode (without colons) to unicode table of every fully qualified
+    emoji, by English name and alias. Aliases take precedence, as with
+    emoji.emojize(..., language='alias').
+
+    :rtype: dict
+    """
+    load_language = getattr(getattr(emoji, "config", None), "load_language", None)
+    if load_language is not None:
+        # Releases that load names other than English on demand; older ones
+        # always include the aliases in EMOJI_DATA
+        load_language("alias")
+    fully_qualified = emoji.STATUS["fully_qualified"]
+    names = {}
+    aliases = {}
+    for emj, data in emoji.EMOJI_DATA.items():
+        if data["status"] > fully_qualified:
+            continue
+        names.setdefault(data["en"][1:-1], emj)
+        for alias in data.get("alias", ()):
+            aliases.setdefault(alias[1:-1], emj)
+    names.update(aliases)
+    for slack_name, name in SLACK_ALIASES.items():
+        names.setdefault(slack_name, names[name])
+    return names
+
+
+class EmojiTable(object):
+    """
+    Translates Slack emoji shortcodes such as :tada: or :woman-shrugging: to
+    unicode, and the workspace's custom emoji to images.
+
+    The table is built once per archive; rendering a message is a single
+    regular expression pass, skipped for text without a colon.
+    """
+
+    # A shortcode between colons. Unknown shortcodes are left as they are.
+    _SHORTCODE_PAT = re.compile(r":([^\s:<>/]+):")
+
+    def __init__(self, custom=None):
+        """
+        :param dict custom: custom emoji of the workspace, name to image URL
+        or "alias:<name>" of another emoji, as listed by Slack's emoji.list
+        """
+        self._unicode = standard_emoji()
+        custom = {name: value for name, value in (custom or {}).items() if isinstance(value, str)}
+        self._custom = {
+            name: '<img class="emoji" src="{url}" alt=":{name}:" title=":{name}:">'.format(
+                url=html.escape(value), name=html.escape(name)
+            )
+            for name, value in custom.items() if not value.startswith("alias:")
+        }
+        for name, value in custom.items():
+            if value.startswith("alias:"):
+                target = value[len("alias:"):]
+                found = self._custom.get(target) or self._unicode.get(target)
+                if found is not None:
+                    self._custom[name] = found
+
+    def lookup(self, name):
+        """
+        Unicode of an emoji or the image HTML of a custom emoji, None if the
+        name is unknown
+
+        :param str name: shortcode without colons
+        """
+        found = self._custom.get(name) or self._unicode.get(name)
+        if found is None and "-" in name[1:]:
+            # Slack separates words with -'s, e.g. :woman-shrugging:, except
+            # for the first character as in :-1:
+            name = name[0] + name[1:].replace("-", "_")
+            found = self._custom.get(name) or self._unicode.get(name)
+        return found
+
+    def emojize(self, text):
+        """Replaces the known shortcodes of a text"""
+        if ":" not in text:
+            return text
+        return self._SHORTCODE_PAT.sub(self._sub_shortcode, text)
+
+    def _sub_shortcode(self, matchobj):
+        return self.lookup(matchobj.group(1)) or matchobj.group(0)
@@ -0,0 +1,127 @@
+import hashlib
+import io
+import json
+import os
+import zipfile
+
+from slackviewer.constants import SLACKVIEWER_TEMP_PATH
+from slackviewer.utils.six import to_bytes
+
+
+# Ways of fingerprinting a zip archive:
+#  full: SHA1 of the whole file
+#  fast: SHA1 of the central directory (member names, sizes and CRCs) and of
+#        the file's size and modification time; reads a few KB, but a copy
+#        or touch of the archive gets a new fingerprint
+MODES = ("full", "fast")
+
+# Bytes hashed per read
+BUFFER_SIZE = 1024 * 1024
+
+# Remembered fingerprints of archives, see archive_fingerprint
+STAMP_DIR = os.path.join(SLACKVIEWER_TEMP_PATH, "stamps")
+
+
+def file_sha1(filepath, extra=b''):
+    """
+    Returns hex digest of SHA1 hash of file at filepath
+
+    :param str filepath: File to hash
+
+    :param bytes extra: Extra content added to raw read of file before taking hash
+
+    :rtype: str
+    """
+    h = hashlib.sha1()
+    buf = bytearray(BUFFER_SIZE)
+    view = memoryview(buf)
+    with io.open(filepath, 'rb', buffering=0) as f:
+        for size in iter(lambda: f.readinto(buf), 0):
+            h.update(view[:size])
+    h.update(extra)
+    return h.hexdigest()
+
+
+def zip_directory_sha1(filepath, extra=b''):
+    """
+    Returns hex digest of SHA1 hash of a zip file's central directory, size
+    and modification time
+
+    :param str filepath: Zip file to hash
+
+    :param bytes extra: Extra content added before taking hash
+
+    :rtype: str
+    """
+    h = hashlib.sha1(b"fast\n")
+    st = os.stat(filepath)
+    h.update(to_bytes("{}\0{}\n".format(st.st_size, st.st_mtime_ns)))
+    with zipfile.ZipFile(filepath) as zf:
+        for info in zf.infolist():
+            h.update(to_bytes("{}\0{}\0{:08x}\n".format(info.filename, info.file_size, info.CRC)))
+    h.update(extra)
+    return h.hexdigest()
+
+
+def archive_fingerprint(filepath, mode="full", extra=b''):
+    """
+    Returns the fingerprint of a zip archive. Fingerprints are remembered in
+    a stamp file under STAMP_DIR, and reused as long as the archive's path,
+    size, modification time and inode are unchanged.
+
+    :param str filepath: Path to the zip file
+
+    :param str mode: one of MODES
+
+    :param bytes extra: Extra content added before taking hash
+
+    :return: hex digest of SHA1 hash
+
+    :rtype: str
+    """
+    if mode not in MODES:
+        raise ValueError("Unknown fingerprint mode '{}', expected one of: {}".format(mode, ", ".join(MODES)))
+
+    st = os.stat(filepath)
+    identity = {
+        "path": os.path.abspath(filepath),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "inode": st.st_ino,
+        "mode": mode,
+        "extra": extra.hex(),
+    }
+    stamp_path = os.path.join(
+        STAMP_DIR, hashlib.sha1(to_bytes("{path}\0{mode}".format(**identity))).hexdigest() + ".json"
+    )
+
+    stamp = _read_stamp(stamp_path)
+    if stamp and stamp.get("identity") == identity:
+        return stamp["sha1"]
+
+    if mode == "fast":
+        sha = zip_directory_sha1(filepath, extra)
+    else:
+        sha = file_sha1(filepath, extra)
+    _write_stamp(stamp_path, {"identity": identity, "sha1": sha})
+    return sha
+
+
+def _read_stamp(stamp_path):
+    try:
+        with io.open(stamp_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def _write_stamp(stamp_path, stamp):
+    # Stamps only save time; a temp directory that can't be written to is fine
+    tmp_path = "{}.{}.tmp".format(stamp_path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(stamp_path), exist_ok=True)
+        with io.open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(stamp, f)
+        os.replace(tmp_path, stamp_path)
+    except OSError:
+        pass
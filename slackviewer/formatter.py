@@ -1,11 +1,10 @@
-import logging
+import functools
 import re
 import sys
 
-import emoji
 import markdown2
 
-from slackviewer.user import User
+from slackviewer.emojis import EmojiTable
 
 # Workaround for ASCII encoding error in Python 2.7
 # See https://github.com/hfaran/slack-export-viewer/issues/81
@@ -22,36 +21,45 @@ class SlackFormatter(object):
     _MENTION_PAT = re.compile(r"<((?:#C|@[UB])\w+)(?:\|([A-Za-z0-9.-_]*))?>")
     _HASHTAG_PAT = re.compile(r"(^| )#[A-Za-z][\w\.\-\_]+( |$)")
 
-    def __init__(self, USER_DATA, CHANNEL_DATA):
-        self.__USER_DATA = USER_DATA
-        self.__CHANNEL_DATA = CHANNEL_DATA
+    # Maximum number of rendered texts remembered by render_text
+    RENDER_CACHE_SIZE = 20000
+
+    def __init__(self, directory, emojis=None, thumbnails=None):
+        """
+        :param WorkspaceDirectory directory: users and conversations of the workspace
+
+        :param EmojiTable emojis: emoji of the workspace, the standard ones by default
+
+        :param Thumbnailer thumbnails: thumbnails of the archive's attachments, if served
+        """
+        self._directory = directory
+        self._emojis = emojis or EmojiTable()
+        self.thumbnails = thumbnails
+        # Content keyed LRU cache of render_text; identical texts (bot
+        # messages, attachment footers, repeated page views) render once
+        self._cached_render_text = functools.lru_cache(maxsize=self.RENDER_CACHE_SIZE)(self._render_text)
 
     def find_user(self, message):
-        if message.get("subtype", "").startswith("bot_") and "bot_id" in message and message["bot_id"] not in self.__USER_DATA:
-            bot_id = message["bot_id"]
-            logging.debug("bot addition for %s", bot_id)
-            if "bot_link" in message:
-                (bot_url, bot_name) = message["bot_link"].strip("<>").split("|", 1)
-            elif "username" in message:
-                bot_name = message["username"]
-                bot_url = None
-            else:
-                bot_name = None
-                bot_url = None
-
-            self.__USER_DATA[bot_id] = User({
-                "user": bot_id,
-                "real_name": bot_name,
-                "bot_url": bot_url,
-                "is_bot": True,
-                "is_app_user": True
-            })
-        user_id = message.get("user") or message.get("bot_id")
-        if user_id in self.__USER_DATA:
-            return self.__USER_DATA.get(user_id)
-        logging.error("unable to find user in %s", message)
+        return self._directory.find_user(message)
+
+    def find_user_by_id(self, user_id):
+        return self._directory.user(user_id)
+
+    def find_channel(self, channel_id):
+        return self._directory.conversation_name(channel_id)
+
+    def emoji(self, name):
+        """Unicode or custom image HTML of an emoji by name, None if unknown"""
+        return self._emojis.lookup(name)
 
     def render_text(self, message, process_markdown=True):
+        return self._cached_render_text(message, process_markdown)
+
+    def render_cache_info(self):
+        """Returns the hits, misses, maxsize and currsize of the render_text cache"""
+        return self._cached_render_text.cache_info()
+
+    def _render_text(self, message, process_markdown=True):
         message = message.replace("<!channel>", "@channel")
         message = message.replace("<!channel|@channel>", "@channel")
         message = message.replace("<!here>", "@here")
@@ -67,8 +75,7 @@ class SlackFormatter(object):
         message = self._HASHTAG_PAT.sub(self._sub_hashtag, message)
 
         # Introduce unicode emoji
-        message = self.slack_to_accepted_emoji(message)
-        message = emoji.emojize(message, language='alias')
+        message = self._emojis.emojize(message)
 
         message = self.selective_replace(message)
 
@@ -107,32 +114,17 @@ class SlackFormatter(object):
         return "".join(result)
 
 
-    def slack_to_accepted_emoji(self, message):
-        """Convert some Slack emoji shortcodes to more universal versions"""
-        # Convert -'s to _'s except for the 1st char (preserve things like :-1:)
-        # For example, Slack's ":woman-shrugging:" is converted to ":woman_shrugging:"
-        message = re.sub(
-            r":([^ <>/:])([^ <>/:]+):",
-            lambda x: ":{}{}:".format(x.group(1), x.group(2).replace("-", "_")),
-            message
-        )
-
-        # https://github.com/Ranks/emojione/issues/114
-        message = message.replace(":simple_smile:", ":slightly_smiling_face:")
-        return message
-
     def _sub_annotated_mention(self, matchobj):
         ref_id = matchobj.group(1)[1:]  # drop #/@ from the start, we don't care
         annotation = matchobj.group(2)
         if ref_id.startswith('C'):
             mention_format = "<b>#{}</b>"
             if not annotation:
-                channel = self.__CHANNEL_DATA.get(ref_id)
-                annotation = channel["name"] if channel else ref_id
+                annotation = self._directory.conversation_name(ref_id) or ref_id
         else:
             mention_format = "@{}"
             if not annotation:
-                user = self.__USER_DATA.get(ref_id)
+                user = self._directory.user(ref_id)
                 annotation = user.display_name if user else ref_id
         return mention_format.format(annotation)
 
@@ -0,0 +1,169 @@
+import collections
+import datetime
+import functools
+import gzip
+import hashlib
+import os
+import threading
+
+import flask
+
+from slackviewer.metrics import METRICS
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_SIZE = 1024
+
+# Upper bound of the memoized compressed pages, in bytes
+COMPRESSED_CACHE_SIZE = 64 * 1024 * 1024
+
+
+class CompressedPages(object):
+    """
+    LRU cache of compressed page bodies, bounded by their total size.
+
+    Pages are keyed by their ETag and encoding; as the archive never changes
+    once loaded, a cached body stays valid for as long as the app runs.
+    """
+
+    def __init__(self, max_bytes=COMPRESSED_CACHE_SIZE):
+        """
+        :param int max_bytes: total size of the bodies kept
+        """
+        self._max_bytes = max_bytes
+        self._bodies = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the body and mimetype of a page, None if not cached"""
+        with self._lock:
+            page = self._bodies.get(key)
+            if page is not None:
+                self._bodies.move_to_end(key)
+            return page
+
+    def put(self, key, body, mimetype="text/html"):
+        if len(body) > self._max_bytes:
+            return
+        with self._lock:
+            previous = self._bodies.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[0])
+            self._bodies[key] = (body, mimetype)
+            self._size += len(body)
+            while self._size > self._max_bytes:
+                _, (evicted, _) = self._bodies.popitem(last=False)
+                self._size -= len(evicted)
+
+    def __len__(self):
+        return len(self._bodies)
+
+
+def page_version(archive_sha, config, loaded_at):
+    """
+    Returns the part of every page's ETag that identifies the loaded archive
+    and the options it is rendered with
+
+    :param str archive_sha: SHA of the archive, None for plain directories
+    whose contents are only identified by the time they were loaded
+
+    :param Config config: Config of the app
+
+    :param datetime loaded_at: time the archive was loaded
+    """
+    h = hashlib.sha1()
+    h.update((archive_sha or loaded_at.isoformat()).encode("utf-8"))
+    h.update(repr(sorted((k, str(v)) for k, v in config._config.items())).encode("utf-8"))
+    return h.hexdigest()
+
+
+def archive_last_modified(archive_path, archive_sha, loaded_at):
+    """
+    Last-Modified of the pages: the archive's modification time, or the load
+    time for plain directories which have no SHA to tell their versions apart
+    """
+    if archive_sha is None:
+        return loaded_at
+    return datetime.datetime.fromtimestamp(
+        int(os.path.getmtime(archive_path)), tz=datetime.timezone.utc
+    )
+
+
+def _negotiate_encoding():
+    encodings = ["br", "gzip"] if brotli is not None else ["gzip"]
+    return flask.request.accept_encodings.best_match(encodings)
+
+
+def _compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=6)
+    return gzip.compress(body, compresslevel=6)
+
+
+def _not_modified(app, etag):
+    request = flask.request
+    # If-None-Match takes precedence over If-Modified-Since (RFC 7232)
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since:
+        return app.last_modified <= request.if_modified_since
+    return False
+
+
+def cached_page(view):
+    """
+    Decorates a view rendering an archive page with HTTP caching.
+
+    Pages get an ETag made of the archive's version and the request's path
+    and query, and a Last-Modified date. Conditional requests matching them
+    are answered with 304 Not Modified without rendering the page. Bodies
+    are compressed with brotli (if installed) or gzip as the client accepts,
+    and the compressed bodies are memoized.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        app = flask.current_app
+        identity = "{}\0{}".format(app.page_version, flask.request.full_path)
+        etag = hashlib.sha1(identity.encode("utf-8")).hexdigest()
+        encoding = _negotiate_encoding()
+        if encoding:
+            # Strong ETags differ per representation
+            etag = "{}-{}".format(etag, encoding)
+
+        def finish(response):
+            response.set_etag(etag)
+            response.last_modified = app.last_modified
+            response.cache_control.no_cache = True
+            response.vary.add("Accept-Encoding")
+            return response
+
+        if _not_modified(app, etag):
+            return finish(flask.Response(status=304))
+
+        page = app.compressed_pages.get((etag, encoding)) if encoding else None
+        if encoding:
+            METRICS.inc("compressed_pages_total", result="miss" if page is None else "hit")
+        if page is None:
+            response = flask.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            if not encoding:
+                return finish(response)
+            data = response.get_data()
+            if len(data) < MIN_COMPRESS_SIZE:
+                return finish(response)
+            page = (_compress(data, encoding), response.mimetype)
+            app.compressed_pages.put((etag, encoding), *page)
+
+        body, mimetype = page
+        response = flask.Response(body, mimetype=mimetype)
+        response.content_encoding = encoding
+        return finish(response)
+
+    return wrapper
@@ -0,0 +1,115 @@
+import json
+import mmap
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Decoder name to a function parsing JSON from bytes into Python objects
+DECODERS = {"json": json.loads}
+if orjson is not None:
+    DECODERS["orjson"] = orjson.loads
+
+# Decoders that parse straight from a buffer such as a memory mapped file,
+# without copying it to bytes (or decoding it to str) first
+_BUFFER_DECODERS = {"orjson"}
+
+# Files at least this large are memory mapped instead of read, if the
+# decoder supports it
+MMAP_THRESHOLD = 1024 * 1024
+
+
+def decoder_name(name=None):
+    """
+    Resolves the name of a JSON decoder
+
+    :param str name: name of a decoder in DECODERS, "auto" or None for the
+    fastest one installed
+
+    :raises ValueError: if the decoder is unknown or not installed
+
+    :rtype: str
+    """
+    if name in (None, "auto"):
+        return "orjson" if "orjson" in DECODERS else "json"
+    if name not in DECODERS:
+        raise ValueError("JSON decoder '{}' is not available, installed decoders: {}".format(
+            name, ", ".join(sorted(DECODERS))
+        ))
+    return name
+
+
+def loads(data, decoder=None):
+    """
+    Parses JSON from bytes
+
+    :param bytes data: UTF-8 encoded JSON
+
+    :param str decoder: decoder to use, see decoder_name
+    """
+    name = decoder_name(decoder)
+    try:
+        return DECODERS[name](data)
+    except ValueError:
+        if name == "json":
+            raise
+        # Fast decoders are stricter than json, e.g. about the lone
+        # surrogates some exports contain
+        return json.loads(bytes(data))
+
+
+def load(f, decoder=None):
+    """
+    Parses JSON from a file opened in binary mode. Large regular files are
+    memory mapped when the decoder can parse them in place.
+
+    :param f: binary file object
+
+    :param str decoder: decoder to use, see decoder_name
+    """
+    return load_sized(f, decoder)[0]
+
+
+def load_sized(f, decoder=None):
+    """
+    Like load, but also returns the number of bytes parsed
+
+    :rtype: (object, int)
+    """
+    name = decoder_name(decoder)
+    if name in _BUFFER_DECODERS:
+        fileno = _fileno(f)
+        if fileno is not None and os.fstat(fileno).st_size >= MMAP_THRESHOLD:
+            with mmap.mmap(fileno, 0, access=mmap.ACCESS_READ) as mapped:
+                # The view has to be released before the map is closed
+                with memoryview(mapped) as view:
+                    return loads(view, name), len(mapped)
+    data = f.read()
+    return loads(data, name), len(data)
+
+
+def dumps(obj):
+    """
+    Serializes to UTF-8 encoded JSON, with orjson if it is installed
+
+    :rtype: bytes
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # e.g. lone surrogates or integers beyond 64 bits, which json
+            # handles
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8", "surrogatepass")
+
+
+def _fileno(f):
+    """File descriptor of a file object, None for e.g. zip file members"""
+    try:
+        return f.fileno()
+    except (AttributeError, OSError, ValueError):
+        return None
@@ -1,43 +1,127 @@
+import datetime
+import hashlib
 import webbrowser
 import os
 
 import click
+from werkzeug.serving import run_simple
 
 from slackviewer.app import app
 from slackviewer.config import Config
-from slackviewer.freezer import CustomFreezer
+from slackviewer.http_cache import CompressedPages, archive_last_modified, page_version
+from slackviewer.metrics import METRICS
+from slackviewer.mounts import ArchiveMounts, mount_table
 from slackviewer.reader import Reader
+from slackviewer.search import SearchIndex
+from slackviewer.server import PreforkServer
+from slackviewer.static_site import StaticSiteBuilder
+from slackviewer.utils.six import to_bytes
 
 
-def configure_app(app, config):
+def configure_app(app, config, reset_metrics=True):
+    """
+    Loads the archive of a config into a viewer app
+
+    :param Flask app: app made by slackviewer.app.create_app
+
+    :param Config config: Config of the archive
+
+    :param bool reset_metrics: clears the process wide metrics first, unless
+    the process serves other archives as well
+    """
     app.debug = config.debug
     app.no_sidebar = config.no_sidebar
     app.no_external_references = config.no_external_references
+    app.page_size = config.page_size
+    # Rendered sidebars and inlined CSS, filled on first use
+    app.sidebars = {}
+    app.viewer_css = None
+    # Static HTML has no server to answer the message API
+    app.virtual_scroll = bool(config.virtual_scroll) and not config.html_only
     if app.debug:
         print("WARNING: DEBUG MODE IS ENABLED!")
     app.config["PROPAGATE_EXCEPTIONS"] = True
 
-    reader = Reader(config)
-
-    app.slack_path = reader.archive_path()
-    app.channels = reader.compile_channels(config.channels)
-    app.groups = reader.compile_groups()
-    app.dms = {}
-    app.dm_users = []
-    app.mpims = {}
-    app.mpim_users = []
-    if config.show_dms:
-        app.dms = reader.compile_dm_messages()
-        app.dm_users = reader.compile_dm_users()
-        app.mpims = reader.compile_mpim_messages()
-        app.mpim_users = reader.compile_mpim_users()
+    # Metrics describe the archive being served
+    if reset_metrics:
+        METRICS.reset()
+    with METRICS.timed("load"):
+        reader = Reader(config)
+
+        # Kept to close it when the archive is unloaded
+        app.reader = reader
+
+        app.slack_path = reader.archive_path()
+        app.archive = reader.archive()
+        app.thumbnails = reader.thumbnails()
+        app.channels = reader.compile_channels(config.channels, lazy=config.lazy)
+        app.groups = reader.compile_groups(lazy=config.lazy)
+        app.dms = {}
+        app.dm_users = []
+        app.mpims = {}
+        app.mpim_users = []
+        if config.show_dms:
+            app.dms = reader.compile_dm_messages(lazy=config.lazy)
+            app.dm_users = reader.compile_dm_users()
+            app.mpims = reader.compile_mpim_messages(lazy=config.lazy)
+            app.mpim_users = reader.compile_mpim_users()
 
     reader.warn_not_found_to_hide_channels()
+    if not config.lazy:
+        # Every conversation is compiled, no more day files will be read
+        reader.shutdown_workers()
+
+    # Validators and compressed bodies of the rendered pages
+    loaded_at = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+    app.page_version = page_version(reader.archive().sha, config, loaded_at)
+    app.last_modified = archive_last_modified(config.archive, reader.archive().sha, loaded_at)
+    app.compressed_pages = CompressedPages()
 
     # remove any empty channels & groups. DM's are needed for now
-    # since the application loads the first
-    app.channels = {k: v for k, v in app.channels.items() if v}
-    app.groups = {k: v for k, v in app.groups.items() if v}
+    # since the application loads the first.
+    # Lazy mappings already only hold conversations with day files; checking
+    # them for messages here would compile everything. Instead, they leave
+    # out conversations that turn out empty when first loaded, e.g. with
+    # --filter-user or --since.
+    if not config.lazy:
+        app.channels = {k: v for k, v in app.channels.items() if v}
+        app.groups = {k: v for k, v in app.groups.items() if v}
+    else:
+        app.channels.hide_empty(lambda name: forget_rendered_pages(app))
+        app.groups.hide_empty(lambda name: forget_rendered_pages(app))
+
+    # Static HTML has no server to answer searches
+    app.search_index = None
+    if config.search and not config.html_only:
+        app.search_index = SearchIndex.for_archive(reader.archive().sha, config)
+        app.search_index.index_in_background([
+            ("channel", app.channels),
+            ("group", app.groups),
+            ("dm", app.dms),
+            ("mpim", app.mpims),
+        ])
+
+
+def reload_app(app, config):
+    """
+    Loads the archive into an app again, e.g. on SIGHUP with --serve, then
+    releases what the previous load opened (see slackviewer.app.close_app)
+    """
+    reader, search_index = app.reader, app.search_index
+    configure_app(app, config)
+    if search_index is not None:
+        search_index.close()
+    reader.close()
+
+
+def forget_rendered_pages(app):
+    """
+    Drops the rendered sidebars and compressed pages, and changes the pages'
+    ETags, after a conversation was hidden from the sidebar
+    """
+    app.sidebars.clear()
+    app.page_version = hashlib.sha1(to_bytes(app.page_version + "\0hidden")).hexdigest()
+    app.compressed_pages = CompressedPages()
 
 
 @click.command()
@@ -45,8 +129,8 @@ def configure_app(app, config):
     Host port to serve your content on
     Environment var: SEV_PORT (default: 5000)
     """)
-@click.option("-z", "--archive", type=click.Path(exists=True), required=True, envvar='SEV_ARCHIVE', help="""\b
-    Path to your Slack export archive (.zip file or directory)
+@click.option("-z", "--archive", type=click.Path(exists=True), envvar='SEV_ARCHIVE', help="""\b
+    Path to your Slack export archive (.zip file or directory). Required unless --mount is used.
     Environment var: SEV_ARCHIVE
     """)
 @click.option('-I', '--ip', default='localhost', envvar='SEV_IP', type=click.STRING, help="""\b
@@ -90,6 +174,10 @@ def configure_app(app, config):
     Only show messages since this date.
     Environment var: SEV_SINCE (default: None)
     """)
+@click.option("--until", default=None, type=click.DateTime(formats=["%Y-%m-%d"]), envvar='SEV_UNTIL', help="""\b
+    Only show messages up to and including this date.
+    Environment var: SEV_UNTIL (default: None)
+    """)
 @click.option('--show-dms/--no-show-dms', default=True, envvar='SEV_SHOW_DMS', help="""\b
     Show/Hide direct messages
     Environment var: SEV_SHOW_DMS (default: false)
@@ -106,33 +194,93 @@ def configure_app(app, config):
     Comma separated list of channels to hide.
     Environment var: SEV_HIDE_CHANNELS (default: None)
     """)
+@click.option('--extract/--no-extract', default=True, envvar='SEV_EXTRACT', help="""\b
+    Extract zip archives to the temp directory. With --no-extract, files are read straight from the zip.
+    Environment var: SEV_EXTRACT (default: true)
+    """)
+@click.option('--fingerprint', default="full", type=click.Choice(["full", "fast"]), envvar='SEV_FINGERPRINT', help="""\b
+    How zip archives are identified. full hashes the whole file, fast only its file list, size and modification time.
+    Environment var: SEV_FINGERPRINT (default: full)
+    """)
+@click.option("--workers", default=1, type=click.IntRange(min=1), envvar='SEV_WORKERS', help="""\b
+    Number of processes used to parse the archive's day files and, with --html-only, to render pages.
+    Environment var: SEV_WORKERS (default: 1)
+    """)
+@click.option('--parse-cache/--no-parse-cache', default=True, envvar='SEV_PARSE_CACHE', help="""\b
+    Cache parsed conversations, reusing them while their day files are unchanged.
+    Environment var: SEV_PARSE_CACHE (default: true)
+    """)
+@click.option("--json-decoder", default="auto", type=click.Choice(["auto", "orjson", "json"]), envvar='SEV_JSON_DECODER', help="""\b
+    JSON decoder for the archive's files. auto uses orjson if it is installed and the standard library otherwise.
+    Environment var: SEV_JSON_DECODER (default: auto)
+    """)
+@click.option('--lazy/--no-lazy', default=False, envvar='SEV_LAZY', help="""\b
+    Only compile a conversation's messages when it is first viewed.
+    Environment var: SEV_LAZY (default: false)
+    """)
+@click.option("--max-loaded", default=64, type=click.INT, envvar='SEV_MAX_LOADED', help="""\b
+    With --lazy, the maximum number of compiled conversations kept in memory (0 for no limit).
+    Environment var: SEV_MAX_LOADED (default: 64)
+    """)
+@click.option('--search/--no-search', default=True, envvar='SEV_SEARCH', help="""\b
+    Build a full-text search index in the background and enable the search page.
+    With --lazy, conversations are indexed when they are first opened.
+    Environment var: SEV_SEARCH (default: true)
+    """)
+@click.option('--thumbnails/--no-thumbnails', default=True, envvar='SEV_THUMBNAILS', help="""\b
+    Serve downscaled previews of image attachments stored in the archive. Requires Pillow.
+    Environment var: SEV_THUMBNAILS (default: true)
+    """)
+@click.option('--virtual-scroll/--no-virtual-scroll', default=False, envvar='SEV_VIRTUAL_SCROLL', help="""\b
+    Load conversations' messages while scrolling instead of in pages. Not used with --html-only.
+    Environment var: SEV_VIRTUAL_SCROLL (default: false)
+    """)
+@click.option('--serve', is_flag=True, default=False, envvar='SEV_SERVE', help="""\b
+    Serve from forked worker processes sharing the loaded archive instead of the development server.
+    SIGHUP reloads the archive and gracefully replaces the workers.
+    Environment var: SEV_SERVE (default: false)
+    """)
+@click.option("--processes", default=0, type=click.IntRange(min=0), envvar='SEV_PROCESSES', help="""\b
+    With --serve, the number of worker processes (0 for one per CPU).
+    Environment var: SEV_PROCESSES (default: 0)
+    """)
+@click.option("--threads", default=8, type=click.IntRange(min=1), envvar='SEV_THREADS', help="""\b
+    With --serve, the number of request threads per worker process.
+    Environment var: SEV_THREADS (default: 8)
+    """)
+@click.option("--mount", multiple=True, envvar='SEV_MOUNT', help="""\b
+    Serve several archives, each under /<slug>/, from one process. Given as <slug>=<path>, or <path> to name
+    the slug after the file. May be repeated; --archive is then mounted as well. Not used with --html-only.
+    Environment var: SEV_MOUNT, space separated (default: None)
+    """)
+@click.option("--memory-budget", default=0, type=click.IntRange(min=0), envvar='SEV_MEMORY_BUDGET', help="""\b
+    With --mount, the megabytes of JSON of the archives kept loaded; the least recently used are unloaded (0 for no limit).
+    Environment var: SEV_MEMORY_BUDGET (default: 0)
+    """)
+@click.option("--page-size", default=1000, type=click.IntRange(min=0), envvar='SEV_PAGE_SIZE', help="""\b
+    Number of messages per conversation page (0 to show every message on one page).
+    Environment var: SEV_PAGE_SIZE (default: 1000)
+    """)
 def main(**kwargs):
     config = Config(kwargs)
+    if config.mount:
+        return serve_mounts(config, kwargs)
     if not config.archive:
         raise ValueError("Empty path provided for archive")
 
     configure_app(app, config)
+    print(METRICS.summary())
 
     if config.html_only:
-        # We need relative URLs, otherwise channel refs do not work
-        app.config["FREEZER_RELATIVE_URLS"] = True
-
-        # Custom subclass of Freezer allows overwriting the output directory
-        freezer = CustomFreezer(app)
-        freezer.cf_output_dir = config.output_dir
-
-        # This tells freezer about the channel URLs
-        @freezer.register_generator
-        def channel_name():
-            for channel in app.channels:
-                yield {"name": channel}
-
-        freezer.freeze()
+        StaticSiteBuilder(app, config.output_dir, config.workers).build()
 
         if not config.no_browser:
             webbrowser.open("file:///{}/index.html"
                             .format(os.path.abspath(config.output_dir)))
 
+    elif config.serve and not config.test:
+        serve_prefork(app, config, reload=lambda: reload_app(app, config))
+
     elif not config.test:
         if not config.no_browser:
             webbrowser.open("http://{}:{}".format(config.ip, config.port))
@@ -140,3 +288,54 @@ def main(**kwargs):
             host=config.ip,
             port=config.port
         )
+
+
+def serve_prefork(wsgi_app, config, reload):
+    if not hasattr(os, "fork"):
+        raise click.UsageError("--serve requires a platform with os.fork")
+    PreforkServer(
+        wsgi_app, config.ip, config.port,
+        processes=config.processes or os.cpu_count() or 1,
+        threads=config.threads,
+        reload=reload,
+    ).serve_forever()
+
+
+def serve_mounts(config, options):
+    """
+    Serves the archives given with --mount, loading each one on its first
+    request, or before forking the workers with --serve
+
+    :param Config config: Config of the command line
+
+    :param dict options: command line options, used for the Config of each
+    archive
+    """
+    if config.html_only:
+        raise click.UsageError("--mount can't be used with --html-only")
+    try:
+        archives = mount_table(config.mount, config.archive)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--mount")
+
+    def configure(viewer, path):
+        configure_app(viewer, Config(dict(options, archive=path, mount=())), reset_metrics=False)
+
+    mounts = ArchiveMounts(archives, configure, memory_budget=config.memory_budget * 1024 * 1024)
+    METRICS.reset()
+    if config.test:
+        mounts.load_all()
+    elif config.serve:
+        # Loaded before forking, so workers share the archives instead of
+        # each loading them on their first request
+        mounts.load_all()
+
+        def reload():
+            mounts.unload_all()
+            mounts.load_all()
+
+        serve_prefork(mounts, config, reload=reload)
+    else:
+        if not config.no_browser:
+            webbrowser.open("http://{}:{}".format(config.ip, config.port))
+        run_simple(config.ip, config.port, mounts, threaded=True)
@@ -2,15 +2,38 @@ from __future__ import unicode_literals
 
 import datetime
 import logging
-import emoji
+
+from markupsafe import Markup
+
+
+# Marks derived values not computed yet, see Message
+_UNSET = object()
 
 
 class Message(object):
+    """
+    A message of a conversation, wrapping the message's JSON from its day file.
+
+    Messages are the bulk of a loaded archive, so they use __slots__, keep
+    only the raw keys the viewer and reader use (see KEPT_KEYS) and compute
+    the values templates access repeatedly (time, user, permalink) once.
+    """
 
-    _DEFAULT_USER_ICON_SIZE = 72
+    __slots__ = (
+        "_formatter", "_message", "is_thread_msg", "is_recent_msg", "channel_id",
+        "slack_name", "_msg", "_ts", "_time", "_user", "_permalink",
+    )
+
+    # Raw message keys used for rendering, threading and search; others are dropped
+    KEPT_KEYS = frozenset((
+        "attachments", "blocks", "bot_id", "bot_link", "file", "files", "reactions",
+        "replies", "reply_count", "subtype", "text", "thread_ts", "ts", "user", "username",
+    ))
 
     def __init__(self, formatter, message, channel_id, slack_name):
         self._formatter = formatter
+        if not message.keys() <= self.KEPT_KEYS:
+            message = {k: v for k, v in message.items() if k in self.KEPT_KEYS}
         self._message = message
         # default is False, we update it later if its a thread message
         self.is_thread_msg = False
@@ -20,6 +43,14 @@ class Message(object):
         self.channel_id = channel_id
         # slack name that is in the url https://<slackname>.slack.com
         self.slack_name = slack_name
+        # rendered message body, see msg
+        self._msg = None
+        ts = self._message.get("ts")
+        self._ts = float(ts) if ts is not None else None
+        # derived values, computed on first access
+        self._time = _UNSET
+        self._user = _UNSET
+        self._permalink = None
 
     def __repr__(self):
         message = self._message.get("text")
@@ -32,6 +63,11 @@ class Message(object):
     # Properties #
     ##############
 
+    @property
+    def ts(self):
+        """The message's timestamp as epoch seconds"""
+        return self._ts
+
     @property
     def user_id(self):
         if "user" in self._message:
@@ -44,7 +80,9 @@ class Message(object):
 
     @property
     def user(self):
-        return self._formatter.find_user(self._message)
+        if self._user is _UNSET:
+            self._user = self._formatter.find_user(self._message)
+        return self._user
 
     @property
     def username(self):
@@ -63,13 +101,13 @@ class Message(object):
 
     @property
     def time(self):
-        # Check if 'ts' key exists in the dictionary
-        if "ts" in self._message:
-            # Handle this: "ts": "1456427378.000002"
-            tsepoch = float(self._message["ts"].split(".")[0])
-            return str(datetime.datetime.fromtimestamp(tsepoch)).split('.')[0]
-        else:
-            return None  # or return a suitable default value
+        if self._time is _UNSET:
+            if self._ts is not None:
+                # Handle this: "ts": "1456427378.000002", shown to the second
+                self._time = str(datetime.datetime.fromtimestamp(int(self._ts)))
+            else:
+                self._time = None
+        return self._time
 
     @property
     def attachments(self):
@@ -82,10 +120,16 @@ class Message(object):
             allfiles = [self._message["file"]]
         else:
             allfiles = self._message.get("files", [])
-        return [ LinkAttachment("FILE", entry, self._formatter) for entry in allfiles ]
+        return [ LinkAttachment("FILE", entry, self._formatter, self.channel_id) for entry in allfiles ]
 
     @property
     def msg(self):
+        # Templates access msg more than once per message; render it only once
+        if self._msg is None:
+            self._msg = self._render_msg()
+        return self._msg
+
+    def _render_msg(self):
         # Slack recommends to use blocks, while the
         # 'text' field is the fall back. 'text' field also seems to be used
         # for notifications text
@@ -158,7 +202,7 @@ class Message(object):
 
 
         elif element["type"] == "user":
-            user = self._formatter.find_user(self.user_message(element['user_id']))
+            user = self._formatter.find_user_by_id(element['user_id'])
             if user:
                 return f"<b>@{user.display_name}</b>"
             else:
@@ -179,10 +223,16 @@ class Message(object):
             return list_text
 
         elif element["type"] == "emoji":
+            rendered = self._formatter.emoji(element["name"])
+            if rendered:
+                return rendered
             if "unicode" in element:
-                return emoji.emojize(f":{element['name']}:", language='alias')
-            else:
-                return element["name"]
+                # Emoji newer than the emoji package, e.g. "1f469-200d-1f4bb"
+                try:
+                    return "".join(chr(int(code, 16)) for code in element["unicode"].split("-"))
+                except ValueError:
+                    pass
+            return element["name"]
 
         # Prevent unwanted formatting of preformatted text
         elif element["type"] == "rich_text_preformatted":
@@ -288,12 +338,8 @@ class Message(object):
         return {"user": user_id}
 
     def usernames(self, reaction):
-        return [
-            self._formatter.find_user(self.user_message(user_id)).display_name
-            for user_id
-            in reaction.get("users")
-            if self._formatter.find_user(self.user_message(user_id))
-        ]
+        users = (self._formatter.find_user_by_id(user_id) for user_id in reaction.get("users"))
+        return [user.display_name for user in users if user]
 
     @property
     def reactions(self):
@@ -301,20 +347,20 @@ class Message(object):
         return [
             {
                 "usernames": self.usernames(reaction),
-                "name": emoji.emojize(
-                    self._formatter.slack_to_accepted_emoji(':{}:'.format(reaction.get("name"))),
-                    language='alias'
-                )
+                "name": self._reaction_emoji(reaction.get("name"))
             }
             for reaction in reactions
         ]
 
+    def _reaction_emoji(self, name):
+        rendered = self._formatter.emoji(name)
+        # Custom emoji are images
+        return Markup(rendered) if rendered else ":{}:".format(name)
+
     @property
     def img(self):
-        try:
-            return self.user.image_url(self._DEFAULT_USER_ICON_SIZE)
-        except KeyError:
-            return ""
+        user = self.user
+        return user.avatar_url if user else ""
 
     @property
     def id(self):
@@ -326,10 +372,12 @@ class Message(object):
 
     @property
     def permalink(self):
-        permalink = f"https://{self.slack_name}.slack.com/archives/{self.channel_id}/p{self._message['ts'].replace('.','')}"
-        if "thread_ts" in self._message:
-            permalink += f"?thread_ts={self._message['thread_ts']}&cid={self.channel_id}"
-        return permalink
+        if self._permalink is None:
+            permalink = f"https://{self.slack_name}.slack.com/archives/{self.channel_id}/p{self._message['ts'].replace('.','')}"
+            if "thread_ts" in self._message:
+                permalink += f"?thread_ts={self._message['thread_ts']}&cid={self.channel_id}"
+            self._permalink = permalink
+        return self._permalink
 
 
 class LinkAttachment():
@@ -342,10 +390,11 @@ class LinkAttachment():
     # Fields that need to be processed for markup (and possibly markdown)
     _TEXT_FIELDS = {"pretext", "text", "footer"}
 
-    def __init__(self, attachment_type, raw, formatter):
+    def __init__(self, attachment_type, raw, formatter, channel_id=None):
         self._type = attachment_type
         self._raw = raw
         self._formatter = formatter
+        self._channel_id = channel_id
 
     def __getitem__(self, key):
         content = self._raw[key]
@@ -355,6 +404,10 @@ class LinkAttachment():
         return content
 
     def thumbnail(self, size=None):
+        local = self._local_thumbnail()
+        if local:
+            return local
+
         size = size if size else self._DEFAULT_THUMBNAIL_SIZE
         # ATTACHMENT type
         if "image_url" in self._raw:
@@ -387,6 +440,27 @@ class LinkAttachment():
             else:
                 logging.info("No thumbnail found for [%s]", self._raw.get("title"))
 
+    def _local_thumbnail(self):
+        """
+        Thumbnail generated from a copy of the file in the archive, if the
+        archive has one; templates link it with the conversation and file name
+        """
+        thumbnails = self._formatter.thumbnails
+        if thumbnails is None or self._type != "FILE" or not self.is_image:
+            return None
+        conversation = self._formatter.find_channel(self._channel_id)
+        attachment = thumbnails.local_attachment(conversation, self._raw) if conversation else None
+        if attachment is None:
+            return None
+        width, height = thumbnails.dimensions(self._raw)
+        return {
+            "conversation": conversation,
+            "attachment": attachment,
+            "version": thumbnails.version(thumbnails.relpath(conversation, attachment)),
+            "width": width,
+            "height": height,
+        }
+
     @property
     def is_image(self):
         return self._raw.get("mimetype", "").startswith("image/")
@@ -0,0 +1,174 @@
+import contextlib
+import threading
+import time
+
+
+class Metrics(object):
+    """
+    Process wide counters and stage timings, rendered as a startup summary
+    or in the Prometheus text format (see the /metrics route).
+
+    Metrics are identified by a name and optional labels. Counters only go
+    up; timings keep the total seconds and the number of timed runs.
+    Collectors registered with add_collector contribute values computed at
+    render time, such as the hit counts of caches that count themselves.
+    """
+
+    PREFIX = "slackviewer_"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._timings = {}
+        self._help = {}
+        self._collectors = []
+
+    ##################
+    # Public Methods #
+    ##################
+
+    def describe(self, name, help_text):
+        """Sets the HELP text of a metric"""
+        self._help[name] = help_text
+
+    def inc(self, name, value=1, **labels):
+        """Adds value to a counter"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        """Records one run of a timed operation"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            total, count = self._timings.get(key, (0.0, 0))
+            self._timings[key] = (total + seconds, count + 1)
+
+    @contextlib.contextmanager
+    def timed(self, stage):
+        """Times the enclosed block as a run of a startup stage"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - started, stage=stage)
+
+    def add_collector(self, collector):
+        """
+        Registers a function returning [(name, labels, value)] of counters
+        computed when the metrics are rendered
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def remove_collector(self, collector):
+        """Unregisters a collector added with add_collector"""
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def value(self, name, **labels):
+        """Current value of a counter, or total seconds of a timing"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key in self._timings:
+                return self._timings[key][0]
+            return self._counters.get(key, 0)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._timings.clear()
+            self._collectors = []
+
+    def summary(self):
+        """Human readable table of the stage timings and counters"""
+        counters, timings = self._snapshot()
+        lines = []
+        stages = [(dict(labels).get("stage"), v) for (name, labels), v in timings.items() if name == "stage_seconds"]
+        if stages:
+            lines.append("Startup stages:")
+            for stage, (total, count) in sorted(stages, key=lambda s: -s[1][0]):
+                lines.append("  {:<20} {:>9.3f} s{}".format(stage, total, " ({} runs)".format(count) if count > 1 else ""))
+        if counters:
+            lines.append("Counters:")
+            for (name, labels), value in sorted(counters.items()):
+                lines.append("  {:<40} {:>12}".format(name + self._format_labels(labels), self._format_value(value)))
+        return "\n".join(lines)
+
+    def render_prometheus(self):
+        """Metrics in the Prometheus text exposition format"""
+        counters, timings = self._snapshot()
+        lines = []
+
+        by_name = {}
+        for (name, labels), value in counters.items():
+            by_name.setdefault(name, []).append((labels, value))
+        for name in sorted(by_name):
+            full_name = self.PREFIX + name
+            self._header(lines, name, full_name, "counter")
+            for labels, value in sorted(by_name[name]):
+                lines.append("{}{} {}".format(full_name, self._format_labels(labels), self._format_value(value)))
+
+        by_name = {}
+        for (name, labels), value in timings.items():
+            by_name.setdefault(name, []).append((labels, value))
+        for name in sorted(by_name):
+            full_name = self.PREFIX + name
+            self._header(lines, name, full_name, "summary")
+            for labels, (total, count) in sorted(by_name[name]):
+                label_text = self._format_labels(labels)
+                lines.append("{}_sum{} {}".format(full_name, label_text, self._format_value(total)))
+                lines.append("{}_count{} {}".format(full_name, label_text, count))
+
+        return "\n".join(lines) + "\n"
+
+    ###################
+    # Private Methods #
+    ###################
+
+    def _snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            timings = dict(self._timings)
+            collectors = list(self._collectors)
+        for collector in collectors:
+            for name, labels, value in collector():
+                key = (name, tuple(sorted(labels.items())))
+                counters[key] = counters.get(key, 0) + value
+        return counters, timings
+
+    def _header(self, lines, name, full_name, kind):
+        if name in self._help:
+            lines.append("# HELP {} {}".format(full_name, self._help[name]))
+        lines.append("# TYPE {} {}".format(full_name, kind))
+
+    @staticmethod
+    def _format_labels(labels):
+        if not labels:
+            return ""
+        return "{" + ",".join(
+            '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for k, v in labels
+        ) + "}"
+
+    @staticmethod
+    def _format_value(value):
+        if isinstance(value, float):
+            return "{:.6f}".format(value)
+        return str(value)
+
+
+# Metrics of this process
+METRICS = Metrics()
+
+METRICS.describe("stage_seconds", "Time spent in each stage of loading the archive.")
+METRICS.describe("archive_files_read_total", "Archive JSON files read.")
+METRICS.describe("archive_bytes_parsed_total", "Bytes of archive JSON parsed.")
+METRICS.describe("messages_built_total", "Message objects built, from day files or the parse cache.")
+METRICS.describe("threads_assembled_total", "Threads whose replies were grouped under their parent.")
+METRICS.describe("parse_cache_total", "Parse cache lookups by result.")
+METRICS.describe("render_text_cache_total", "Rendered message text cache lookups by result.")
+METRICS.describe("compressed_pages_total", "Compressed page cache lookups by result.")
+METRICS.describe("requests_total", "Handled requests by endpoint and status.")
+METRICS.describe("request_seconds", "Time spent handling requests by endpoint.")
@@ -0,0 +1,245 @@
+import collections
+import functools
+import os
+import re
+import threading
+import time
+
+import flask
+from werkzeug.utils import redirect
+from werkzeug.wsgi import ClosingIterator
+
+from slackviewer.app import close_app, create_app, metrics
+
+
+# First path segments that can't be used as slugs, taken by the index app
+RESERVED_SLUGS = ("static", "metrics")
+
+
+def archive_slug(path):
+    """
+    Returns the URL slug of an archive from its file or directory name,
+    e.g. "acme-2023" for /exports/Acme 2023.zip
+    """
+    name = os.path.basename(os.path.normpath(path))
+    if name.lower().endswith(".zip"):
+        name = name[:-len(".zip")]
+    return re.sub(r"[^a-z0-9_-]+", "-", name.lower()).strip("-")
+
+
+def mount_table(mounts, archive=None):
+    """
+    Returns the slug to path mapping of the archives to mount
+
+    :param [str] mounts: "<slug>=<path>" or "<path>" of each archive, the
+    latter named after its file
+
+    :param str archive: path of one more archive to mount, as given by
+    --archive
+
+    :rtype: OrderedDict
+    """
+    table = collections.OrderedDict()
+    for value in list(mounts) + ([archive] if archive else []):
+        slug, sep, path = value.partition("=")
+        if not sep or os.path.exists(value):
+            slug, path = archive_slug(value), value
+        if not re.match(r"^[a-z0-9_-]+$", slug) or slug in RESERVED_SLUGS:
+            raise ValueError("Invalid slug '{}' for {}".format(slug, path))
+        if slug in table:
+            raise ValueError("Slug '{}' is used for both {} and {}".format(slug, table[slug], path))
+        if not os.path.exists(path):
+            raise ValueError("Archive {} does not exist".format(path))
+        table[slug] = path
+    return table
+
+
+class ArchiveMounts(object):
+    """
+    WSGI application serving several archives, each under /<slug>/, with an
+    index page listing them at /.
+
+    Every archive has its own viewer app (see slackviewer.app.create_app),
+    loaded on its first request. With a memory budget, the least recently
+    used archives are unloaded to keep the loaded ones within it. An
+    archive's footprint is estimated from the size of its .json files. An
+    unloaded archive is closed once the requests it is serving finish.
+    """
+
+    def __init__(self, archives, configure, memory_budget=0):
+        """
+        :param dict archives: slug to path of every archive, see mount_table
+
+        :param callable configure: called with a new viewer app and the path
+        of an archive to load the archive into the app
+
+        :param int memory_budget: bytes of archives kept loaded, 0 for no limit
+        """
+        self._archives = collections.OrderedDict(archives)
+        self._configure = configure
+        self._memory_budget = memory_budget
+        self._lock = threading.Lock()
+        # Slug to (app, estimated size) of the loaded archives, least
+        # recently used first
+        self._loaded = collections.OrderedDict()
+        # Slug to the lock held while the archive loads, so concurrent first
+        # requests load it once
+        self._loading = collections.defaultdict(threading.Lock)
+        # Viewer app to the number of requests it is serving, and the
+        # unloaded viewers to close when their last request finishes
+        self._requests = collections.Counter()
+        self._retired = set()
+        self._index = self._create_index_app()
+
+    def __call__(self, environ, start_response):
+        slug, sep, rest = environ.get("PATH_INFO", "").lstrip("/").partition("/")
+        if slug not in self._archives:
+            return self._index(environ, start_response)
+        if not sep:
+            # Relative links of the viewer expect the trailing slash
+            url = environ.get("SCRIPT_NAME", "") + "/" + slug + "/"
+            return redirect(url)(environ, start_response)
+
+        environ = dict(environ)
+        environ["SCRIPT_NAME"] = environ.get("SCRIPT_NAME", "") + "/" + slug
+        environ["PATH_INFO"] = "/" + rest
+        viewer = self._viewer(slug, hold=True)
+        try:
+            app_iter = viewer(environ, start_response)
+        except BaseException:
+            self._release(viewer)
+            raise
+        # The response body may still read the archive until it is closed
+        return ClosingIterator(app_iter, functools.partial(self._release, viewer))
+
+    ##################
+    # Public Methods #
+    ##################
+
+    def viewer(self, slug):
+        """
+        Returns the viewer app of an archive, loading it if needed
+
+        :rtype: flask.Flask
+        """
+        return self._viewer(slug)
+
+    def load_all(self):
+        """
+        Loads every archive, or as many of the last ones as the memory budget
+        allows, e.g. to load them once before forking worker processes
+        """
+        for slug in self._archives:
+            self.viewer(slug)
+
+    def loaded(self):
+        """
+        Returns the viewer apps of the loaded archives
+
+        :rtype: [flask.Flask]
+        """
+        with self._lock:
+            return [viewer for viewer, _ in self._loaded.values()]
+
+    def unload_all(self):
+        """Unloads every archive, they are loaded again on their next request"""
+        with self._lock:
+            unloaded = [self._unload(slug) for slug in list(self._loaded)]
+        self._close(unloaded)
+
+    ###################
+    # Private Methods #
+    ###################
+
+    def _viewer(self, slug, hold=False):
+        """
+        Returns the viewer app of an archive, loading it if needed. With
+        hold, the app is counted as serving a request until _release.
+        """
+        with self._lock:
+            if slug in self._loaded:
+                self._loaded.move_to_end(slug)
+                return self._hold(self._loaded[slug][0], hold)
+            loading = self._loading[slug]
+
+        with loading:
+            with self._lock:
+                if slug in self._loaded:
+                    return self._hold(self._loaded[slug][0], hold)
+            viewer = self._load(slug)
+            size = viewer.archive.json_size()
+            with self._lock:
+                self._loaded[slug] = (viewer, size)
+                self._hold(viewer, hold)
+                unloaded = self._evict()
+        self._close(unloaded)
+        return viewer
+
+    def _hold(self, viewer, hold):
+        if hold:
+            self._requests[viewer] += 1
+        return viewer
+
+    def _release(self, viewer):
+        with self._lock:
+            self._requests[viewer] -= 1
+            if self._requests[viewer]:
+                return
+            del self._requests[viewer]
+            if viewer not in self._retired:
+                return
+            self._retired.discard(viewer)
+        self._close([viewer])
+
+    def _load(self, slug):
+        started = time.perf_counter()
+        viewer = create_app()
+        self._configure(viewer, self._archives[slug])
+        print("Loaded {} in {:.1f}s".format(self._archives[slug], time.perf_counter() - started))
+        return viewer
+
+    def _evict(self):
+        """Unloads archives over the memory budget, returns those to close"""
+        unloaded = []
+        if not self._memory_budget:
+            return unloaded
+        # The archive just loaded is the most recently used, and kept even
+        # if it exceeds the budget on its own
+        while len(self._loaded) > 1 and sum(size for _, size in self._loaded.values()) > self._memory_budget:
+            unloaded.append(self._unload(next(iter(self._loaded))))
+        return unloaded
+
+    def _unload(self, slug):
+        """
+        Unloads an archive, called with the lock held. Returns its viewer if
+        it can be closed now, None if it is still serving requests.
+        """
+        viewer, _ = self._loaded.pop(slug)
+        print("Unloaded {}".format(self._archives[slug]))
+        if self._requests[viewer]:
+            self._retired.add(viewer)
+            return None
+        return viewer
+
+    @staticmethod
+    def _close(viewers):
+        # Outside the lock: closing waits for the search indexing thread
+        for viewer in viewers:
+            if viewer is not None:
+                close_app(viewer)
+
+    def _create_index_app(self):
+        index = flask.Flask(__name__, template_folder="templates", static_folder="static")
+
+        @index.route("/")
+        def archives():
+            with self._lock:
+                loaded = set(self._loaded)
+            return flask.render_template("archives.html", archives=[
+                {"slug": slug, "name": os.path.basename(os.path.normpath(path)), "loaded": slug in loaded}
+                for slug, path in self._archives.items()
+            ])
+
+        # Metrics are process wide, and cover every archive
+        index.add_url_rule("/metrics", view_func=metrics)
+        return index
@@ -1,17 +1,64 @@
-from collections import OrderedDict
 
-import glob
-import io
-import json
 import os
 import datetime
 import logging
+import multiprocessing
 import pathlib
+import threading
 
+from concurrent.futures import ProcessPoolExecutor
+from slackviewer.cache import ParsedArchiveCache
+from slackviewer.conversations import ConversationMap
 from slackviewer.formatter import SlackFormatter
 from slackviewer.message import Message
-from slackviewer.user import User, deleted_user
-from slackviewer.archive import extract_archive
+from slackviewer.metrics import METRICS
+from slackviewer.directory import WorkspaceDirectory
+from slackviewer.emojis import EmojiTable
+from slackviewer.thumbnails import Thumbnailer
+from slackviewer.archive import open_archive
+from slackviewer import json_decoder
+
+
+# Archive backend and JSON decoder of a day file worker process, see
+# Reader._read_day_files
+_worker_archive = None
+_worker_decoder = None
+
+
+def _init_day_file_worker(archive, decoder):
+    global _worker_archive, _worker_decoder
+    _worker_archive = archive.reopen()
+    _worker_decoder = decoder
+
+
+def _read_day_files(day_files, archive=None, decoder=None):
+    """
+    Parses and sorts the messages of consecutive day files of a conversation
+
+    :param [str] day_files: sorted archive paths of the day files
+
+    :param archive: archive backend, defaults to the one of the worker process
+
+    :param str decoder: JSON decoder, defaults to the one of the worker process
+
+    :return: array of raw messages in order and the number of bytes parsed
+
+    :rtype: ([dict], int)
+    """
+    archive = archive or _worker_archive
+    decoder = decoder or _worker_decoder
+    messages = []
+    parsed = 0
+    for day in day_files:
+        with archive.open(day) as f:
+            # loads all messages
+            day_messages, size = json_decoder.load_sized(f, decoder)
+        parsed += size
+
+        # sorts the messages in the json file
+        day_messages.sort(key=Reader._extract_time)
+        messages.extend(day_messages)
+    return messages, parsed
 
 
 class Reader(object):
@@ -19,10 +66,25 @@ class Reader(object):
     Reader object will read all of the archives' data from the json files
     """
 
+    # Number of consecutive day files parsed per worker task
+    _DAY_FILE_CHUNK = 32
+
+    # Day files totalling fewer bytes are parsed in process, where handing
+    # them to the worker processes would cost more than parsing them
+    _PARALLEL_PARSE_THRESHOLD = 4 * 1024 * 1024
+
     def __init__(self, config):
         self._config = config
-        self._PATH = extract_archive(config.archive)
+        self._json_decoder = json_decoder.decoder_name(config.json_decoder)
+        self._archive = open_archive(
+            config.archive, extract=config.extract is not False, fingerprint=config.fingerprint or "full"
+        )
+        self._PATH = self._archive.path
         self._since = config.since
+        self._until = config.until
+        # Timeframe bounds as epoch seconds, --until includes the whole day
+        self._since_ts = self._since.timestamp() if self._since else None
+        self._until_ts = (self._until + datetime.timedelta(days=1)).timestamp() if self._until else None
 
         # keep list of all channels to hide to flag not found ones
         self._remaining_unhidden_channels = config.hide_channels.copy()
@@ -30,6 +92,15 @@ class Reader(object):
         # slack name that is in the url https://<slackname>.slack.com
         self._slack_name = self._get_slack_name()
 
+        # Parsed channels.json, groups.json, dms.json and mpims.json
+        self._json_files = {}
+
+        # Day file worker processes, started on first use and shared by every
+        # read, see _day_file_pool
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+
         self.filter_user_attribute = None
         self.filter_user_value = None
         if config.filter_user:
@@ -39,16 +110,28 @@ class Reader(object):
 
         # TODO: Make sure this works
 
-        users_file = os.path.join(self._PATH, "users.json")
-        if not os.path.exists(users_file):
-            enterprise_users_file = os.path.join(self._PATH, "org_users.json")
-            if os.path.exists(enterprise_users_file):
+        users_file = "users.json"
+        if not self._archive.exists(users_file):
+            enterprise_users_file = "org_users.json"
+            if self._archive.exists(enterprise_users_file):
                 users_file = enterprise_users_file
             else:
                 logging.warning(f"Neither 'users.json' nor 'org_users.json' was found at {self._PATH}. Is this file not present or in the wrong location?")
 
-        with io.open(users_file, encoding="utf8") as f:
-            self.__USER_DATA = {u["id"]: User(u) for u in json.load(f)}
+        # Compiled conversations are cached per conversation and reused as long
+        # as the conversation's day files (and, for --filter-user, the users
+        # file) are unchanged
+        self._cache = None
+        if config.parse_cache:
+            users_fingerprint = None
+            if config.filter_user and self._archive.exists(users_file):
+                users_fingerprint = self._archive.fingerprint([users_file])
+            self._cache = ParsedArchiveCache.for_config(config, users_fingerprint)
+
+        with self._archive.open(users_file) as f:
+            users, parsed = json_decoder.load_sized(f, self._json_decoder)
+            METRICS.inc("archive_files_read_total")
+            METRICS.inc("archive_bytes_parsed_total", parsed)
             slackbot = {
                 "id": "USLACKBOT",
                 "name": "slackbot",
@@ -61,13 +144,53 @@ class Reader(object):
                     "image_512": "https://a.slack-edge.com/1801/img/slackbot_512.png",
                 }
             }
-            self.__USER_DATA.setdefault("USLACKBOT", User(slackbot))
+            if not any(u["id"] == slackbot["id"] for u in users):
+                users.append(slackbot)
+
+        # One directory of users and conversations, and one formatter, for
+        # every conversation: mentions resolve across channels and DMs
+        conversations = []
+        members = []
+        for file in ("channels.json", "groups.json", "dms.json", "mpims.json"):
+            for c in self._read_from_json(file).values():
+                conversations.append(c)
+                if file in ("dms.json", "mpims.json"):
+                    members.extend(c.get("members", ()))
+                    if "user" in c:
+                        members.append(c["user"])
+        self._directory = WorkspaceDirectory(users, conversations, members)
+        # Static pages and the single-file export can't serve thumbnails
+        self._thumbnails = None
+        if config.thumbnails and not config.html_only:
+            self._thumbnails = Thumbnailer.for_archive(self._archive)
+        self._formatter = SlackFormatter(self._directory, EmojiTable(self._custom_emoji()), self._thumbnails)
+        METRICS.add_collector(self._render_cache_metrics)
 
     ##################
     # Public Methods #
     ##################
 
-    def compile_channels(self, channels=None):
+    def close(self):
+        """
+        Stops the day file worker processes, closes the archive and
+        unregisters the reader's metrics, for archives that are unloaded
+        """
+        self.shutdown_workers()
+        self._archive.close()
+        METRICS.remove_collector(self._render_cache_metrics)
+
+    def shutdown_workers(self):
+        """
+        Stops the day file worker processes, e.g. once every conversation is
+        compiled. They are started again if more day files are read.
+        """
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+            # A pool inherited through fork belongs to the parent process
+            if pool is not None and self._pool_pid == os.getpid():
+                pool.shutdown()
+
+    def compile_channels(self, channels=None, lazy=False):
         if isinstance(channels, str):
             channels = channels.split(',')
 
@@ -76,9 +199,11 @@ class Reader(object):
 
         channel_names = self._remove_hidden_channels(channel_names)
 
+        if lazy:
+            return self._lazy_messages(channel_names, channel_data)
         return self._create_messages(channel_names, channel_data)
 
-    def compile_groups(self):
+    def compile_groups(self, lazy=False):
         """Get private channels"""
 
         group_data = self._read_from_json("groups.json")
@@ -86,15 +211,19 @@ class Reader(object):
 
         group_names = self._remove_hidden_channels(group_names)
 
+        if lazy:
+            return self._lazy_messages(group_names, group_data)
         return self._create_messages(group_names, group_data)
 
-    def compile_dm_messages(self):
+    def compile_dm_messages(self, lazy=False):
         # Gets list of dm objects with dm ID and array of members ids
         dm_data = self._read_from_json("dms.json")
         dm_ids = [c["id"] for c in dm_data.values()]
 
         # True is passed here to let the create messages function know that
         # it is dm data being passed to it
+        if lazy:
+            return self._lazy_messages(dm_ids, dm_data, True)
         return self._create_messages(dm_ids, dm_data, True)
 
     def compile_dm_users(self):
@@ -124,19 +253,21 @@ class Reader(object):
                         users = dm["members"]
                     if "user" in dm:
                         users = [dm["user"]]
-                    dm_members = {"id": dm["id"], "users": [self.__USER_DATA.setdefault(m, deleted_user(m)) for m in users]}
+                    dm_members = {"id": dm["id"], "users": [self._directory.user(m) for m in users]}
                     all_dms_users.append(dm_members)
                 except KeyError:
                     dm_members = None
 
         return all_dms_users
 
-    def compile_mpim_messages(self):
+    def compile_mpim_messages(self, lazy=False):
         """Return multiple person DM groups"""
 
         mpim_data = self._read_from_json("mpims.json")
         mpim_names = [c["name"] for c in mpim_data.values()]
 
+        if lazy:
+            return self._lazy_messages(mpim_names, mpim_data)
         return self._create_messages(mpim_names, mpim_data)
 
     def compile_mpim_users(self):
@@ -158,7 +289,7 @@ class Reader(object):
         all_mpim_users = []
 
         for mpim in mpims:
-            mpim_members = {"name": mpim["name"], "users": [] if "members" not in mpim.keys() else [self.__USER_DATA.setdefault(m, deleted_user(m)) for m in mpim["members"]]}
+            mpim_members = {"name": mpim["name"], "users": [] if "members" not in mpim.keys() else [self._directory.user(m) for m in mpim["members"]]}
             all_mpim_users.append(mpim_members)
 
         return all_mpim_users
@@ -179,6 +310,24 @@ class Reader(object):
         """Returns the archive path"""
         return self._PATH
 
+    def archive(self):
+        """Returns the backend the archive's files are read through"""
+        return self._archive
+
+    def thumbnails(self):
+        """Returns the thumbnailer of the archive's attachments, None if disabled"""
+        return self._thumbnails
+
+    def reopen_archive(self):
+        """
+        Switches the reader and its thumbnailer to a backend of their own, for
+        use in a forked process, and returns it. See ZipArchive.reopen.
+        """
+        self._archive = self._archive.reopen()
+        if self._thumbnails is not None:
+            self._thumbnails.use_archive(self._archive)
+        return self._archive
+
     def warn_not_found_to_hide_channels(self):
         """Print error if not all channels to hide have been found"""
         if self._remaining_unhidden_channels:
@@ -205,12 +354,153 @@ class Reader(object):
         :rtype: object
         """
 
-        chats = {}
+        cached = {}
         empty_dms = []
-        formatter = SlackFormatter(self.__USER_DATA, data)
+        formatter = self._formatter
+        channel_name_to_id = self._channel_name_to_id(data)
+
+        to_parse = []
+        for name in names:
+            messages = self._load_cached(name, channel_name_to_id[name], formatter)
+            if messages is not None:
+                cached[name] = messages
+            else:
+                to_parse.append(name)
+
+        chats = self._create_conversations(to_parse, channel_name_to_id, formatter)
+
+        # this is where it's skipping the empty directories
+        if isDms:
+            empty_dms = [name for name in to_parse if name not in chats]
 
-        # Channel name to channel id mapping. Needed to create a messages
-        # permalink with at least slackdump exports
+        parsed_names = list(chats.keys())
+        chats = self._build_threads(chats)
+        for name in parsed_names:
+            self._store_cached(name, channel_name_to_id[name], chats.get(name, []))
+
+        # _build_threads drops conversations without recent messages with
+        # --since/--until; cached conversations are stored empty in that case
+        for name, messages in cached.items():
+            if messages or not self._has_timeframe():
+                chats[name] = messages
+        chats = {name: chats[name] for name in names if name in chats}
+
+        if isDms:
+            self._EMPTY_DMS = empty_dms
+
+        return chats
+
+    def _lazy_messages(self, names, data, isDms=False):
+        """
+        Lazy counterpart of _create_messages: only checks which conversations
+        have day files and returns a ConversationMap that compiles and threads
+        each conversation on first access.
+
+        :param [str] names: names of each group of messages
+
+        :param [object] data: array of objects detailing where to get the messages from in
+        the directory structure
+
+        :param bool isDms: boolean value used to tell if the data is dm data so the function can
+        collect the empty dm directories and store them in memory only
+
+        :return: mapping of conversation name to array of messages
+
+        :rtype: ConversationMap
+        """
+
+        formatter = self._formatter
+        channel_name_to_id = self._channel_name_to_id(data)
+
+        non_empty = [name for name in names if self._day_files(name)]
+        if isDms:
+            self._EMPTY_DMS = sorted(set(names) - set(non_empty))
+        if self._has_timeframe():
+            # Conversations without day files in the timeframe have no
+            # messages to show
+            non_empty = [name for name in non_empty if self._split_day_files(self._day_files(name))[1]]
+
+        def load(name):
+            messages = self._load_cached(name, channel_name_to_id[name], formatter)
+            if messages is None:
+                chats = self._create_conversations([name], channel_name_to_id, formatter)
+                messages = self._build_threads(chats).get(name, [])
+                self._store_cached(name, channel_name_to_id[name], messages)
+            return messages
+
+        return ConversationMap(non_empty, load, self._config.max_loaded)
+
+    def _load_cached(self, name, channel_id, formatter):
+        """
+        Rebuilds a compiled conversation from the parsed archive cache
+
+        :return: array of threaded messages or None if not cached
+
+        :rtype: [Message]
+        """
+        if not self._cache:
+            return None
+
+        fingerprint = self._fingerprint(name)
+        if fingerprint is None:
+            return None
+
+        records = self._cache.load(self._cache_key(name, channel_id), fingerprint)
+        METRICS.inc("parse_cache_total", result="miss" if records is None else "hit")
+        if records is None:
+            return None
+
+        messages = []
+        for d, is_thread_msg, is_recent_msg in records:
+            self._directory.add_bot(d)
+            msg_obj = Message(formatter, d, channel_id, self._slack_name)
+            msg_obj.is_thread_msg = is_thread_msg
+            msg_obj.is_recent_msg = is_recent_msg
+            messages.append(msg_obj)
+        METRICS.inc("messages_built_total", len(messages))
+        return messages
+
+    def _store_cached(self, name, channel_id, messages):
+        """Saves a compiled conversation to the parsed archive cache"""
+        if not self._cache:
+            return
+
+        fingerprint = self._fingerprint(name)
+        if fingerprint is not None:
+            self._cache.store(
+                self._cache_key(name, channel_id),
+                fingerprint,
+                [(m._message, m.is_thread_msg, m.is_recent_msg) for m in messages]
+            )
+
+    def _fingerprint(self, name):
+        """
+        Returns the fingerprint of a conversation's day files (names, sizes and
+        CRCs or modification times) or None if it has no day files
+        """
+        day_files = self._day_files(name)
+        if not day_files:
+            return None
+        return self._archive.fingerprint(day_files)
+
+    def _render_cache_metrics(self):
+        info = self._formatter.render_cache_info()
+        return [
+            ("render_text_cache_total", {"result": "hit"}, info.hits),
+            ("render_text_cache_total", {"result": "miss"}, info.misses),
+        ]
+
+    @staticmethod
+    def _cache_key(name, channel_id):
+        # Channel ids are unique across workspaces, names are not
+        return "{}/{}".format(channel_id, name)
+
+    @staticmethod
+    def _channel_name_to_id(data):
+        """
+        Channel name to channel id mapping. Needed to create a messages
+        permalink with at least slackdump exports
+        """
         channel_name_to_id = {}
         for c in data.values():
             if "name" in c:
@@ -219,42 +509,178 @@ class Reader(object):
                 # direct messages have no channel name and are also
                 # stored with the the id's folder.
                 channel_name_to_id[c["id"]] = c["id"]
+        return channel_name_to_id
 
-        for name in names:
-            # gets path to dm directory that holds the json archive
-            dir_path = os.path.join(self._PATH, name)
-            messages = []
-            # array of all days archived
-            day_files = glob.glob(os.path.join(dir_path, "*.json"))
-
-            # this is where it's skipping the empty directories
-            if not day_files:
-                if isDms:
-                    empty_dms.append(name)
-                continue
+    def _day_files(self, name):
+        """Returns the sorted archive paths of all day files of a conversation"""
+        return self._archive.list_json(name)
 
-            for day in sorted(day_files):
-                with io.open(os.path.join(self._PATH, day), encoding="utf8") as f:
-                    # loads all messages
-                    day_messages = json.load(f)
+    def _has_timeframe(self):
+        return bool(self._since or self._until)
 
-                    # sorts the messages in the json file
-                    day_messages.sort(key=Reader._extract_time)
+    @staticmethod
+    def _day_file_date(path):
+        """Date of a YYYY-MM-DD.json day file, None for other file names"""
+        try:
+            return datetime.date.fromisoformat(os.path.basename(path)[:-len(".json")])
+        except ValueError:
+            return None
 
-                    c_id = channel_name_to_id[name]
-                    for d in day_messages:
-                        msg_obj = Message(formatter, d, c_id, self._slack_name)
-                        if self._filter_user(msg_obj):
-                            messages.append(msg_obj)
+    def _split_day_files(self, day_files):
+        """
+        Splits a conversation's day files into those before the --since/--until
+        timeframe and those that may hold messages within it. Day files are
+        named after their date in the workspace's time zone, so the timeframe
+        is widened by a day on both ends; files not named after a date are
+        always read.
 
-            chats[name] = messages
-        chats = self._build_threads(chats)
+        :param [str] day_files: sorted day file paths
 
-        if isDms:
-            self._EMPTY_DMS = empty_dms
+        :return: day files before the timeframe and day files to read
+
+        :rtype: ([str], [str])
+        """
+        if not self._has_timeframe():
+            return [], day_files
+
+        first = self._since.date() - datetime.timedelta(days=1) if self._since else None
+        last = self._until.date() + datetime.timedelta(days=1) if self._until else None
+        older, selected = [], []
+        for path in day_files:
+            date = self._day_file_date(path)
+            if date is None:
+                selected.append(path)
+            elif first is not None and date < first:
+                older.append(path)
+            elif last is None or date <= last:
+                selected.append(path)
+        return older, selected
+
+    def _thread_parent_files(self, older_files, messages):
+        """
+        Returns the day files before the timeframe that have to be read to
+        find the parents (and earlier replies) of threads replied to within it
+
+        :param [str] older_files: sorted day files before the timeframe
+
+        :param [dict] messages: raw messages read from the timeframe's day files
+        """
+        if not older_files:
+            return []
+
+        present = {m.get('ts') for m in messages}
+        missing = [
+            float(m['thread_ts']) for m in messages
+            if m.get('thread_ts') and m['thread_ts'] != m.get('ts') and m['thread_ts'] not in present
+        ]
+        if not missing:
+            return []
+
+        first = datetime.date.fromtimestamp(min(missing)) - datetime.timedelta(days=1)
+        return [path for path in older_files if self._day_file_date(path) >= first]
+
+    def _create_conversations(self, names, channel_name_to_id, formatter):
+        """
+        Reads all day files of the given conversations into Message objects
 
+        :param [str] names: names (or ids for dms) of the conversation directories
+
+        :param dict channel_name_to_id: conversation name to id, used for permalinks
+
+        :param SlackFormatter formatter: formatter shared by the conversations' messages
+
+        :return: object of arrays of messages (not yet threaded). Conversations
+        without day files are left out. With --since/--until, only day files
+        around the timeframe and those holding the start of its threads are read.
+
+        :rtype: object
+        """
+        day_files = {}
+        older_files = {}
+        for name in names:
+            files = self._day_files(name)
+            if files:
+                older_files[name], day_files[name] = self._split_day_files(files)
+
+        day_messages = self._read_day_files({name: files for name, files in day_files.items() if files})
+
+        # Threads with replies in the timeframe may have started before it
+        lookback = {}
+        for name, older in older_files.items():
+            files = self._thread_parent_files(older, day_messages.get(name, []))
+            if files:
+                lookback[name] = files
+        for name, messages in self._read_day_files(lookback).items():
+            day_messages[name] = messages + day_messages.get(name, [])
+
+        chats = {}
+        with METRICS.timed("build_messages"):
+            for name in day_files:
+                channel_id = channel_name_to_id[name]
+                messages = []
+                for d in day_messages.get(name, []):
+                    self._directory.add_bot(d)
+                    msg_obj = Message(formatter, d, channel_id, self._slack_name)
+                    if self._filter_user(msg_obj):
+                        messages.append(msg_obj)
+                chats[name] = messages
+                METRICS.inc("messages_built_total", len(messages))
         return chats
 
+    def _read_day_files(self, day_files):
+        """
+        Parses and sorts the day files of conversations. With more than one
+        worker configured, the day files are split into chunks that are parsed
+        across a process pool; results are merged back in date order.
+
+        :param dict day_files: conversation name to its sorted day file paths
+
+        :return: conversation name to its raw messages in order
+
+        :rtype: dict
+        """
+        chunks = [
+            (name, files[i:i + self._DAY_FILE_CHUNK])
+            for name, files in day_files.items()
+            for i in range(0, len(files), self._DAY_FILE_CHUNK)
+        ]
+        workers = self._config.workers or 1
+
+        with METRICS.timed("parse"):
+            # Daemonic processes, such as the page workers of a static site
+            # build, can't start worker processes of their own
+            parallel = workers > 1 and len(chunks) > 1 and not multiprocessing.current_process().daemon
+            if parallel and self._day_files_size(day_files) >= self._PARALLEL_PARSE_THRESHOLD:
+                # map() yields results in submission order, which keeps the
+                # merge below deterministic
+                results = list(self._day_file_pool().map(_read_day_files, [files for _, files in chunks]))
+            else:
+                results = [_read_day_files(files, self._archive, self._json_decoder) for _, files in chunks]
+
+        day_messages = {name: [] for name in day_files}
+        for (name, files), (messages, parsed) in zip(chunks, results):
+            day_messages[name].extend(messages)
+            METRICS.inc("archive_files_read_total", len(files))
+            METRICS.inc("archive_bytes_parsed_total", parsed)
+        return day_messages
+
+    def _day_file_pool(self):
+        """Returns the day file worker processes, starting them if needed"""
+        with self._pool_lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                # Forked processes, such as the workers of --serve, can't use
+                # their parent's pool
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self._config.workers,
+                    initializer=_init_day_file_worker,
+                    initargs=(self._archive, self._json_decoder),
+                )
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _day_files_size(self, day_files):
+        return sum(self._archive.size(f) for files in day_files.values() for f in files)
+
     def _filter_user(self, msg_obj):
         if not self.filter_user_attribute:
             return True
@@ -281,87 +707,113 @@ class Reader(object):
 
     def _build_threads(self, channel_data):
         """
-        Re-orders the JSON to allow for thread building.
+        Re-orders the messages of each conversation so thread replies directly
+        follow their parent message.
 
         :param [dict] channel_data: dictionary of all Slack channels and messages
 
         :return: None
         """
-        for channel_name in channel_data.keys():
-            replies = {}
+        with METRICS.timed("threads"):
+            for channel_name in channel_data.keys():
+                channel_data[channel_name] = self._thread_messages(channel_data[channel_name])
 
-            user_ts_lookup = {}
-            items_to_remove = []
-            for i, m in enumerate(channel_data[channel_name]):
-                user = m._message.get('user')
-                ts = m._message.get('ts')
+            if self._has_timeframe():
+                channel_data = self._message_filter_timeframe(channel_data.copy())
 
-                if user is None or ts is None:
-                    continue
+        return channel_data
 
-                k = (user, ts)
-                if k not in user_ts_lookup:
-                    user_ts_lookup[k] = []
-                user_ts_lookup[k].append((i, m))
+    def _thread_messages(self, messages):
+        """
+        Groups the replies of a conversation under their threads in a single
+        pass.
 
-            for location, message in enumerate(channel_data[channel_name]):
-                # remove "<user> joined/left <channel>" message
-                if self._config.skip_channel_member_change and message._message.get('subtype') in ['channel_join', 'channel_leave']:
-                    items_to_remove.append(location)
-                    continue
+        Replies are recognised by a thread_ts pointing at another message of
+        the conversation, or, for exports without it, by the user and ts
+        listed in their parent's legacy "replies" array. Replies keep their
+        relative order and replies of replies are flattened into the thread.
 
-                #   If there's a "reply_count" key, generate a list of user and timestamp dictionaries
-                if 'reply_count' in message._message or 'replies' in message._message:
-                    #   Identify and save where we are
-                    reply_list = []
-                    for reply in message._message.get('replies', []):
-                        reply_list.append(reply)
-                    reply_objects = []
-                    for item in reply_list:
-                        item_lookup_key = (item.get('user'), item.get('ts'))
-                        item_replies = user_ts_lookup.get(item_lookup_key)
-                        if item_replies is not None:
-                            reply_objects.extend(item_replies)
-
-                    if not reply_objects:
-                        continue
-
-                    sorted_reply_objects = sorted(reply_objects, key=lambda tup: tup[0])
-                    for reply_obj_tuple in sorted_reply_objects:
-                        items_to_remove.append(reply_obj_tuple[0])
-                    replies[location] = [tup[1] for tup in sorted_reply_objects]
-
-            # Create an OrderedDict of thread locations and replies in reverse numerical order
-            sorted_threads = OrderedDict(sorted(replies.items(), reverse=True))
-
-            for idx_to_remove in sorted(items_to_remove, reverse=True):
-                # threads location hotfix
-                channel_data[channel_name][idx_to_remove] = {'user': -1}
-
-            # Iterate through the threads and insert them back into channel_data[channel_name] in response order
-            for grouping in sorted_threads.items():
-                location = grouping[0] + 1
-                for reply in grouping[1]:
-                    msgtext = reply._message.get("text")
-                    if not msgtext or not reply.is_thread_msg:
-                        # keep it mostly for backward compatibility
-                        if self._config.thread_note:
-                            reply._message["text"] = f"**Thread Reply:** {msgtext}"
-                        reply.is_thread_msg = True
-
-                    channel_data[channel_name].insert(location, reply)
-                    location += 1
-            # threads location hotfix
-            data_with_sorted_threads = []
-            for i, item in enumerate(channel_data[channel_name]):
-                if isinstance(item, Message):
-                    data_with_sorted_threads.append(item)
-            channel_data[channel_name] = data_with_sorted_threads.copy()
-
-        if self._since:
-            channel_data = self._message_filter_timeframe(channel_data.copy())
+        :param [Message] messages: messages of a conversation in time order
 
-        return channel_data
+        :return: messages with each thread's replies following its parent
+
+        :rtype: [Message]
+        """
+        if self._config.skip_channel_member_change:
+            # remove "<user> joined/left <channel>" message
+            messages = [
+                m for m in messages
+                if m._message.get('subtype') not in ('channel_join', 'channel_leave')
+            ]
+
+        # Thread parents by their ts, and parents of legacy replies by (user, ts)
+        parents = {}
+        legacy_parents = {}
+        for i, m in enumerate(messages):
+            ts = m._message.get('ts')
+            if 'reply_count' in m._message or 'replies' in m._message or m._message.get('thread_ts') == ts:
+                parents.setdefault(ts, i)
+                for reply in m._message.get('replies', ()):
+                    legacy_parents.setdefault((reply.get('user'), reply.get('ts')), i)
+
+        replies = {}
+        is_reply = [False] * len(messages)
+        for i, m in enumerate(messages):
+            ts = m._message.get('ts')
+            thread_ts = m._message.get('thread_ts')
+            parent = None
+            if thread_ts is not None and thread_ts != ts:
+                parent = parents.get(thread_ts)
+            if parent is None:
+                parent = legacy_parents.get((m._message.get('user'), ts))
+            if parent is not None and parent != i:
+                replies.setdefault(parent, []).append(i)
+                is_reply[i] = True
+
+        threaded = []
+        for i, m in enumerate(messages):
+            if is_reply[i]:
+                continue
+            threaded.append(m)
+            if i not in replies:
+                continue
+
+            # Depth first, so nested replies follow the reply they belong to
+            pending = list(reversed(replies[i]))
+            seen = {i}
+            while pending:
+                j = pending.pop()
+                if j in seen:
+                    continue
+                seen.add(j)
+                reply = messages[j]
+                msgtext = reply._message.get("text")
+                if not msgtext or not reply.is_thread_msg:
+                    # keep it mostly for backward compatibility
+                    if self._config.thread_note:
+                        reply._message["text"] = f"**Thread Reply:** {msgtext}"
+                    reply.is_thread_msg = True
+                threaded.append(reply)
+                pending.extend(reversed(replies.get(j, ())))
+
+        METRICS.inc("threads_assembled_total", len(replies))
+        return threaded
+
+    def _custom_emoji(self):
+        """
+        Custom emoji of the workspace from emoji.json, which exports do not
+        always include: name to image URL or "alias:<name>", optionally
+        wrapped like Slack's emoji.list response
+
+        :rtype: dict
+        """
+        if not self._archive.exists("emoji.json"):
+            return {}
+        with self._archive.open("emoji.json") as f:
+            custom = json_decoder.load(f, self._json_decoder)
+        if isinstance(custom, dict) and isinstance(custom.get("emoji"), dict):
+            custom = custom["emoji"]
+        return custom if isinstance(custom, dict) else {}
 
     def _read_from_json(self, file):
         """
@@ -374,70 +826,70 @@ class Reader(object):
         :rtype: object
         """
 
-        try:
-            with io.open(os.path.join(self._PATH, file), encoding="utf8") as f:
-                return {u["id"]: u for u in json.load(f)}
-        except IOError:
-            return {}
+        if file not in self._json_files:
+            try:
+                with self._archive.open(file) as f:
+                    self._json_files[file] = {u["id"]: u for u in json_decoder.load(f, self._json_decoder)}
+            except IOError:
+                self._json_files[file] = {}
+        return self._json_files[file]
 
     def _message_filter_timeframe(self, channel_data):
         """
-        It might be more efficient to filter the messages in the thread sorting
-        loop. Yet, this is a more straightforward approach, especially factoring
-        in the thread/non-thread message ids etc.
+        Keeps the messages within --since/--until, along with the earlier
+        messages of each thread that has a message within it. Replies after
+        --until are always dropped: only the day files up to a day past it are
+        read, so keeping them would depend on when the reply was posted.
+        Kept messages outside the timeframe are flagged with
+        is_recent_msg = False for rendering. Conversations left without
+        messages are removed.
 
         Messages & threads need to be provided in a sorted form
         """
-        for channel in channel_data.keys():
-            messages_in_thread = []
-            last_thread_message_in_timeframe = False
-            delete_messages = []
-
-            for location, message in enumerate(channel_data[channel]):
-                is_msg_in_timeframe = self._message_in_timeframe(message)
-
-                # Update message object for representation differences
-                # at rendering
-                if not is_msg_in_timeframe:
-                    message.is_recent_msg = False
+        for channel in list(channel_data.keys()):
+            kept = []
+            thread = []
+            thread_in_timeframe = False
 
+            for message in channel_data[channel]:
                 # new main message
                 if not message.is_thread_msg:
-                    if not last_thread_message_in_timeframe:
-                        delete_messages.extend(messages_in_thread)
-                    messages_in_thread = [location]
-                # Thread message
-                else:
-                    messages_in_thread.append(location)
+                    if thread_in_timeframe:
+                        kept.extend(thread)
+                    thread = []
+                    thread_in_timeframe = False
+                elif self._until_ts is not None and message.ts >= self._until_ts:
+                    continue
 
-                last_thread_message_in_timeframe = is_msg_in_timeframe
+                if self._message_in_timeframe(message):
+                    thread_in_timeframe = True
+                else:
+                    message.is_recent_msg = False
+                thread.append(message)
 
             # Last thread/message...
-            if not last_thread_message_in_timeframe:
-                delete_messages.extend(messages_in_thread)
+            if thread_in_timeframe:
+                kept.extend(thread)
 
-            # Remove all messages that are not in the timeframe
-            for loc in sorted(delete_messages, reverse=True):
-                del channel_data[channel][loc]
-
-        # remove channels without recent message
-        for channel in list(channel_data.keys()):
-            if not channel_data[channel]:
+            # remove channels without recent message
+            if kept:
+                channel_data[channel] = kept
+            else:
                 del channel_data[channel]
 
         return channel_data
 
     def _message_in_timeframe(self, msg):
         """
-        Returns true if message timestamp is older as since
+        Returns true if the message timestamp is after --since and before the
+        end of --until
         """
-        if not self._since:
-            return True
-
-        ts = msg._message.get('ts')
-        ts_obj = datetime.datetime.fromtimestamp(float(ts))
-
-        return self._since < ts_obj
+        ts = msg.ts
+        if self._since_ts is not None and ts <= self._since_ts:
+            return False
+        if self._until_ts is not None and ts >= self._until_ts:
+            return False
+        return True
 
     def _get_slack_name(self):
         """
@@ -0,0 +1,313 @@
+import logging
+import contextlib
+import functools
+import os
+import queue
+import sqlite3
+import threading
+
+from markupsafe import escape
+
+from slackviewer.cache import options_key
+from slackviewer.constants import SLACKVIEWER_TEMP_PATH
+from slackviewer.conversations import ConversationMap
+
+
+class SearchIndex(object):
+    """
+    Full-text index over the archive's messages, backed by a SQLite FTS5 table.
+
+    Conversations are indexed one at a time (see index_in_background), each in
+    its own transaction, so searches work while the index is still being built
+    and an index stored on disk survives restarts.
+
+    Lazily loaded conversations are only indexed once something loads them,
+    so indexing never compiles the whole archive or churns --max-loaded.
+    """
+
+    # Markers put around matches by snippet(); replaced by <mark> after escaping
+    _MATCH_START = "\x02"
+    _MATCH_END = "\x03"
+
+    def __init__(self, db_path=":memory:"):
+        """
+        :param str db_path: SQLite database file, in memory by default
+        """
+        self._db_path = db_path
+        self._lock = threading.Lock()
+        self._db = self._connect()
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5("
+                "text, username, conversation, "
+                "kind UNINDEXED, message_id UNINDEXED, time UNINDEXED, ts UNINDEXED)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS indexed ("
+                "kind TEXT NOT NULL, conversation TEXT NOT NULL, "
+                "PRIMARY KEY (kind, conversation))"
+            )
+        # (kind, name, messages) of the conversations to index, consumed by
+        # the indexing thread
+        self._queue = queue.Queue()
+        # (kind, name) of the queued conversations not indexed yet, and in a
+        # forked worker those the parent process was still indexing
+        self._queued = set()
+        self._parent_queued = set()
+        self._queued_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        # (kind, name) of the lazy conversations not indexed nor loaded yet
+        self._unloaded = set()
+
+    @classmethod
+    def for_archive(cls, archive_sha, config):
+        """
+        Returns the index stored in the archive's cache directory, or an
+        in-memory index for archives without a SHA (plain directories)
+
+        :param str archive_sha: SHA of the archive, may be None
+
+        :param Config config: Config whose output affecting options key the index
+        """
+        if not archive_sha:
+            return cls()
+        search_dir = os.path.join(SLACKVIEWER_TEMP_PATH, archive_sha, "search")
+        os.makedirs(search_dir, exist_ok=True)
+        return cls(os.path.join(search_dir, options_key(config) + ".sqlite"))
+
+    ##################
+    # Public Methods #
+    ##################
+
+    def is_indexed(self, kind, name):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM indexed WHERE kind = ? AND conversation = ?", (kind, name)
+            ).fetchone()
+        return row is not None
+
+    def index_conversation(self, kind, name, messages):
+        """
+        Adds all messages of a conversation to the index
+
+        :param str kind: conversation kind (channel, group, dm or mpim)
+
+        :param str name: name (or id for dms) of the conversation
+
+        :param [Message] messages: compiled messages of the conversation
+        """
+        rows = [
+            (self._message_text(m), self._username(m), name, kind, m.id, m.time, m._message.get("ts"))
+            for m in messages
+        ]
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM messages WHERE kind = ? AND conversation = ?", (kind, name)
+            )
+            self._db.executemany(
+                "INSERT INTO messages (text, username, conversation, kind, message_id, time, ts) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO indexed (kind, conversation) VALUES (?, ?)", (kind, name)
+            )
+
+    def index_in_background(self, conversations):
+        """
+        Indexes conversations that are not indexed yet in a daemon thread.
+        Conversations of a lazy ConversationMap are queued when they are
+        loaded instead of being loaded for the index.
+
+        :param [(str, Mapping)] conversations: pairs of conversation kind and
+        mapping of conversation name to its messages
+        """
+        for kind, mapping in conversations:
+            names = [name for name in mapping if not self.is_indexed(kind, name)]
+            if isinstance(mapping, ConversationMap):
+                self._unloaded.update((kind, name) for name in names)
+                mapping.on_load(functools.partial(self._on_load, kind))
+            else:
+                for name in names:
+                    self._enqueue(kind, name, mapping[name])
+        self._start()
+
+    @property
+    def pending(self):
+        """Number of loaded conversations still waiting to be indexed"""
+        with self._queued_lock:
+            if self._parent_queued:
+                self._parent_queued = {key for key in self._parent_queued if not self.is_indexed(*key)}
+            return len(self._queued) + len(self._parent_queued)
+
+    @property
+    def persistent(self):
+        """True if the index is stored on disk, where other processes see it grow"""
+        return self._db_path != ":memory:"
+
+    @property
+    def unloaded(self):
+        """Number of lazy conversations indexed once they are first loaded"""
+        return len(self._unloaded)
+
+    def wait(self):
+        """Blocks until the conversations queued so far are indexed"""
+        self._queue.join()
+
+    @contextlib.contextmanager
+    def paused(self):
+        """
+        Keeps the indexing thread out of SQLite, so a process forked meanwhile
+        doesn't inherit SQLite's locks held
+        """
+        with self._lock:
+            yield
+
+    def reopen(self):
+        """
+        Opens a new connection to an index stored on disk, for use in a
+        forked process. In-memory indexes keep the inherited copy.
+
+        The indexing thread isn't inherited: the parent process goes on
+        indexing the conversations it queued, and this process sees them
+        once they are committed. A new thread indexes the conversations this
+        process loads.
+        """
+        self._queue = queue.Queue()
+        self._queued_lock = threading.Lock()
+        self._parent_queued, self._queued = self._queued, set()
+        if self._thread is not None:
+            self._start()
+        if not self.persistent:
+            return
+        self._lock = threading.Lock()
+        self._db = self._connect()
+
+    def close(self):
+        """
+        Stops the indexing thread, dropping the conversations it hasn't
+        indexed yet, and closes the database
+        """
+        self._closed = True
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        with self._lock:
+            self._db.close()
+
+    def search(self, query, page=1, per_page=50):
+        """
+        Returns the ranked hits of a query
+
+        :param str query: words to search for; all of them must match
+
+        :param int page: 1-based page of hits to return
+
+        :param int per_page: number of hits per page
+
+        :return: hits of the page and total number of hits. Each hit is a dict
+        with kind, conversation, message_id, time, username and an HTML snippet.
+
+        :rtype: ([dict], int)
+        """
+        match = self._match_expression(query)
+        if not match:
+            return [], 0
+
+        with self._lock:
+            total = self._db.execute(
+                "SELECT count(*) FROM messages WHERE messages MATCH ?", (match,)
+            ).fetchone()[0]
+            rows = self._db.execute(
+                "SELECT kind, conversation, message_id, time, username, "
+                "snippet(messages, 0, ?, ?, '…', 24) "
+                "FROM messages WHERE messages MATCH ? "
+                "ORDER BY rank LIMIT ? OFFSET ?",
+                (self._MATCH_START, self._MATCH_END, match, per_page, (page - 1) * per_page)
+            ).fetchall()
+
+        hits = [
+            {
+                "kind": kind,
+                "conversation": conversation,
+                "message_id": message_id,
+                "time": time,
+                "username": username,
+                "snippet": self._render_snippet(snippet),
+            }
+            for kind, conversation, message_id, time, username, snippet in rows
+        ]
+        return hits, total
+
+    ###################
+    # Private Methods #
+    ###################
+
+    def _connect(self):
+        db = sqlite3.connect(self._db_path, check_same_thread=False)
+        if self.persistent:
+            # Searches in other processes don't wait for the indexing
+            # transactions
+            db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name="slackviewer-search-index", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            kind, name, messages = item
+            if not self._closed:
+                try:
+                    self.index_conversation(kind, name, messages)
+                except Exception:
+                    logging.exception("Failed to index %s %s", kind, name)
+            with self._queued_lock:
+                self._queued.discard((kind, name))
+                if not self._queued and not self._unloaded:
+                    logging.info("Search index complete")
+            self._queue.task_done()
+
+    def _enqueue(self, kind, name, messages):
+        with self._queued_lock:
+            self._queued.add((kind, name))
+        self._queue.put((kind, name, messages))
+
+    def _on_load(self, kind, name, messages):
+        if (kind, name) in self._unloaded:
+            self._unloaded.discard((kind, name))
+            self._enqueue(kind, name, messages)
+
+    @staticmethod
+    def _message_text(message):
+        """Plain searchable text of a message, its attachments and files"""
+        raw = message._message
+        parts = [raw.get("text") or ""]
+        for attachment in raw.get("attachments", []):
+            parts.append(attachment.get("fallback") or attachment.get("text") or "")
+        for f in raw.get("files", []):
+            parts.append(f.get("title") or f.get("name") or "")
+        return "\n".join(p for p in parts if p)
+
+    @staticmethod
+    def _username(message):
+        # username raises for messages whose user can't be found at all
+        try:
+            return message.username or ""
+        except AttributeError:
+            return ""
+
+    @staticmethod
+    def _match_expression(query):
+        """Quotes each word of the query so FTS5 syntax can't cause errors"""
+        words = (query or "").split()
+        return " ".join('"{}"'.format(w.replace('"', '""')) for w in words)
+
+    def _render_snippet(self, snippet):
+        html = str(escape(snippet or ""))
+        return html.replace(self._MATCH_START, "<mark>").replace(self._MATCH_END, "</mark>")
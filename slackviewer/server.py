@@ -0,0 +1,284 @@
+import concurrent.futures
+import contextlib
+import gc
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler, get_sockaddr, select_address_family
+
+from slackviewer.app import reopen_app
+from slackviewer.mounts import ArchiveMounts
+
+
+# Seconds workers get to finish their requests when stopped or replaced
+# before they are killed
+GRACEFUL_TIMEOUT = 30
+
+# Seconds a connection may stay idle before it is closed
+REQUEST_TIMEOUT = 30
+
+
+class _RequestHandler(WSGIRequestHandler):
+    # One request per connection, so idle keep-alive connections don't hold
+    # on to pool threads or delay restarts
+    protocol_version = "HTTP/1.0"
+    timeout = REQUEST_TIMEOUT
+
+
+class _PooledWSGIServer(BaseWSGIServer):
+    """
+    WSGI server of a worker process, handling requests in a thread pool.
+    It only accepts a connection when a thread is free to handle it, leaving
+    the others to idle workers.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads, fd):
+        super().__init__(host, port, app, handler=_RequestHandler, fd=fd)
+        # Every worker wakes up for a new connection but only one accepts it;
+        # the others must not block in accept() where shutdown() can't reach
+        self.socket.setblocking(False)
+        self._threads = threads
+        self._pool = None
+        self._free_threads = threading.Semaphore(threads)
+
+    def serve_forever(self, poll_interval=0.5):
+        # Leaving the pool waits for the accepted requests to finish
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self._threads, thread_name_prefix="slackviewer-request"
+        ) as self._pool:
+            super().serve_forever(poll_interval)
+
+    def get_request(self):
+        # Waits a little for a free thread, then goes back to serve_forever()
+        # so shutdown() isn't delayed; the connection stays queued on the
+        # socket for any worker to accept
+        if not self._free_threads.acquire(timeout=0.1):
+            raise BlockingIOError("every request thread is busy")
+        try:
+            return super().get_request()
+        except OSError:
+            self._free_threads.release()
+            raise
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._free_threads.release()
+
+
+class PreforkServer(object):
+    """
+    Serves the viewer from several forked worker processes.
+
+    The archive is loaded once, in the parent process, before the workers are
+    forked, so they share the compiled conversations copy-on-write instead
+    of each reading the archive. The workers accept connections on a socket
+    the parent listens on, and handle them in a pool of threads.
+
+    The parent restarts workers that die. On SIGHUP it reloads the archive
+    and replaces the workers with new ones, letting the old ones finish
+    their requests first; on SIGTERM or SIGINT it stops them gracefully.
+    """
+
+    def __init__(self, app, host, port, processes, threads, reload=None):
+        """
+        :param app: configured viewer app, or ArchiveMounts whose archives
+        are loaded
+
+        :param str host: address to listen on
+
+        :param int port: port to listen on
+
+        :param int processes: number of worker processes
+
+        :param int threads: number of request threads per worker
+
+        :param callable reload: called without arguments to reload the
+        archive on SIGHUP
+        """
+        self._app = app
+        self._host = host
+        self._port = port
+        self._processes = processes
+        self._threads = threads
+        self._reload = reload
+        self._socket = None
+        # Worker pid to the generation it was forked in
+        self._workers = {}
+        self._generation = 0
+        self._signals = []
+
+    ##################
+    # Public Methods #
+    ##################
+
+    def serve_forever(self):
+        """Listens and runs the workers until SIGTERM or SIGINT"""
+        self._socket = self._listen()
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self._on_signal)
+        logging.warning(
+            "Serving on http://%s:%s with %d processes of %d threads",
+            self._host, self._port, self._processes, self._threads
+        )
+        self._spawn_generation()
+        try:
+            while True:
+                while self._signals:
+                    signum = self._signals.pop(0)
+                    if signum == signal.SIGHUP:
+                        self._restart()
+                    else:
+                        return
+                self._reap()
+                time.sleep(0.2)
+        finally:
+            self._stop(list(self._workers))
+            self._socket.close()
+
+    ###################
+    # Private Methods #
+    ###################
+
+    def _listen(self):
+        family = select_address_family(self._host, self._port)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(get_sockaddr(self._host, int(self._port), family))
+        sock.listen(socket.SOMAXCONN)
+        sock.set_inheritable(True)
+        return sock
+
+    def _on_signal(self, signum, frame):
+        self._signals.append(signum)
+
+    def _spawn_generation(self):
+        self._generation += 1
+        self._prepare_fork()
+        for _ in range(self._processes):
+            self._spawn()
+
+    def _viewers(self):
+        if isinstance(self._app, ArchiveMounts):
+            return self._app.loaded()
+        return [self._app]
+
+    def _search_indexes(self):
+        indexes = (getattr(viewer, "search_index", None) for viewer in self._viewers())
+        return [index for index in indexes if index is not None]
+
+    def _prepare_fork(self):
+        for search_index in self._search_indexes():
+            # An index on disk goes on being built by this process while the
+            # workers search it. Workers get a copy of an in-memory index
+            # instead, so it has to be complete first. Lazy conversations are
+            # indexed by the worker loading them.
+            if search_index.persistent:
+                continue
+            if search_index.pending:
+                logging.warning("Waiting for the search index before starting workers...")
+            search_index.wait()
+        # Keeps the garbage collector from writing to, and so copying, the
+        # pages of the loaded archive in every worker
+        gc.collect()
+        gc.freeze()
+
+    def _spawn(self):
+        with contextlib.ExitStack() as stack:
+            for search_index in self._search_indexes():
+                stack.enter_context(search_index.paused())
+            pid = os.fork()
+        if pid:
+            self._workers[pid] = self._generation
+            return
+        status = 0
+        try:
+            self._run_worker()
+        except BaseException:
+            logging.exception("Worker %d failed", os.getpid())
+            status = 1
+        finally:
+            os._exit(status)
+
+    def _run_worker(self):
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, signal.SIG_DFL)
+        for viewer in self._viewers():
+            reopen_app(viewer)
+
+        server = _PooledWSGIServer(self._host, self._port, self._app, self._threads, self._socket.fileno())
+
+        def stop(signum, frame):
+            # shutdown() waits for serve_forever() to return, so it can't be
+            # called from the thread running it
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        server.serve_forever()
+
+    def _restart(self):
+        logging.warning("Reloading the archive...")
+        if self._reload is not None:
+            gc.unfreeze()
+            try:
+                self._reload()
+            except Exception:
+                logging.exception("Reloading failed, keeping the running workers")
+                gc.freeze()
+                return
+        old = list(self._workers)
+        self._spawn_generation()
+        self._stop(old)
+
+    def _reap(self):
+        while self._workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if not pid:
+                return
+            generation = self._workers.pop(pid, None)
+            if generation == self._generation:
+                logging.warning(
+                    "Worker %d exited with code %d, restarting it", pid, os.waitstatus_to_exitcode(status)
+                )
+                self._spawn()
+
+    def _stop(self, pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + GRACEFUL_TIMEOUT
+        remaining = set(pids)
+        while remaining and time.monotonic() < deadline:
+            for pid in list(remaining):
+                if self._exited(pid):
+                    remaining.discard(pid)
+                    self._workers.pop(pid, None)
+            time.sleep(0.05)
+        for pid in remaining:
+            logging.warning("Worker %d did not stop in time, killing it", pid)
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            self._workers.pop(pid, None)
+
+    @staticmethod
+    def _exited(pid):
+        try:
+            return bool(os.waitpid(pid, os.WNOHANG)[0])
+        except ChildProcessError:
+            return True
@@ -0,0 +1,52 @@
+import re
+
+from markupsafe import Markup
+
+
+class Sidebar(object):
+    """
+    Pre-rendered sidebar HTML in which any conversation can be marked active.
+
+    The sidebar template is rendered once with a marker at the end of each
+    item's class attribute (see marker). The markers are stripped and their
+    offsets remembered, so highlighting the current conversation is a single
+    string splice instead of a render of the whole conversation list.
+    """
+
+    _MARKER = re.compile("\x00([^\x00]*)\x00")
+
+    def __init__(self, html):
+        """
+        :param str html: sidebar rendered with a marker for every conversation
+        """
+        parts = self._MARKER.split(str(html))
+        chunks = []
+        self._offsets = {}
+        length = 0
+        for i, part in enumerate(parts):
+            if i % 2:
+                # The first item of a conversation keeps the highlight, as a
+                # render of the full list would
+                self._offsets.setdefault(part, length)
+            else:
+                chunks.append(part)
+                length += len(part)
+        self._html = "".join(chunks)
+
+    @staticmethod
+    def marker(kind, name):
+        """Placeholder for the active class of a conversation's sidebar item"""
+        # Not escaped: markers never reach the page, and the name has to
+        # match the one looked up in render
+        return Markup("\x00{}:{}\x00".format(kind, name))
+
+    def render(self, kind=None, name=None):
+        """
+        Returns the sidebar with the given conversation's item marked active
+
+        :rtype: Markup
+        """
+        offset = self._offsets.get("{}:{}".format(kind, name))
+        if offset is None:
+            return Markup(self._html)
+        return Markup(self._html[:offset] + " active" + self._html[offset:])
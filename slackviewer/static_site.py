@@ -0,0 +1,158 @@
+import multiprocessing
+import os
+import shutil
+import time
+
+import flask
+
+from flask_frozen import patch_url_for
+
+from slackviewer.app import CONVERSATION_ENDPOINTS, reopen_app
+from slackviewer.conversations import page_bounds
+
+
+# Builder of a forked page rendering process, see StaticSiteBuilder.build
+_worker_builder = None
+
+
+def _init_page_worker():
+    # Lazily loaded conversations are read in the workers, which must not
+    # share the parent's zip file handle and its file offset
+    reopen_app(_worker_builder._app)
+
+
+def _build_conversation_pages(task):
+    return _worker_builder.build_conversation(*task)
+
+
+class StaticSiteBuilder(object):
+    """
+    Writes every page of the viewer as static HTML.
+
+    All pages are enumerated from the app's conversations: the index page and,
+    for every channel, group, dm and mpim, each page of its messages. Pages are
+    rendered by calling the view functions in a request context and written
+    straight to disk, optionally spread across forked worker processes that
+    share the already loaded archive.
+    """
+
+    def __init__(self, app, output_dir, workers=1):
+        """
+        :param Flask app: configured viewer app
+
+        :param str output_dir: directory the site is written to
+
+        :param int workers: number of processes rendering pages
+        """
+        self._app = app
+        self._output_dir = output_dir
+        self._workers = workers or 1
+
+    ##################
+    # Public Methods #
+    ##################
+
+    def build(self):
+        """Writes the static files and all pages, printing the time spent per page"""
+        started = time.perf_counter()
+        self._copy_static_files()
+
+        tasks = [("index", None)] + [
+            (kind, name)
+            for kind, conversations in self._conversations()
+            for name in conversations
+        ]
+
+        if self._workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+            # Forked workers inherit the loaded app and archive, nothing
+            # needs to be pickled but the task and its timings
+            global _worker_builder
+            _worker_builder = self
+            with multiprocessing.get_context("fork").Pool(self._workers, initializer=_init_page_worker) as pool:
+                results = pool.imap_unordered(_build_conversation_pages, tasks)
+                pages = self._report(results)
+        else:
+            pages = self._report(self.build_conversation(*task) for task in tasks)
+
+        print("Built {} pages in {:.2f}s to {}".format(
+            pages, time.perf_counter() - started, os.path.abspath(self._output_dir)
+        ))
+
+    def build_conversation(self, kind, name):
+        """
+        Renders and writes all pages of a conversation (or the index page)
+
+        :return: (path, seconds, bytes, written) of each page
+
+        :rtype: [(str, float, int, bool)]
+        """
+        if kind == "index":
+            return [self._build_page("/", "index", {})]
+
+        endpoint, arg = CONVERSATION_ENDPOINTS[kind]
+        messages = dict(self._conversations())[kind].get(name)
+        if messages is None:
+            # Lazily loaded conversation that turned out empty
+            return []
+        pages = len(page_bounds(messages, self._app.page_size))
+
+        results = [self._build_page(
+            "/{}/{}/".format(kind, name), endpoint, {arg: name}
+        )]
+        for page in range(2, pages + 1):
+            results.append(self._build_page(
+                "/{}/{}/page/{}/".format(kind, name, page), endpoint, {arg: name, "page": page}
+            ))
+        return results
+
+    ###################
+    # Private Methods #
+    ###################
+
+    def _conversations(self):
+        return [
+            ("channel", self._app.channels),
+            ("group", self._app.groups),
+            ("dm", self._app.dms),
+            ("mpim", self._app.mpims),
+        ]
+
+    def _build_page(self, url, endpoint, values):
+        """
+        Renders one page through its view function and writes it to
+        <output_dir>/<url>/index.html, leaving unchanged files untouched
+        """
+        started = time.perf_counter()
+        with self._app.test_request_context(url), patch_url_for(self._app):
+            response = self._app.view_functions[endpoint](**values)
+            content = flask.make_response(response).get_data()
+
+        path = os.path.join(self._output_dir, *url.strip("/").split("/"), "index.html")
+        try:
+            with open(path, 'rb') as f:
+                written = f.read() != content
+        except FileNotFoundError:
+            written = True
+        if written:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(content)
+
+        return path, time.perf_counter() - started, len(content), written
+
+    def _report(self, results):
+        """Prints the timing of each built page and returns the number of pages"""
+        pages = 0
+        for conversation_results in results:
+            for path, seconds, size, written in conversation_results:
+                pages += 1
+                print("{:8.1f} ms {:>8.1f} KB  {}{}".format(
+                    seconds * 1000, size / 1024.0,
+                    os.path.relpath(path, self._output_dir),
+                    "" if written else " (unchanged)"
+                ))
+        return pages
+
+    def _copy_static_files(self):
+        static_dir = os.path.join(self._output_dir, "static")
+        shutil.copytree(self._app.static_folder, static_dir, dirs_exist_ok=True)
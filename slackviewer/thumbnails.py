@@ -0,0 +1,167 @@
+import hashlib
+import logging
+import os
+import posixpath
+import threading
+
+from slackviewer.constants import SLACKVIEWER_TEMP_PATH
+from slackviewer.utils.six import to_bytes
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+
+# Longest side of generated thumbnails, in pixels
+THUMBNAIL_SIZE = 360
+
+
+class Thumbnailer(object):
+    """
+    Downscaled previews of the image attachments stored in an archive
+    (<conversation>/attachments/), so pages don't load the full-size
+    originals. Thumbnails are generated on first request and kept in the
+    archive's directory under the temp directory.
+
+    Generating thumbnails requires the optional Pillow package.
+    """
+
+    def __init__(self, archive, cache_dir, size=THUMBNAIL_SIZE):
+        """
+        :param archive: backend of the archive, see slackviewer.archive
+
+        :param str cache_dir: directory to store the thumbnails in
+
+        :param int size: longest side of the thumbnails, in pixels
+        """
+        self._archive = archive
+        self._cache_dir = cache_dir
+        self._size = size
+        # Part of thumbnail URLs, so they can be cached indefinitely
+        self._version = (archive.sha or self._path_digest(archive.path))[:12]
+
+    @classmethod
+    def for_archive(cls, archive):
+        """
+        Returns the thumbnailer of an archive, None if Pillow is not installed
+
+        :rtype: Thumbnailer
+        """
+        if Image is None:
+            return None
+        if archive.sha:
+            cache_dir = os.path.join(SLACKVIEWER_TEMP_PATH, archive.sha, "thumbnails")
+        else:
+            # Plain directories change in place; thumbnails are regenerated
+            # when their original is newer
+            cache_dir = os.path.join(SLACKVIEWER_TEMP_PATH, "thumbnails", cls._path_digest(archive.path))
+        return cls(archive, cache_dir)
+
+    ##################
+    # Public Methods #
+    ##################
+
+    def use_archive(self, archive):
+        """Reads attachments through another backend of the same archive"""
+        self._archive = archive
+
+    def local_attachment(self, conversation, raw):
+        """
+        Returns the file name of an attachment stored in the archive, None if
+        the export only links to it
+
+        :param str conversation: directory of the conversation in the archive
+
+        :param dict raw: entry of a message's "files"
+        """
+        candidates = []
+        if raw.get("id") and raw.get("name"):
+            candidates.append("{}-{}".format(raw["id"], raw["name"]))
+        url = raw.get("url_private")
+        if url and "://" not in url:
+            # Exports with downloaded files may point at them relatively
+            candidates.append(posixpath.basename(url))
+        for name in candidates:
+            if name and self._archive.exists(self.relpath(conversation, name)):
+                return name
+        return None
+
+    def dimensions(self, raw):
+        """Width and height of an attachment's thumbnail, (None, None) if unknown"""
+        width, height = raw.get("original_w"), raw.get("original_h")
+        if not width or not height:
+            return None, None
+        scale = min(1.0, float(self._size) / max(width, height))
+        return max(1, int(width * scale)), max(1, int(height * scale))
+
+    def version(self, relpath):
+        """
+        Version of an attachment's thumbnail, part of its URL so it can be
+        cached indefinitely. Plain directories change in place, so their
+        versions include the size and modification time of the original.
+
+        :param str relpath: path of the image within the archive
+        """
+        local_path = self._archive.local_path(relpath) if not self._archive.sha else None
+        if local_path is None:
+            return self._version
+        try:
+            stat = os.stat(local_path)
+        except OSError:
+            return self._version
+        return "{}-{:x}-{:x}".format(self._version, stat.st_size, stat.st_mtime_ns)
+
+    @staticmethod
+    def relpath(conversation, attachment):
+        return "/".join([conversation, "attachments", attachment])
+
+    def get(self, relpath):
+        """
+        Returns the path of the thumbnail of an image in the archive,
+        generating it if needed; None if the file is missing or not an image
+
+        :param str relpath: path of the image within the archive
+        """
+        if not self._archive.exists(relpath):
+            return None
+        base = os.path.join(self._cache_dir, hashlib.sha1(to_bytes(relpath)).hexdigest())
+        for ext in (".jpg", ".png"):
+            if os.path.exists(base + ext) and not self._is_stale(relpath, base + ext):
+                return base + ext
+        try:
+            return self._generate(relpath, base)
+        except (IOError, OSError, ValueError, Image.DecompressionBombError) as e:
+            logging.info("No thumbnail for %s: %s", relpath, e)
+            return None
+
+    ###################
+    # Private Methods #
+    ###################
+
+    def _is_stale(self, relpath, path):
+        local_path = self._archive.local_path(relpath)
+        return local_path is not None and os.path.getmtime(local_path) > os.path.getmtime(path)
+
+    def _generate(self, relpath, base):
+        with self._archive.open(relpath) as f:
+            image = Image.open(f)
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((self._size, self._size))
+            if image.mode in ("RGBA", "LA", "P"):
+                # Keeps transparency
+                image_format, ext = "PNG", ".png"
+            else:
+                image_format, ext = "JPEG", ".jpg"
+                image = image.convert("RGB")
+
+            os.makedirs(self._cache_dir, exist_ok=True)
+            # Requests for the same thumbnail may generate it concurrently
+            tmp_path = "{}.{}.{}.tmp".format(base, os.getpid(), threading.get_ident())
+            image.save(tmp_path, format=image_format)
+        os.replace(tmp_path, base + ext)
+        return base + ext
+
+    @staticmethod
+    def _path_digest(path):
+        return hashlib.sha1(to_bytes(os.path.abspath(path))).hexdigest()
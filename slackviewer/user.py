@@ -5,13 +5,27 @@ class User(object):
     """
     Wrapper object around an entry in users.json. Behaves like a read-only dictionary if
     asked, but adds some useful logic to decouple the front end from the JSON structure.
+
+    Users are looked up for every message and mention, so the display name, e-mail and
+    avatar URL are computed once when the user is created.
     """
 
+    __slots__ = ("_raw", "_display_name", "_email", "_avatar_url")
+
     _NAME_KEYS = ["display_name", "real_name"]
     _DEFAULT_IMAGE_KEY = "image_512"
 
+    # Pixel size of the avatar shown next to messages
+    AVATAR_SIZE = 72
+
     def __init__(self, raw_data):
         self._raw = raw_data
+        self._display_name = self._find_display_name()
+        self._email = self._find_email()
+        try:
+            self._avatar_url = self.image_url(self.AVATAR_SIZE)
+        except KeyError:
+            self._avatar_url = ""
 
     def __getitem__(self, key):
         return self._raw[key]
@@ -22,27 +36,39 @@ class User(object):
         Find the most appropriate display name for a user: look for a "display_name", then
         a "real_name", and finally fall back to the always-present "name".
         """
-        for k in self._NAME_KEYS:
-            if self._raw.get(k):
-                return self._raw[k]
-            if "profile" in self._raw and self._raw["profile"].get(k):
-                return self._raw["profile"][k]
-        return self._raw["name"]
+        if self._display_name is None:
+            # Raises the KeyError callers expect of users without any name
+            return self._raw["name"]
+        return self._display_name
 
     @property
     def email(self):
         """
         Shortcut property for finding the e-mail address or bot URL.
         """
+        if not self._email:
+            logging.debug("No email found for %s", self._raw.get("name"))
+        return self._email
+
+    @property
+    def avatar_url(self):
+        """URL of the user icon shown next to messages, empty if there is none"""
+        return self._avatar_url
+
+    def _find_display_name(self):
+        for k in self._NAME_KEYS:
+            if self._raw.get(k):
+                return self._raw[k]
+            if "profile" in self._raw and self._raw["profile"].get(k):
+                return self._raw["profile"][k]
+        return self._raw.get("name")
+
+    def _find_email(self):
         if "profile" in self._raw:
-            email = self._raw["profile"].get("email")
+            return self._raw["profile"].get("email")
         elif "bot_url" in self._raw:
-            email = self._raw["bot_url"]
-        else:
-            email = None
-        if not email:
-            logging.debug("No email found for %s", self._raw.get("name"))
-        return email
+            return self._raw["bot_url"]
+        return None
 
     def image_url(self, pixel_size=None):
         """
@@ -0,0 +1,135 @@
+import gzip
+from os import path
+
+import slackviewer.search
+from slackviewer.app import app
+from slackviewer.config import Config
+from slackviewer.main import configure_app
+
+
+def _config(**kwargs):
+    config = {
+        "archive": path.join("tests", "testarchive.zip"),
+        "parse_cache": False,
+        "show_dms": True,
+    }
+    config.update(kwargs)
+    return Config(config)
+
+
+def test_sidebar_is_rendered_once_per_archive():
+    configure_app(app, _config(no_external_references=True))
+    client = app.test_client()
+
+    pages = {}
+    for name in app.channels:
+        response = client.get("/channel/{}/".format(name))
+        assert response.status_code == 200
+        pages[name] = response.get_data(as_text=True)
+
+    assert len(app.sidebars) == 1
+    for name, html in pages.items():
+        assert html.count(" active") == 1
+        assert '<li class="channel active">\n                <a href="/channel/{}/">'.format(name) in html
+        assert "<style>" in html
+
+
+def test_pages_are_cached_and_compressed():
+    configure_app(app, _config())
+    client = app.test_client()
+    url = "/channel/{}/".format(next(iter(app.channels)))
+
+    plain = client.get(url)
+    assert plain.status_code == 200
+    assert plain.headers["ETag"] and plain.headers["Last-Modified"]
+    assert client.get(url, headers={"If-None-Match": plain.headers["ETag"]}).status_code == 304
+    assert client.get(url, headers={"If-Modified-Since": plain.headers["Last-Modified"]}).status_code == 304
+
+    compressed = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert compressed.headers["ETag"] != plain.headers["ETag"]
+    assert gzip.decompress(compressed.get_data()) == plain.get_data()
+    assert len(app.compressed_pages) == 1
+
+    again = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert again.get_data() == compressed.get_data()
+    assert len(app.compressed_pages) == 1
+
+
+def test_metrics_are_exposed():
+    configure_app(app, _config())
+    client = app.test_client()
+    name = next(iter(app.channels))
+    assert client.get("/channel/{}/".format(name)).status_code == 200
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    text = response.get_data(as_text=True)
+    assert "# TYPE slackviewer_archive_files_read_total counter" in text
+    assert 'slackviewer_stage_seconds_count{stage="parse"}' in text
+    assert 'slackviewer_requests_total{endpoint="channel_name",status="200"} 1' in text
+    assert 'slackviewer_render_text_cache_total{result="miss"}' in text
+
+
+def test_messages_are_served_in_windows():
+    configure_app(app, _config(virtual_scroll=True))
+    client = app.test_client()
+    name, messages = max(app.channels.items(), key=lambda item: len(item[1]))
+    url = "/api/channel/{}/messages".format(name)
+
+    page = client.get("/channel/{}/".format(name)).get_data(as_text=True)
+    assert 'data-api="{}"'.format(url) in page
+    assert "message-container" not in page
+
+    response = client.get(url + "?limit=2")
+    assert response.mimetype == "application/json"
+    window = response.get_json()
+    assert (window["first"], window["last"], window["total"]) == (0, 1, len(messages))
+    assert [m["index"] for m in window["messages"]] == [0, 1]
+    assert window["messages"][0]["id"] == messages[0].id
+    assert 'id="{}"'.format(messages[0].id) in window["messages"][0]["html"]
+
+    assert client.get(url + "?after=0&limit=2").get_json()["first"] == 1
+    before = client.get(url + "?before=3&limit=2").get_json()
+    assert (before["first"], before["last"]) == (1, 2)
+    assert client.get(url + "?after={}".format(len(messages))).get_json()["messages"] == []
+
+    compressed = client.get(url + "?limit=2", headers={"Accept-Encoding": "gzip"})
+    assert compressed.mimetype == "application/json"
+    assert gzip.decompress(compressed.get_data()) == response.get_data()
+    assert client.get("/api/channel/missing/messages").status_code == 404
+    assert client.get("/api/unknown/{}/messages".format(name)).status_code == 404
+
+
+def test_lazy_conversations_emptied_by_filters_are_hidden():
+    configure_app(app, _config(lazy=True, filter_user="real_name:Nobody"))
+    client = app.test_client()
+    name = next(iter(app.channels))
+    version = app.page_version
+
+    assert client.get("/channel/{}/".format(name)).status_code == 404
+    assert name not in app.channels and name not in list(app.channels)
+    assert app.page_version != version
+
+    # The index skips conversations that turn out empty
+    assert client.get("/").get_data(as_text=True).startswith("No content")
+    assert len(app.channels) == 0
+
+
+def test_lazy_search_says_results_cover_opened_conversations(monkeypatch, tmp_path):
+    # Starts from an empty index
+    monkeypatch.setattr(slackviewer.search, "SLACKVIEWER_TEMP_PATH", str(tmp_path))
+    configure_app(app, _config(lazy=True, search=True))
+    client = app.test_client()
+    warning = "Only conversations opened so far are searched"
+
+    html = client.get("/search?q=commit").get_data(as_text=True)
+    assert warning in html and "in the conversations opened so far" in html
+
+    for conversations in (app.channels, app.groups, app.dms, app.mpims):
+        for name in list(conversations):
+            conversations.get(name)
+    app.search_index.wait()
+    html = client.get("/search?q=commit").get_data(as_text=True)
+    assert warning not in html and "in the conversations opened so far" not in html
@@ -1,11 +1,13 @@
 import hashlib
 import io
+import os
+import shutil
 from os import path
 
 import pytest
 
 import slackviewer
-from slackviewer import archive
+from slackviewer import archive, fingerprint
 from slackviewer.utils.six import to_bytes
 
 
@@ -21,3 +23,41 @@ def test_SHA1_file():
     expected = SHA1_file(filepath, version)
     actual = archive.SHA1_file(filepath, version)
     assert actual == expected
+
+
+def test_zip_archive_matches_extracted_directory():
+    filepath = path.join("tests", "testarchive.zip")
+    extracted = archive.open_archive(filepath)
+    zipped = archive.open_archive(filepath, extract=False)
+
+    assert zipped.sha == extracted.sha
+    for dirname in ["", "enrique", "traveling-sailor", "missing"]:
+        assert zipped.list_json(dirname) == extracted.list_json(dirname)
+    assert zipped.exists("users.json") and not zipped.exists("groups.json")
+    with zipped.open("enrique/2016-01-14.json") as z, extracted.open("enrique/2016-01-14.json") as d:
+        assert z.read() == d.read()
+
+
+def test_fingerprints_are_stamped(tmp_path, monkeypatch):
+    monkeypatch.setattr(fingerprint, "STAMP_DIR", str(tmp_path / "stamps"))
+    filepath = str(tmp_path / "export.zip")
+    shutil.copyfile(path.join("tests", "testarchive.zip"), filepath)
+
+    hashed = []
+    file_sha1 = fingerprint.file_sha1
+    monkeypatch.setattr(fingerprint, "file_sha1", lambda *args: hashed.append(args) or file_sha1(*args))
+
+    full = archive.archive_sha(filepath)
+    assert archive.archive_sha(filepath) == full
+    assert len(hashed) == 1
+    assert full == archive.SHA1_file(filepath, to_bytes(slackviewer.__version__))
+
+    fast = archive.archive_sha(filepath, "fast")
+    assert fast != full and len(fast) == len(full)
+    assert archive.archive_sha(filepath, "fast") == fast
+
+    # A modified archive is hashed again
+    os.utime(filepath, ns=(0, 0))
+    assert archive.archive_sha(filepath) == full
+    assert len(hashed) == 2
+    assert archive.archive_sha(filepath, "fast") != fast
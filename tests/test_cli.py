@@ -0,0 +1,56 @@
+import datetime
+import pkgutil
+from os import path
+
+import pytest
+from click.testing import CliRunner
+from jinja2 import Environment, PackageLoader
+
+import slackviewer.cli
+from slackviewer.cli import cli
+from slackviewer.config import Config
+from slackviewer.reader import Reader
+
+
+ARCHIVE = path.abspath(path.join("tests", "testarchive.zip"))
+GENERATED_ON = datetime.datetime(2024, 1, 2, 3, 4, 5)
+
+
+class _FixedDatetime(datetime.datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return GENERATED_ON
+
+
+def _expected_export(since=None):
+    """Renders the export from eagerly compiled conversations, in one go"""
+    r = Reader(Config({"archive": ARCHIVE, "thread_note": True, "since": since}))
+    channels = sorted(
+        [{"channel_name": k, "messages": v} for k, v in r.compile_channels().items()],
+        key=lambda d: d["channel_name"]
+    )
+    tmpl = Environment(loader=PackageLoader("slackviewer")).get_template("export_single.html")
+    return tmpl.render(
+        css=pkgutil.get_data("slackviewer", "static/viewer.css").decode("utf-8"),
+        generated_on=GENERATED_ON,
+        workspace_name=r.slack_name(),
+        source_file=path.basename(ARCHIVE),
+        channels=channels,
+        dms=[],
+        mpims=[],
+    )
+
+
+@pytest.mark.parametrize("since", [None, "2016-03-28", "2018-01-01"])
+def test_streamed_export_matches_rendered_template(monkeypatch, tmp_path, since):
+    monkeypatch.setattr(slackviewer.cli, "datetime", _FixedDatetime)
+    monkeypatch.chdir(tmp_path)
+    args = ["export", ARCHIVE] + (["--since", since] if since else [])
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    exported = (tmp_path / "testarchive.html").read_text(encoding="utf-8")
+
+    expected = _expected_export(datetime.datetime.strptime(since, "%Y-%m-%d") if since else None)
+    assert exported == expected
+    # --since leaves out the conversations without newer messages
+    assert ("Messages in #" in exported) == (since != "2018-01-01")
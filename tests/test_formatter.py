@@ -0,0 +1,81 @@
+import datetime
+
+from slackviewer.directory import WorkspaceDirectory
+from slackviewer.emojis import EmojiTable
+from slackviewer.formatter import SlackFormatter
+from slackviewer.message import Message
+
+
+def test_render_text_is_memoized():
+    formatter = SlackFormatter(WorkspaceDirectory([]))
+    first = formatter.render_text("*hello* :simple_smile:")
+    second = formatter.render_text("*hello* :simple_smile:")
+
+    assert first == second
+    info = formatter.render_cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+
+    formatter.render_text("*hello* :simple_smile:", process_markdown=False)
+    assert formatter.render_cache_info().misses == 2
+
+
+def test_message_body_rendered_once():
+    formatter = SlackFormatter(WorkspaceDirectory([]))
+    message = Message(formatter, {"text": "hi <!here>", "ts": "1456427378.000002"}, "C1", "test")
+
+    assert message.msg == message.msg
+    info = formatter.render_cache_info()
+    assert (info.hits, info.misses) == (0, 1)
+
+
+def test_message_fields_computed_once():
+    directory = WorkspaceDirectory([{"id": "U1", "name": "someone"}])
+    user = directory.user("U1")
+    formatter = SlackFormatter(directory)
+    lookups = []
+    find_user = formatter.find_user
+    formatter.find_user = lambda message: lookups.append(message) or find_user(message)
+
+    raw = {"text": "hi", "user": "U1", "ts": "1456427378.000002", "client_msg_id": "x", "team": "T1"}
+    message = Message(formatter, raw, "C1", "test")
+
+    assert not hasattr(message, "__dict__")
+    assert set(message._message) == {"text", "user", "ts"}
+    assert message.ts == 1456427378.000002
+    assert message.id == message.time == str(datetime.datetime.fromtimestamp(1456427378))
+    assert (message.username, message.user, message.img) == ("someone", user, user.image_url(72))
+    assert len(lookups) == 1
+    assert message.permalink is message.permalink
+
+
+def test_directory_is_shared_and_unchanged_by_rendering():
+    directory = WorkspaceDirectory(
+        [{"id": "U1", "name": "someone", "profile": {"display_name": "Someone", "image_72": "a.png"}}],
+        [{"id": "C1", "name": "general"}, {"id": "D1", "members": ["U1", "U2"]}],
+        members=["U1", "U2"],
+    )
+    formatter = SlackFormatter(directory)
+
+    assert formatter.render_text("<#C1> <@U1> <@U2>", False) == "<b>#general</b> @Someone @deleted-U2"
+    assert directory.user("U1").avatar_url == "a.png"
+
+    bot = {"subtype": "bot_message", "bot_id": "B1", "username": "deploys", "text": "done", "ts": "1.0"}
+    message = Message(formatter, bot, "D1", "test")
+    assert message.username == "deploys"
+    assert directory.user("B1") is None
+
+    directory.add_bot(bot)
+    assert directory.user("B1").display_name == "deploys"
+
+
+def test_emoji_table():
+    table = EmojiTable({"party-parrot": "https://example.com/parrot.gif", "shipit": "alias:tada"})
+    formatter = SlackFormatter(WorkspaceDirectory([]), table)
+
+    assert table.emojize("no shortcodes here") == "no shortcodes here"
+    assert table.emojize(":+1: :-1: :simple_smile: :woman-shrugging: :t-rex:") == "👍 👎 🙂 🤷‍♀️ 🦖"
+    assert table.emojize("at 10:30-11:45 :unknown-name:") == "at 10:30-11:45 :unknown-name:"
+    assert table.lookup("shipit") == "🎉"
+    assert formatter.render_text(":party-parrot:", False) == (
+        '<img class="emoji" src="https://example.com/parrot.gif" alt=":party-parrot:" title=":party-parrot:">'
+    )
@@ -0,0 +1,27 @@
+import pytest
+
+from slackviewer import json_decoder
+
+
+def test_decoders_agree_on_files(tmp_path, monkeypatch):
+    path = tmp_path / "2020-01-01.json"
+    path.write_bytes('[{"text": "h\\u00e9llo \\ud83d\\ude00", "ts": "1.000001"}, {"n": 1.5}]'.encode("utf-8"))
+    # Exercise the memory mapped path as well
+    monkeypatch.setattr(json_decoder, "MMAP_THRESHOLD", 0)
+
+    results = []
+    for name in json_decoder.DECODERS:
+        with open(path, "rb") as f:
+            results.append(json_decoder.load(f, name))
+    assert results[0] == [{"text": "héllo 😀", "ts": "1.000001"}, {"n": 1.5}]
+    assert all(r == results[0] for r in results)
+
+
+def test_falls_back_to_stdlib_for_lone_surrogates():
+    assert json_decoder.loads(b'{"text": "broken \\ud83d"}') == {"text": "broken \ud83d"}
+
+
+def test_unknown_decoder():
+    assert json_decoder.decoder_name("auto") in json_decoder.DECODERS
+    with pytest.raises(ValueError):
+        json_decoder.decoder_name("simdjson")
@@ -0,0 +1,90 @@
+import sqlite3
+from os import path
+
+import pytest
+from werkzeug.test import Client
+
+from slackviewer.main import configure_app
+from slackviewer.mounts import ArchiveMounts, archive_slug, mount_table
+from tests.test_app import _config
+
+
+ARCHIVE = path.join("tests", "testarchive.zip")
+
+
+def _mounts(memory_budget=0):
+    def configure(viewer, archive):
+        configure_app(viewer, _config(archive=archive, search=False), reset_metrics=False)
+
+    return ArchiveMounts({"one": ARCHIVE, "two": ARCHIVE}, configure, memory_budget)
+
+
+def test_mount_table():
+    assert archive_slug("/exports/Acme 2023.zip") == "acme-2023"
+    assert mount_table(["old=" + ARCHIVE], ARCHIVE) == {"old": ARCHIVE, "testarchive": ARCHIVE}
+    with pytest.raises(ValueError):
+        mount_table([ARCHIVE, ARCHIVE])
+    with pytest.raises(ValueError):
+        mount_table(["static=" + ARCHIVE])
+    with pytest.raises(ValueError):
+        mount_table(["new=missing.zip"])
+
+
+def test_archives_are_mounted_and_loaded_lazily():
+    mounts = _mounts()
+    client = Client(mounts)
+
+    index = client.get("/").get_data(as_text=True)
+    assert 'href="/one/"' in index and 'href="/two/"' in index
+    assert "loaded" not in index
+
+    assert client.get("/one").headers["Location"] == "/one/"
+    page = client.get("/one/")
+    assert page.status_code == 200
+    assert 'href="/one/channel/' in page.get_data(as_text=True)
+    assert client.get("/one/static/viewer.css").status_code == 200
+    assert "loaded" in client.get("/").get_data(as_text=True)
+    assert client.get("/three/").status_code == 404
+
+
+def test_least_recently_used_archives_are_unloaded():
+    mounts = _mounts(memory_budget=1)
+    client = Client(mounts)
+    one = mounts.viewer("one")
+    assert mounts.viewer("one") is one
+
+    assert client.get("/two/").status_code == 200
+    assert mounts.viewer("two") is mounts.viewer("two")
+    assert mounts.viewer("one") is not one
+
+
+def test_unloading_releases_the_archive():
+    def configure(viewer, archive):
+        configure_app(viewer, _config(archive=archive, extract=False, search=True), reset_metrics=False)
+
+    mounts = ArchiveMounts({"one": ARCHIVE}, configure)
+    mounts.load_all()
+    viewer, = mounts.loaded()
+    viewer.search_index.wait()
+    mounts.unload_all()
+
+    assert mounts.loaded() == []
+    assert viewer.archive._zip.fp is None
+    assert not viewer.search_index._thread.is_alive()
+    with pytest.raises(sqlite3.ProgrammingError):
+        viewer.search_index.search("commit")
+
+
+def test_archives_are_closed_after_their_last_request():
+    def configure(viewer, archive):
+        configure_app(viewer, _config(archive=archive, extract=False), reset_metrics=False)
+
+    mounts = ArchiveMounts({"one": ARCHIVE}, configure)
+    response = Client(mounts).get("/one/", buffered=False)
+    viewer, = mounts.loaded()
+    mounts.unload_all()
+
+    # Still serving the response
+    assert viewer.archive._zip.fp is not None
+    response.close()
+    assert viewer.archive._zip.fp is None
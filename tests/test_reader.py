@@ -0,0 +1,286 @@
+import concurrent.futures
+import datetime
+import json
+import os
+import pickle
+import threading
+import zipfile
+from os import path
+
+import pytest
+
+import slackviewer.archive
+import slackviewer.cache
+from slackviewer.cache import ParsedArchiveCache
+from slackviewer.config import Config
+from slackviewer.conversations import ConversationMap, page_bounds
+from slackviewer.message import Message
+from slackviewer.reader import Reader
+
+
+def _config(**kwargs):
+    config = {
+        "archive": path.join("tests", "testarchive.zip"),
+        "thread_note": True,
+    }
+    config.update(kwargs)
+    return Config(config)
+
+
+def test_lazy_channels_match_eager():
+    eager = Reader(_config()).compile_channels()
+    lazy = Reader(_config()).compile_channels(lazy=True)
+
+    assert isinstance(lazy, ConversationMap)
+    assert sorted(lazy) == sorted(eager)
+    for name in eager:
+        assert [m._message for m in lazy[name]] == [m._message for m in eager[name]]
+
+
+def test_conversation_map_evicts_least_recently_used():
+    loads = []
+
+    def loader(name):
+        loads.append(name)
+        return [name]
+
+    conversations = ConversationMap(["a", "b", "c"], loader, max_loaded=2)
+    assert "a" in conversations and not loads
+
+    conversations["a"]
+    conversations["b"]
+    conversations["a"]
+    conversations["c"]
+    assert conversations.is_loaded("a")
+    assert not conversations.is_loaded("b")
+
+    conversations["b"]
+    assert loads == ["a", "b", "c", "b"]
+
+
+def test_conversation_map_loads_block_only_their_conversation():
+    started = threading.Event()
+    release = threading.Event()
+    loads = []
+
+    def loader(name):
+        loads.append(name)
+        if name == "big":
+            started.set()
+            release.wait(10)
+        return [name]
+
+    conversations = ConversationMap(["big", "small"], loader)
+    conversations["small"]
+    with concurrent.futures.ThreadPoolExecutor(2) as pool:
+        big = [pool.submit(conversations.__getitem__, "big") for _ in range(2)]
+        started.wait(10)
+        # Served while the big conversation is still loading
+        assert conversations["small"] == ["small"]
+        release.set()
+        assert [f.result() for f in big] == [["big"], ["big"]]
+    assert loads == ["small", "big"]
+
+
+def test_parse_cache_skips_day_files_when_warm(monkeypatch):
+    cold = Reader(_config(parse_cache=True)).compile_channels()
+
+    def fail(self, day_files):
+        assert not day_files, "day files parsed despite a warm cache"
+        return {}
+
+    monkeypatch.setattr(Reader, "_read_day_files", fail)
+    warm = Reader(_config(parse_cache=True)).compile_channels()
+
+    assert list(warm) == list(cold)
+    for name in cold:
+        assert [m._message for m in warm[name]] == [m._message for m in cold[name]]
+
+
+def test_workers_parse_in_date_order(monkeypatch):
+    monkeypatch.setattr(Reader, "_DAY_FILE_CHUNK", 2)
+    monkeypatch.setattr(Reader, "_PARALLEL_PARSE_THRESHOLD", 0)
+    serial = Reader(_config()).compile_channels()
+    reader = Reader(_config(workers=3, extract=False))
+    parallel = reader.compile_channels()
+    pool = reader._pool
+
+    # The worker processes are reused by later reads, until the reader closes
+    assert pool is not None
+    reader.compile_groups()
+    assert reader._pool is pool
+    reader.close()
+    assert reader._pool is None
+
+    assert list(parallel) == list(serial)
+    for name in serial:
+        assert [m._message for m in parallel[name]] == [m._message for m in serial[name]]
+
+
+def test_small_archives_are_parsed_in_process():
+    reader = Reader(_config(workers=3))
+    reader.compile_channels()
+    assert reader._pool is None
+
+
+def test_page_bounds_keep_threads_together():
+    class Msg(object):
+        def __init__(self, is_thread_msg):
+            self.is_thread_msg = is_thread_msg
+
+    # 0 1 [2 3 4] 5 6 ; replies in brackets belong to message 1
+    messages = [Msg(flag) for flag in [False, False, True, True, True, False, False]]
+
+    assert page_bounds(messages, 0) == [(0, 7)]
+    assert page_bounds(messages, 10) == [(0, 7)]
+    assert page_bounds(messages, 3) == [(0, 5), (5, 7)]
+    assert page_bounds([], 3) == [(0, 0)]
+
+
+@pytest.mark.parametrize("extract", [False, True])
+def test_parse_cache_only_recompiles_changed_conversations(monkeypatch, tmp_path, extract):
+    # Extracted archives get fresh modification times on every extraction
+    monkeypatch.setattr(slackviewer.archive, "SLACKVIEWER_TEMP_PATH", str(tmp_path / "temp"))
+    monkeypatch.setattr(slackviewer.cache, "SLACKVIEWER_TEMP_PATH", str(tmp_path / "temp"))
+    original = path.join("tests", "testarchive.zip")
+    appended = str(tmp_path / "testarchive.zip")
+    with zipfile.ZipFile(original) as src, zipfile.ZipFile(appended, "w") as dst:
+        for info in src.infolist():
+            dst.writestr(info, src.read(info))
+        dst.writestr(
+            "traveling-sailor/2016-04-01.json",
+            '[{"type": "message", "user": "U0BMQB6JE", "text": "new month", "ts": "1459500000.000001"}]'
+        )
+
+    Reader(_config(extract=extract, parse_cache=True)).compile_channels()
+
+    parsed = []
+    read_day_files = Reader._read_day_files
+
+    def record(self, day_files):
+        parsed.extend(day_files)
+        return read_day_files(self, day_files)
+
+    monkeypatch.setattr(Reader, "_read_day_files", record)
+    channels = Reader(_config(archive=appended, extract=extract, parse_cache=True)).compile_channels()
+
+    assert parsed == ["traveling-sailor"]
+    assert channels["traveling-sailor"][-1]._message["text"] == "new month"
+
+
+def test_threads_from_thread_ts_and_legacy_replies():
+    reader = Reader(_config(thread_note=False))
+
+    def messages(*raw):
+        return [Message(None, dict(m), "C0", "workspace") for m in raw]
+
+    modern = messages(
+        {"user": "U1", "ts": "1.0", "thread_ts": "1.0", "reply_count": 2, "text": "parent"},
+        {"user": "U2", "ts": "2.0", "text": "other"},
+        {"user": "U2", "ts": "3.0", "thread_ts": "1.0", "text": "reply 1"},
+        {"user": "U3", "ts": "4.0", "thread_ts": "1.0", "text": "reply 2"},
+        {"user": "U3", "ts": "5.0", "thread_ts": "0.5", "text": "orphan reply"},
+    )
+    legacy = messages(
+        {"user": "U1", "ts": "1.0", "replies": [{"user": "U2", "ts": "3.0"}], "text": "parent"},
+        {"user": "U2", "ts": "2.0", "text": "other"},
+        {"user": "U2", "ts": "3.0", "text": "reply 1"},
+    )
+
+    threaded = reader._thread_messages(modern)
+    assert [m._message["text"] for m in threaded] == ["parent", "reply 1", "reply 2", "other", "orphan reply"]
+    assert [m.is_thread_msg for m in threaded] == [False, True, True, False, False]
+
+    threaded = reader._thread_messages(legacy)
+    assert [m._message["text"] for m in threaded] == ["parent", "reply 1", "other"]
+    assert [m.is_thread_msg for m in threaded] == [False, True, False]
+
+
+def test_since_until_only_read_day_files_around_the_timeframe(tmp_path, monkeypatch):
+    def ts(day, hour=12):
+        return "{:.6f}".format(datetime.datetime(2020, 1, day, hour).timestamp())
+
+    days = {
+        1: [{"user": "U1", "ts": ts(1), "thread_ts": ts(1), "reply_count": 2, "text": "old parent"}],
+        2: [{"user": "U1", "ts": ts(2), "thread_ts": ts(1), "text": "old reply"}],
+        5: [{"user": "U1", "ts": ts(5), "text": "unrelated"}],
+        10: [{"user": "U1", "ts": ts(10), "thread_ts": ts(1), "text": "new reply"},
+             {"user": "U1", "ts": ts(10, 13), "text": "in range"}],
+        20: [{"user": "U1", "ts": ts(20), "text": "too new"}],
+    }
+    (tmp_path / "general").mkdir()
+    (tmp_path / "channels.json").write_text(json.dumps([{"id": "C1", "name": "general"}]))
+    (tmp_path / "users.json").write_text(json.dumps([{"id": "U1", "name": "user"}]))
+    for day, messages in days.items():
+        (tmp_path / "general" / "2020-01-{:02d}.json".format(day)).write_text(json.dumps(messages))
+
+    read = []
+    original = Reader._read_day_files
+
+    def read_day_files(self, day_files):
+        read.extend(path.basename(f) for files in day_files.values() for f in files)
+        return original(self, day_files)
+
+    monkeypatch.setattr(Reader, "_read_day_files", read_day_files)
+    config = _config(archive=str(tmp_path), thread_note=False, parse_cache=False,
+                     since=datetime.datetime(2020, 1, 9), until=datetime.datetime(2020, 1, 10))
+    messages = Reader(config).compile_channels()["general"]
+
+    assert [m._message["text"] for m in messages] == ["old parent", "old reply", "new reply", "in range"]
+    assert [m.is_recent_msg for m in messages] == [False, False, True, True]
+    assert sorted(read) == ["2020-01-01.json", "2020-01-02.json", "2020-01-05.json", "2020-01-10.json"]
+
+
+def test_until_drops_later_replies_regardless_of_their_day(tmp_path):
+    def ts(day, hour=12):
+        return "{:.6f}".format(datetime.datetime(2020, 1, day, hour).timestamp())
+
+    days = {
+        9: [{"user": "U1", "ts": ts(9), "thread_ts": ts(9), "reply_count": 3, "text": "parent"}],
+        10: [{"user": "U1", "ts": ts(10), "thread_ts": ts(9), "text": "reply in range"}],
+        11: [{"user": "U1", "ts": ts(11), "thread_ts": ts(9), "text": "reply a day later"}],
+        13: [{"user": "U1", "ts": ts(13), "thread_ts": ts(9), "text": "reply three days later"}],
+    }
+    (tmp_path / "general").mkdir()
+    (tmp_path / "channels.json").write_text(json.dumps([{"id": "C1", "name": "general"}]))
+    (tmp_path / "users.json").write_text(json.dumps([{"id": "U1", "name": "user"}]))
+    for day, messages in days.items():
+        (tmp_path / "general" / "2020-01-{:02d}.json".format(day)).write_text(json.dumps(messages))
+
+    config = _config(archive=str(tmp_path), thread_note=False, parse_cache=False,
+                     until=datetime.datetime(2020, 1, 10))
+    eager = Reader(config).compile_channels()["general"]
+    lazy = Reader(config).compile_channels(lazy=True)["general"]
+
+    assert [m._message["text"] for m in eager] == ["parent", "reply in range"]
+    assert [m._message for m in lazy] == [m._message for m in eager]
+
+def test_parse_cache_of_filtered_users_follows_the_users_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(slackviewer.cache, "SLACKVIEWER_TEMP_PATH", str(tmp_path / "temp"))
+    archive = tmp_path / "archive"
+    (archive / "general").mkdir(parents=True)
+    (archive / "channels.json").write_text(json.dumps([{"id": "C1", "name": "general"}]))
+    (archive / "general" / "2020-01-01.json").write_text(
+        json.dumps([{"user": "U1", "ts": "1577880000.000001", "text": "hello"}])
+    )
+
+    def compile_channels(real_name):
+        (archive / "users.json").write_text(json.dumps([{"id": "U1", "name": "user", "real_name": real_name}]))
+        config = _config(archive=str(archive), parse_cache=True, filter_user="real_name:Alice")
+        return Reader(config).compile_channels()
+
+    assert [m._message["text"] for m in compile_channels("Alice")["general"]] == ["hello"]
+    assert compile_channels("Someone else")["general"] == []
+
+
+def test_parse_cache_never_unpickles(tmp_path):
+    cache = ParsedArchiveCache(str(tmp_path))
+    records = [({"ts": "1.0", "text": "café"}, False, True)]
+    cache.store("general", "abc", records)
+    assert cache.load("general", "abc") == [[{"ts": "1.0", "text": "café"}, False, True]]
+    assert cache.load("general", "other") is None
+
+    # A pickle planted in place of an entry is ignored, not unpickled
+    planted = pickle.dumps(("abc", records))
+    (tmp_path / os.path.basename(cache._path("general"))).write_bytes(planted)
+    assert cache.load("general", "abc") is None
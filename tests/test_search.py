@@ -0,0 +1,94 @@
+import multiprocessing
+import os
+import threading
+from os import path
+
+import pytest
+
+from slackviewer.config import Config
+from slackviewer.reader import Reader
+from slackviewer.search import SearchIndex
+
+
+def _index():
+    reader = Reader(Config({"archive": path.join("tests", "testarchive.zip"), "thread_note": True}))
+    index = SearchIndex()
+    for name, messages in reader.compile_channels().items():
+        index.index_conversation("channel", name, messages)
+    return index
+
+
+def test_search_ranks_and_paginates():
+    index = _index()
+    assert index.is_indexed("channel", "enrique")
+
+    hits, total = index.search("commit", per_page=10)
+    assert total > 10 and len(hits) == 10
+    assert {h["conversation"] for h in hits} <= {"enrique", "traveling-sailor"}
+    assert all("<mark>" in h["snippet"] for h in hits)
+
+    last_page, _ = index.search("commit", page=(total + 9) // 10, per_page=10)
+    assert 0 < len(last_page) <= 10
+
+
+def test_search_escapes_query_syntax():
+    index = _index()
+    assert index.search('"unbalanced (quote') == ([], 0)
+    assert index.search("   ") == ([], 0)
+
+
+def test_lazy_conversations_are_indexed_when_loaded():
+    reader = Reader(Config({"archive": path.join("tests", "testarchive.zip"), "thread_note": True}))
+    channels = reader.compile_channels(lazy=True)
+    index = SearchIndex()
+    index.index_in_background([("channel", channels)])
+    index.wait()
+
+    # Indexing doesn't load anything itself
+    assert not any(channels.is_loaded(name) for name in channels)
+    assert index.unloaded == len(channels)
+    assert index.search("commit") == ([], 0)
+
+    channels["enrique"]
+    index.wait()
+    assert index.is_indexed("channel", "enrique")
+    assert index.unloaded == len(channels) - 1
+    assert index.search("commit")[1] > 0
+
+
+def _search_from_worker(index, indexed, results):
+    index.reopen()
+    results.put(index.pending)
+    indexed.wait(10)
+    results.put((index.pending, index.search("commit")[1] > 0))
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_forked_workers_search_the_index_while_it_is_built(monkeypatch, tmp_path):
+    reader = Reader(Config({"archive": path.join("tests", "testarchive.zip"), "thread_note": True}))
+    index = SearchIndex(str(tmp_path / "index.sqlite"))
+    context = multiprocessing.get_context("fork")
+    indexed = context.Event()
+    results = context.Queue()
+
+    # Holds the indexing thread back until the worker is forked
+    forked = threading.Event()
+    index_conversation = index.index_conversation
+
+    def index_after_fork(*args):
+        forked.wait(10)
+        index_conversation(*args)
+
+    monkeypatch.setattr(index, "index_conversation", index_after_fork)
+    index.index_in_background([("channel", reader.compile_channels())])
+    worker = context.Process(target=_search_from_worker, args=(index, indexed, results))
+    with index.paused():
+        worker.start()
+    forked.set()
+    index.wait()
+    indexed.set()
+
+    assert results.get(timeout=10) == 2
+    assert results.get(timeout=10) == (0, True)
+    worker.join(10)
+    index.close()
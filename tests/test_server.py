@@ -0,0 +1,152 @@
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from slackviewer.app import app, reopen_app
+from slackviewer.main import configure_app, reload_app
+from slackviewer.server import PreforkServer, _PooledWSGIServer
+from tests.test_app import _config
+
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def _serve(port, reloads, **options):
+    config = _config(search=False, **options)
+    configure_app(app, config)
+
+    def reload():
+        reloads.value += 1
+        reload_app(app, config)
+
+    PreforkServer(app, "localhost", port, processes=2, threads=2, reload=reload).serve_forever()
+
+
+def _get(url, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                return response.status, response.read()
+        except (urllib.error.URLError, ConnectionError):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def test_workers_serve_and_restart():
+    context = multiprocessing.get_context("fork")
+    port = _free_port()
+    reloads = context.Value("i", 0)
+    parent = context.Process(target=_serve, args=(port, reloads))
+    parent.start()
+    try:
+        url = "http://localhost:{}/".format(port)
+        status, body = _get(url)
+        assert status == 200
+
+        os.kill(parent.pid, signal.SIGHUP)
+        deadline = time.monotonic() + 10
+        while reloads.value == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert reloads.value == 1
+        assert _get(url) == (200, body)
+    finally:
+        os.kill(parent.pid, signal.SIGTERM)
+        parent.join(timeout=30)
+    assert parent.exitcode == 0
+
+
+def test_workers_read_zip_archives_through_their_own_handle():
+    configure_app(app, _config(search=False, extract=False))
+    archive = app.archive
+    reopen_app(app)
+
+    assert app.archive is not archive
+    assert app.reader.archive() is app.archive
+    assert app.archive._zip is not archive._zip
+
+
+def test_workers_serve_zip_archives_concurrently():
+    context = multiprocessing.get_context("fork")
+    port = _free_port()
+    options = {"extract": False, "lazy": True, "max_loaded": 1}
+    parent = context.Process(target=_serve, args=(port, context.Value("i", 0)), kwargs=options)
+    parent.start()
+    try:
+        base = "http://localhost:{}/api/channel/{}/messages?limit=5&after={}"
+        urls = [base.format(port, name, i) for i in range(40) for name in ("enrique", "traveling-sailor")]
+        # Each request compiles its conversation again from the zip file, as
+        # only one conversation stays loaded
+        with concurrent.futures.ThreadPoolExecutor(8) as pool:
+            responses = list(pool.map(_get, urls))
+        for url, (status, body) in zip(urls, responses):
+            assert status == 200
+            assert json.loads(body)["messages"], url
+    finally:
+        os.kill(parent.pid, signal.SIGTERM)
+        parent.join(timeout=30)
+    assert parent.exitcode == 0
+
+
+def test_reloading_releases_the_previous_archive():
+    config = _config(extract=False, search=True)
+    configure_app(app, config)
+    archive, search_index = app.archive, app.search_index
+    reload_app(app, config)
+
+    assert archive._zip.fp is None
+    assert not search_index._thread.is_alive()
+    assert app.archive._zip.fp is not None
+    app.search_index.close()
+
+
+def test_busy_workers_leave_connections_to_idle_ones():
+    sock = socket.socket()
+    sock.bind(("localhost", 0))
+    sock.listen()
+    sock.setblocking(False)
+    port = sock.getsockname()[1]
+    release = threading.Event()
+
+    def busy(environ, start_response):
+        release.wait(10)
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return [b"busy"]
+
+    def idle(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return [b"idle"]
+
+    first = _PooledWSGIServer("localhost", port, busy, 1, sock.fileno())
+    threading.Thread(target=first.serve_forever, daemon=True).start()
+    with concurrent.futures.ThreadPoolExecutor(1) as client:
+        blocked = client.submit(_get, "http://localhost:{}/".format(port))
+        # The first worker's only thread is now busy
+        time.sleep(0.5)
+        second = _PooledWSGIServer("localhost", port, idle, 1, sock.fileno())
+        threading.Thread(target=second.serve_forever, daemon=True).start()
+        try:
+            for _ in range(5):
+                assert _get("http://localhost:{}/".format(port)) == (200, b"idle")
+        finally:
+            release.set()
+            assert blocked.result() == (200, b"busy")
+            first.shutdown()
+            second.shutdown()
+    sock.close()
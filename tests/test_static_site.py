@@ -0,0 +1,66 @@
+import os
+from os import path
+
+from slackviewer.app import app
+from slackviewer.config import Config
+from slackviewer.main import configure_app
+from slackviewer.reader import Reader
+from slackviewer.static_site import StaticSiteBuilder
+
+
+def _config(**kwargs):
+    config = {
+        "archive": path.join("tests", "testarchive.zip"),
+        "html_only": True,
+        "page_size": 5,
+        "parse_cache": False,
+    }
+    config.update(kwargs)
+    return Config(config)
+
+
+def _pages(output_dir):
+    pages = {}
+    for root, _, files in os.walk(output_dir):
+        for name in files:
+            if name == "index.html":
+                with open(path.join(root, name), 'rb') as f:
+                    pages[path.relpath(path.join(root, name), output_dir)] = f.read()
+    return pages
+
+
+def test_static_site_writes_every_page(tmp_path):
+    configure_app(app, _config())
+
+    serial_dir = str(tmp_path / "serial")
+    StaticSiteBuilder(app, serial_dir).build()
+    pages = _pages(serial_dir)
+
+    assert "index.html" in pages
+    for name, messages in app.channels.items():
+        assert path.join("channel", name, "index.html") in pages
+        if len(messages) > 5:
+            assert path.join("channel", name, "page", "2", "index.html") in pages
+            page = pages[path.join("channel", name, "page", "2", "index.html")]
+            assert b'href="../../index.html"' in page
+    # Sidebar links are relative to each page
+    sailor = pages[path.join("channel", "traveling-sailor", "index.html")].decode("utf-8")
+    assert 'href="../enrique/index.html"' in sailor
+    assert path.isfile(path.join(serial_dir, "static", "viewer.css"))
+
+    parallel_dir = str(tmp_path / "parallel")
+    StaticSiteBuilder(app, parallel_dir, workers=3).build()
+    assert _pages(parallel_dir) == pages
+
+
+def test_lazy_zip_archives_build_in_parallel(monkeypatch, tmp_path):
+    # Day files are parsed in the page workers, however small the archive
+    monkeypatch.setattr(Reader, "_PARALLEL_PARSE_THRESHOLD", 0)
+    configure_app(app, _config())
+    serial_dir = str(tmp_path / "serial")
+    StaticSiteBuilder(app, serial_dir).build()
+
+    configure_app(app, _config(lazy=True, extract=False, workers=3))
+    parallel_dir = str(tmp_path / "parallel")
+    StaticSiteBuilder(app, parallel_dir, workers=3).build()
+    assert _pages(parallel_dir) == _pages(serial_dir)
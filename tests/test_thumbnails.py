@@ -0,0 +1,65 @@
+import pytest
+
+from slackviewer.archive import DirectoryArchive
+from slackviewer.directory import WorkspaceDirectory
+from slackviewer.formatter import SlackFormatter
+from slackviewer.message import Message
+from slackviewer.thumbnails import Thumbnailer
+
+
+def _files(tmp_path, thumbnails):
+    directory = WorkspaceDirectory([], [{"id": "C1", "name": "general"}])
+    formatter = SlackFormatter(directory, thumbnails=thumbnails)
+    raw = {"ts": "1456427378.000002", "files": [
+        {"id": "F1", "name": "cat.png", "mimetype": "image/png", "original_w": 720, "original_h": 360,
+         "thumb_360": "https://example.com/cat_360.png"},
+        {"id": "F2", "name": "dog.png", "mimetype": "image/png", "thumb_360": "https://example.com/dog_360.png"},
+    ]}
+    return Message(formatter, raw, "C1", "test").files
+
+
+def _archive(tmp_path):
+    attachments = tmp_path / "archive" / "general" / "attachments"
+    attachments.mkdir(parents=True)
+    return DirectoryArchive(str(tmp_path / "archive")), attachments
+
+
+def test_local_thumbnails_are_preferred(tmp_path):
+    archive, attachments = _archive(tmp_path)
+    (attachments / "F1-cat.png").write_bytes(b"not really a png")
+    thumbnails = Thumbnailer(archive, str(tmp_path / "cache"))
+
+    local, remote = _files(tmp_path, thumbnails)
+    assert local.thumbnail() == {
+        "conversation": "general", "attachment": "F1-cat.png",
+        "version": thumbnails.version("general/attachments/F1-cat.png"), "width": 360, "height": 180,
+    }
+    assert remote.thumbnail()["src"] == "https://example.com/dog_360.png"
+
+    local, _ = _files(tmp_path, None)
+    assert local.thumbnail()["src"] == "https://example.com/cat_360.png"
+
+
+def test_thumbnails_are_generated_once(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    archive, attachments = _archive(tmp_path)
+    Image.new("RGB", (1200, 600), "red").save(str(attachments / "F1-cat.jpg"))
+    thumbnails = Thumbnailer(archive, str(tmp_path / "cache"))
+
+    path = thumbnails.get(thumbnails.relpath("general", "F1-cat.jpg"))
+    assert Image.open(path).size == (360, 180)
+    assert thumbnails.get(thumbnails.relpath("general", "F1-cat.jpg")) == path
+    assert thumbnails.get(thumbnails.relpath("general", "missing.jpg")) is None
+
+
+def test_directory_thumbnail_versions_follow_the_original(tmp_path):
+    archive, attachments = _archive(tmp_path)
+    original = attachments / "F1-cat.png"
+    original.write_bytes(b"not really a png")
+    thumbnails = Thumbnailer(archive, str(tmp_path / "cache"))
+    relpath = thumbnails.relpath("general", "F1-cat.png")
+
+    version = thumbnails.version(relpath)
+    assert thumbnails.version(relpath) == version
+    original.write_bytes(b"still not really a png")
+    assert thumbnails.version(relpath) != version